@@ -0,0 +1,314 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import logging
+from collections import deque
+
+from rpymostat_common.entry_points import iter_entry_points
+from rpymostat_common.loader import (
+    _finish_load, _load_sequential, _prefilter, _resolve_negative_cache,
+    _skip_failed
+)
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    StopAsyncIteration
+except NameError:  # Python < 3.5, which does not support ``async for``
+    StopAsyncIteration = StopIteration
+
+logger = logging.getLogger(__name__)
+
+
+def _load_one(entry_point):
+    """
+    Load a single entry point (in an executor thread), returning the
+    ``(entry point, obj, record)`` tuple from
+    :py:func:`rpymostat_common.loader._load_sequential`.
+    """
+    return next(_load_sequential([entry_point]))
+
+
+class AsyncPluginLoader(object):
+    """
+    Asynchronous iterator which loads the entry points in a group in an
+    executor, off the event loop, and yields each loaded object (usually a
+    class) as soon as its import finishes, i.e.::
+
+        async for klass in AsyncPluginLoader('rpymostat.sensors', BaseSensor):
+            ...
+
+    Loading starts on the first iteration, or on :py:meth:`~.result`. The
+    ``superclass`` check, negative cache, ``names``, ``provides.`` prefilter
+    and ``report`` callback behave exactly as for
+    :py:func:`rpymostat_common.loader.load_classes`.
+
+    Cancelling the task that is awaiting the next item (or calling
+    :py:meth:`~.cancel`) cancels every import that has not started yet;
+    imports already running in executor threads cannot be interrupted, and
+    their results are discarded.
+
+    This is implemented with futures and callbacks rather than ``async def``
+    so that the package remains importable on Python versions without
+    ``async`` syntax; it requires :py:mod:`asyncio` (Python 3.5+ for
+    ``async for``).
+    """
+
+    def __init__(self, entrypoint_name, superclass=None, executor=None,
+                 report=None, negative_cache=True, names=None, loop=None):
+        """
+        :param entrypoint_name: name of the entrypoint to load
+        :type entrypoint_name: str
+        :param superclass: if specified, only yield subclasses of this
+          class / classinfo
+        :type superclass: ``class or classinfo``
+        :param executor: :py:class:`concurrent.futures.Executor` to import
+          in; defaults to the event loop's default executor
+        :param report: callable to pass a
+          :py:class:`~rpymostat_common.loader.PluginLoadRecord` to for each
+          entry point
+        :type report: callable
+        :param negative_cache: negative cache to use; True for the module
+          default, or False/None to disable
+        :type negative_cache: ``NegativeCache`` or bool
+        :param names: if specified, only load entry points with these names
+        :type names: ``list`` or ``set``
+        :param loop: event loop; defaults to the current event loop
+        """
+        if asyncio is None:
+            raise NotImplementedError('AsyncPluginLoader requires asyncio')
+        self.entrypoint_name = entrypoint_name
+        self.superclass = superclass
+        self.executor = executor
+        self.report = report
+        self.negative_cache = _resolve_negative_cache(negative_cache)
+        self.names = names
+        self._loop = loop
+        self._started = False
+        self._cancelled = False
+        # outstanding executor futures
+        self._futures = []
+        # number of entry points still loading, or None before preparing
+        self._remaining = None
+        # accepted objects not yet yielded
+        self._ready = deque()
+        # entry point index to accepted object, for result()
+        self._results = {}
+        # futures returned by __anext__ which are not yet resolved
+        self._waiters = deque()
+        self._error = None
+        self._done = None
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        waiter = self._start().create_future()
+        waiter.add_done_callback(self._waiter_done)
+        self._waiters.append(waiter)
+        self._dispatch()
+        return waiter
+
+    def result(self):
+        """
+        Return a future for the list of all loaded objects, in entry point
+        order (the same as
+        :py:func:`rpymostat_common.loader.load_classes`). Cancelling the
+        future cancels loading.
+
+        :rtype: asyncio.Future
+        """
+        self._start()
+        return self._done
+
+    def cancel(self):
+        """
+        Cancel all entry point imports that have not started yet, and end
+        iteration.
+        """
+        if self._cancelled:
+            return
+        logger.debug('Cancelling async load of entrypoint %s',
+                     self.entrypoint_name)
+        self._cancelled = True
+        for fut in self._futures:
+            fut.cancel()
+        self._futures = []
+        if self._done is not None and not self._done.done():
+            self._done.cancel()
+        self._dispatch()
+
+    def _start(self):
+        """
+        Start loading, if not already started, and return the event loop.
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        if not self._started:
+            self._started = True
+            logger.debug("Loading classes for entrypoint: %s",
+                         self.entrypoint_name)
+            self._done = self._loop.create_future()
+            self._done.add_done_callback(self._waiter_done)
+            fut = self._loop.run_in_executor(self.executor, self._prepare)
+            self._futures.append(fut)
+            fut.add_done_callback(self._prepared)
+        return self._loop
+
+    def _prepare(self):
+        """
+        Return the entry points to load (in an executor thread, as reading
+        the entry point index may block).
+        """
+        entry_points = iter_entry_points(self.entrypoint_name)
+        if self.names is not None:
+            entry_points = [ep for ep in entry_points if ep.name in self.names]
+        if self.superclass is not None:
+            entry_points = _prefilter(entry_points, self.superclass,
+                                      self.report)
+        return _skip_failed(entry_points, self.negative_cache, self.report)
+
+    def _prepared(self, fut):
+        self._discard(fut)
+        if fut.cancelled() or self._cancelled:
+            return
+        if fut.exception() is not None:
+            self._fail(fut.exception())
+            return
+        entry_points = fut.result()
+        self._remaining = len(entry_points)
+        for idx, ep in enumerate(entry_points):
+            logger.debug("Trying to load class from entry point: %s",
+                         ep.name)
+            f = self._loop.run_in_executor(self.executor, _load_one, ep)
+            self._futures.append(f)
+            f.add_done_callback(
+                lambda f, idx=idx: self._loaded(f, idx)
+            )
+        self._dispatch()
+
+    def _loaded(self, fut, idx):
+        self._discard(fut)
+        if fut.cancelled() or self._cancelled:
+            return
+        self._remaining -= 1
+        if fut.exception() is not None:
+            self._fail(fut.exception())
+            return
+        entry_point, obj, record = fut.result()
+        if _finish_load(entry_point, obj, record, self.superclass,
+                        self.negative_cache, self.report):
+            self._ready.append(obj)
+            self._results[idx] = obj
+        self._dispatch()
+
+    def _discard(self, fut):
+        try:
+            self._futures.remove(fut)
+        except ValueError:
+            pass
+
+    def _fail(self, exc):
+        self._error = exc
+        for fut in self._futures:
+            fut.cancel()
+        self._futures = []
+        self._dispatch()
+
+    def _waiter_done(self, waiter):
+        if waiter.cancelled():
+            self.cancel()
+
+    def _dispatch(self):
+        """
+        Resolve waiting futures from the loaded objects, or end iteration
+        once everything is loaded (or loading failed or was cancelled).
+        """
+        finished = (
+            self._cancelled or self._error is not None or
+            self._remaining == 0
+        )
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if self._ready:
+                self._waiters.popleft().set_result(self._ready.popleft())
+            elif self._error is not None:
+                self._waiters.popleft().set_exception(self._error)
+            elif finished:
+                self._waiters.popleft().set_exception(StopAsyncIteration())
+            else:
+                break
+        if not finished or self._done is None or self._done.done():
+            return
+        if self._error is not None:
+            self._done.set_exception(self._error)
+            return
+        classes = [self._results[i] for i in sorted(self._results)]
+        logger.debug("%s classes loaded successfully for entrypoint %s: %s",
+                     len(classes), self.entrypoint_name,
+                     [c.__name__ for c in classes])
+        self._done.set_result(classes)
+
+
+def load_classes_async(entrypoint_name, superclass=None, **kwargs):
+    """
+    Asynchronous equivalent of :py:func:`rpymostat_common.loader.load_classes`,
+    which imports entry points in an executor instead of blocking the event
+    loop. Awaiting the returned future gives the same list of loaded objects
+    that :py:func:`~rpymostat_common.loader.load_classes` would return;
+    cancelling it cancels all imports which have not started. To process
+    each plugin as soon as it loads instead, iterate over an
+    :py:class:`~.AsyncPluginLoader`.
+
+    :param entrypoint_name: name of the entrypoint to load
+    :type entrypoint_name: str
+    :param superclass: if specified, restrict the return value to only
+      subclasses of this class / classinfo
+    :type superclass: ``class or classinfo``
+    :param kwargs: other keyword arguments for :py:class:`~.AsyncPluginLoader`
+    :return: future for the list of loaded entrypoints (usually classes)
+    :rtype: asyncio.Future
+    """
+    return AsyncPluginLoader(
+        entrypoint_name, superclass=superclass, **kwargs
+    ).result()
@@ -0,0 +1,549 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from rpymostat_common.introspection import parse_docstring
+from rpymostat_common.version import VERSION
+
+logger = logging.getLogger(__name__)
+
+# Code run in a fresh interpreter by :py:func:`~.backend_import_times`; it
+# imports the given backend, scans all entry points with it, and prints a
+# JSON dict of timings and peak RSS.
+_BACKEND_SCRIPT = """
+import json, resource, sys, time
+start = time.time()
+if sys.argv[1] == 'pkg_resources':
+    import pkg_resources
+else:
+    try:
+        import importlib.metadata
+    except ImportError:
+        import importlib_metadata
+imported = time.time()
+from rpymostat_common.entry_points import scan
+groups = scan(sys.argv[1])
+scanned = time.time()
+print(json.dumps({
+    'import_time': imported - start,
+    'scan_time': scanned - imported,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'entry_points': sum(len(x) for x in groups.values()),
+}))
+"""
+
+
+def backend_import_times(backends=None, repeat=3, python=None):
+    """
+    Compare the entry point scanning backends in
+    :py:data:`rpymostat_common.entry_points.BACKENDS`. Each backend is
+    imported and used to scan all installed entry points ``repeat`` times,
+    each time in a fresh interpreter so that import costs are actually
+    measured. The result for each backend is the run with the lowest total
+    time.
+
+    :param backends: names of the backends to compare; defaults to all
+    :type backends: list
+    :param repeat: number of times to run each backend
+    :type repeat: int
+    :param python: path to the Python interpreter to use; defaults to
+      ``sys.executable``
+    :type python: str
+    :return: dict of backend name to dict with keys ``import_time``,
+      ``scan_time`` (both in seconds), ``max_rss_kb`` and ``entry_points``
+      (the number of entry points found), or None if the backend failed
+    :rtype: dict
+    """
+    from rpymostat_common.entry_points import BACKENDS
+    if backends is None:
+        backends = sorted(BACKENDS.keys())
+    if python is None:
+        python = sys.executable
+    res = {}
+    for backend in backends:
+        runs = []
+        for _ in range(repeat):
+            try:
+                out = subprocess.check_output(
+                    [python, '-c', _BACKEND_SCRIPT, backend]
+                )
+                runs.append(json.loads(out.decode('utf-8')))
+            except (subprocess.CalledProcessError, ValueError):
+                logger.warning('Benchmark of %s backend failed', backend,
+                               exc_info=1)
+                break
+        if len(runs) == 0:
+            res[backend] = None
+            continue
+        res[backend] = min(
+            runs, key=lambda x: x['import_time'] + x['scan_time']
+        )
+    return res
+
+
+# The regex-based docstring parser used before
+# :py:func:`rpymostat_common.introspection.parse_docstring` was rewritten as a
+# single-pass tokenizer; kept here only for comparison.
+_legacy_param_re = re.compile(
+    r'^\s*:param ([^:]+):((?:(?!:param|:type|:return|:rtype).)*)',
+    re.S | re.M
+)
+_legacy_type_re = re.compile(
+    r'^\s*:type ([^:]+):((?:(?!:param|:type|:return|:rtype).)*)',
+    re.S | re.M
+)
+_legacy_whitespace_re = re.compile(r'\s+')
+
+
+def _legacy_parse_docstring(docstring):
+    res = {'params': {}, 'types': {}}
+    for itm in _legacy_param_re.finditer(docstring):
+        res['params'][itm.group(1).strip()] = _legacy_whitespace_re.sub(
+            ' ', itm.group(2).strip())
+    for itm in _legacy_type_re.finditer(docstring):
+        res['types'][itm.group(1).strip()] = _legacy_whitespace_re.sub(
+            ' ', itm.group(2).strip())
+    return res
+
+
+def make_docstring(num_params, description_lines=5):
+    """
+    Generate a synthetic ``__init__`` docstring documenting ``num_params``
+    arguments, each with a multi-line description and a type.
+
+    :param num_params: number of arguments to document
+    :type num_params: int
+    :param description_lines: number of lines in each argument description
+    :type description_lines: int
+    :return: generated docstring
+    :rtype: str
+    """
+    lines = ['', '    Generated docstring for benchmarking.', '']
+    for i in range(num_params):
+        lines.append('    :param arg%d: description of argument %d' % (i, i))
+        for j in range(description_lines - 1):
+            lines.append('      continued description line %d, with some '
+                         'more words to make it longer' % j)
+        lines.append('    :type arg%d: str' % i)
+    lines.extend(['    :return: nothing', '    :rtype: None', '    '])
+    return '\n'.join(lines)
+
+
+def parse_docstring_times(sizes=(10, 100, 1000), repeat=3):
+    """
+    Time :py:func:`rpymostat_common.introspection.parse_docstring` against
+    the previous regex-based implementation, on generated docstrings (see
+    :py:func:`~.make_docstring`) documenting each of ``sizes`` arguments.
+
+    :param sizes: numbers of arguments to generate docstrings for
+    :type sizes: tuple
+    :param repeat: number of times to time each parser; the best time is
+      reported
+    :type repeat: int
+    :return: list of dicts, one per size, with keys ``params``, ``length``
+      (docstring length in characters), ``tokenizer`` and ``legacy_regex``
+      (best time per parse, in seconds)
+    :rtype: list
+    """
+    res = []
+    for size in sizes:
+        docstring = make_docstring(size)
+        number = max(1, 1000 // size)
+        times = {}
+        for name, func in [
+            ('tokenizer', parse_docstring),
+            ('legacy_regex', _legacy_parse_docstring)
+        ]:
+            times[name] = min(timeit.repeat(
+                lambda: func(docstring), repeat=repeat, number=number
+            )) / number
+        times['params'] = size
+        times['length'] = len(docstring)
+        res.append(times)
+    return res
+
+
+def id_method_times(repeat=3):
+    """
+    Time each of the :py:attr:`rpymostat_common.unique_ids.SystemID.id_methods`
+    on this system, i.e. to compare their probe costs. The
+    parsed ``/proc/cpuinfo`` cache is cleared before each call; note that
+    :py:func:`uuid.getnode` caches its result internally, so only its
+    ``first`` time reflects the real probe cost.
+
+    :param repeat: number of times to call each method
+    :type repeat: int
+    :return: dict of method name to dict with keys ``first`` and ``best``
+      (call times in seconds) and ``found`` (whether it returned an ID)
+    :rtype: dict
+    """
+    from rpymostat_common import cpuinfo
+    from rpymostat_common.unique_ids import SystemID
+    sysid = SystemID(state_path=False)
+    res = {}
+    for meth_name in sysid.id_methods:
+        meth = getattr(sysid, meth_name)
+        times = []
+        found = False
+        for _ in range(repeat):
+            cpuinfo.invalidate()
+            start = timeit.default_timer()
+            try:
+                found = meth() is not None
+            except Exception:
+                found = False
+            times.append(timeit.default_timer() - start)
+        res[meth_name] = {
+            'first': times[0], 'best': min(times), 'found': found
+        }
+    return res
+
+
+#: Entry point group name prefix used by :py:func:`~.make_distributions`.
+BENCH_GROUP_PREFIX = 'rpymostat.bench.'
+
+#: Module, written by :py:func:`~.make_distributions`, that defines the
+#: superclass the generated plugins are filtered by.
+BENCH_BASE_MODULE = 'rpymostat_bench_base'
+
+_PLUGIN_TEMPLATE = """import time
+
+from %(base)s import BenchBase
+
+%(pre)s
+
+class Plugin%(index)d(%(parent)s):
+
+    _description = 'Synthetic benchmark plugin %(index)d'
+
+    def __init__(self, arg0, arg1, arg2=None):
+        \"\"\"%(docstring)s\"\"\"
+        pass
+"""
+
+
+def make_distributions(path, num_entry_points, groups=4, per_dist=100,
+                       slow=0.01, failing=0.05, nonmatching=0.1,
+                       slow_delay=0.01, seed=0):
+    """
+    Write synthetic installed distributions to directory ``path``, for
+    benchmarking the loader. Each distribution is a ``.dist-info`` metadata
+    directory and a package with one module per entry point, each defining
+    a plugin class. Entry points are spread round-robin across ``groups``
+    groups named ``rpymostat.bench.g<N>``. Fractions of the plugins (chosen
+    at random, but reproducibly for a given ``seed``) are slow to import
+    (sleeping for ``slow_delay`` seconds), fail to import, or do not
+    subclass ``BenchBase`` in :py:data:`~.BENCH_BASE_MODULE`.
+
+    :param path: directory to write to; it must be added to ``sys.path``
+      for the distributions to be found
+    :type path: str
+    :param num_entry_points: total number of entry points to generate
+    :type num_entry_points: int
+    :param groups: number of entry point groups
+    :type groups: int
+    :param per_dist: maximum number of entry points per distribution
+    :type per_dist: int
+    :param slow: fraction of plugins that are slow to import
+    :type slow: float
+    :param failing: fraction of plugins that raise ImportError
+    :type failing: float
+    :param nonmatching: fraction of plugins that are not ``BenchBase``
+      subclasses
+    :type nonmatching: float
+    :param slow_delay: import time of slow plugins, in seconds
+    :type slow_delay: float
+    :param seed: random seed used to assign plugin kinds
+    :type seed: int
+    :return: dict of plugin kind (``ok``, ``slow``, ``failing`` or
+      ``nonmatching``) to the number of plugins of that kind
+    :rtype: dict
+    """
+    counts = {}
+    for kind, fraction in [
+        ('slow', slow), ('failing', failing), ('nonmatching', nonmatching)
+    ]:
+        counts[kind] = int(num_entry_points * fraction)
+    counts['ok'] = max(0, num_entry_points - sum(counts.values()))
+    kinds = []
+    for kind in sorted(counts.keys()):
+        kinds.extend([kind] * counts[kind])
+    kinds = kinds[:num_entry_points]
+    random.Random(seed).shuffle(kinds)
+    with open(os.path.join(path, '%s.py' % BENCH_BASE_MODULE), 'w') as fh:
+        fh.write('class BenchBase(object):\n    pass\n')
+    docstring = make_docstring(3, description_lines=2)
+    for dist_num, first in enumerate(range(0, num_entry_points, per_dist)):
+        pkg = 'rpymostat_bench_d%d' % dist_num
+        os.mkdir(os.path.join(path, pkg))
+        with open(os.path.join(path, pkg, '__init__.py'), 'w') as fh:
+            fh.write('')
+        eps = {}
+        for index in range(first, min(first + per_dist, num_entry_points)):
+            kind = kinds[index]
+            with open(
+                os.path.join(path, pkg, 'p%d.py' % index), 'w'
+            ) as fh:
+                fh.write(_PLUGIN_TEMPLATE % {
+                    'base': BENCH_BASE_MODULE,
+                    'index': index,
+                    'parent': (
+                        'object' if kind == 'nonmatching' else 'BenchBase'
+                    ),
+                    'pre': {
+                        'slow': 'time.sleep(%r)' % slow_delay,
+                        'failing': "raise ImportError('synthetic failure')",
+                    }.get(kind, ''),
+                    'docstring': docstring
+                })
+            group = '%sg%d' % (BENCH_GROUP_PREFIX, index % groups)
+            eps.setdefault(group, []).append(
+                'p%d = %s.p%d:Plugin%d' % (index, pkg, index, index)
+            )
+        meta = os.path.join(path, '%s-1.0.dist-info' % pkg)
+        os.mkdir(meta)
+        with open(os.path.join(meta, 'METADATA'), 'w') as fh:
+            fh.write('Metadata-Version: 2.1\nName: %s\nVersion: 1.0\n'
+                     '' % pkg)
+        with open(os.path.join(meta, 'entry_points.txt'), 'w') as fh:
+            for group in sorted(eps.keys()):
+                fh.write('[%s]\n%s\n\n' % (group, '\n'.join(eps[group])))
+    return counts
+
+
+# Code run in a fresh interpreter by :py:func:`~.loader_times`, with the
+# synthetic distributions on ``PYTHONPATH``; it loads every benchmark group,
+# then prints a JSON dict of timings, memory use and import counts.
+_LOADER_SCRIPT = """
+import json, logging, os, resource, sys, time
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+logging.disable(logging.CRITICAL)
+from rpymostat_common import introspection, loader
+from rpymostat_common.entry_points import get_index
+from rpymostat_bench_base import BenchBase
+start = time.time()
+groups = list(get_index().select([sys.argv[1] + '*']).keys())
+scanned = time.time()
+if tracemalloc is not None:
+    tracemalloc.start()
+modules_before = len(sys.modules)
+classes = []
+for group in groups:
+    classes.extend(loader.load_classes(
+        group, superclass=BenchBase, negative_cache=False
+    ))
+loaded = time.time()
+peak = None
+if tracemalloc is not None:
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+imports = len(sys.modules) - modules_before
+introspection.invalidate()
+varnames_start = time.time()
+for cls in classes:
+    loader._get_varnames(cls)
+varnames_end = time.time()
+introspection.invalidate()
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+list_start = time.time()
+loader.list_classes(classes)
+list_end = time.time()
+sys.stdout.close()
+sys.stdout = stdout
+print(json.dumps({
+    'groups': len(groups),
+    'loaded': len(classes),
+    'scan_time': scanned - start,
+    'load_classes_time': loaded - scanned,
+    'get_varnames_time': varnames_end - varnames_start,
+    'list_classes_time': list_end - list_start,
+    'import_count': imports,
+    'peak_traced_memory': peak,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def loader_times(sizes=(10, 100, 1000, 10000), repeat=1, python=None,
+                 **kwargs):
+    """
+    Benchmark :py:func:`rpymostat_common.loader.load_classes`,
+    :py:func:`~rpymostat_common.loader.list_classes` and
+    :py:func:`~rpymostat_common.loader._get_varnames` against synthetic
+    distributions (see :py:func:`~.make_distributions`) with each of
+    ``sizes`` entry points in total. Each run is in a fresh interpreter, with
+    the entry point index persistence and static registry disabled, so that
+    scanning and import costs are actually measured. The result for each
+    size is the run with the lowest ``load_classes_time``.
+
+    :param sizes: total numbers of entry points to benchmark
+    :type sizes: tuple
+    :param repeat: number of times to run each size
+    :type repeat: int
+    :param python: path to the Python interpreter to use; defaults to
+      ``sys.executable``
+    :type python: str
+    :param kwargs: passed through to :py:func:`~.make_distributions`
+    :return: list of dicts, one per size, with keys ``entry_points``,
+      ``kinds`` (from :py:func:`~.make_distributions`), ``groups``,
+      ``loaded`` (number of classes returned), ``scan_time``,
+      ``load_classes_time``, ``get_varnames_time``, ``list_classes_time``
+      (all in seconds), ``import_count`` (modules added to ``sys.modules``
+      by loading), ``peak_traced_memory`` (bytes, or None on Python 2) and
+      ``max_rss_kb``; or None for the other keys if the run failed
+    :rtype: list
+    """
+    if python is None:
+        python = sys.executable
+    # make sure the child imports this same rpymostat_common
+    pkg_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    res = []
+    for size in sizes:
+        path = tempfile.mkdtemp(prefix='rpymostat-bench-')
+        try:
+            kinds = make_distributions(path, size, **kwargs)
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.pathsep.join(
+                [path, pkg_parent] + (
+                    [env['PYTHONPATH']] if env.get('PYTHONPATH') else []
+                )
+            )
+            env['RPYMOSTAT_ENTRY_POINT_INDEX'] = ''
+            env['RPYMOSTAT_STATIC_REGISTRY'] = ''
+            runs = []
+            for _ in range(repeat):
+                try:
+                    out = subprocess.check_output(
+                        [python, '-c', _LOADER_SCRIPT, BENCH_GROUP_PREFIX],
+                        env=env
+                    )
+                    runs.append(json.loads(out.decode('utf-8')))
+                except (subprocess.CalledProcessError, ValueError):
+                    logger.warning('Loader benchmark of %d entry points '
+                                   'failed', size, exc_info=1)
+                    break
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+        result = {'entry_points': size, 'kinds': kinds}
+        if len(runs) > 0:
+            result.update(min(runs, key=lambda x: x['load_classes_time']))
+        res.append(result)
+    return res
+
+
+def parse_args(argv):
+    """
+    Parse command line arguments.
+
+    :param argv: command line arguments, excluding the program name
+    :type argv: list
+    :rtype: argparse.Namespace
+    """
+    p = argparse.ArgumentParser(
+        prog='python -m rpymostat_common.benchmarks',
+        description='Run the rpymostat_common benchmarks and write the '
+                    'results as JSON.'
+    )
+    p.add_argument('-o', '--output', dest='output', action='store',
+                   default=None,
+                   help='path to write the JSON results to (default: '
+                        'print to STDOUT)')
+    p.add_argument('-s', '--sizes', dest='sizes', action='store', type=int,
+                   nargs='+', default=[10, 100, 1000, 10000],
+                   help='total numbers of synthetic entry points to '
+                        'benchmark the loader with (default: %(default)s)')
+    p.add_argument('-r', '--repeat', dest='repeat', action='store',
+                   type=int, default=3,
+                   help='number of times to run each benchmark; the best '
+                        'run is reported (default: %(default)s)')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Run the benchmarks and print or write the results as JSON, along with
+    the package and Python versions so that results can be compared across
+    releases.
+
+    :param argv: command line arguments, excluding the program name;
+      defaults to ``sys.argv[1:]``
+    :type argv: list
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parse_args(argv)
+    result = json.dumps(
+        {
+            'version': VERSION,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'backend_import_times': backend_import_times(repeat=args.repeat),
+            'parse_docstring_times': parse_docstring_times(
+                repeat=args.repeat
+            ),
+            'id_method_times': id_method_times(repeat=args.repeat),
+            'loader_times': loader_times(
+                sizes=args.sizes, repeat=args.repeat
+            ),
+        },
+        sort_keys=True, indent=4
+    )
+    if args.output is None:
+        print(result)
+        return
+    with open(args.output, 'w') as fh:
+        fh.write(result + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import errno
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def cache_dir():
+    """
+    Return the directory that rpymostat_common uses for on-disk caches. This is
+    the ``RPYMOSTAT_CACHE_DIR`` environment variable if set, otherwise
+    ``rpymostat`` under ``XDG_CACHE_HOME`` (default ``~/.cache``).
+
+    :return: absolute path to the cache directory (which may not exist yet)
+    :rtype: str
+    """
+    if os.environ.get('RPYMOSTAT_CACHE_DIR', '') != '':
+        return os.environ['RPYMOSTAT_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME', '')
+    if base == '':
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'rpymostat')
+
+
+def state_dir():
+    """
+    Return the directory that rpymostat_common uses for persistent state,
+    i.e. data that (unlike caches) should survive cache cleanup. This is the
+    ``RPYMOSTAT_STATE_DIR`` environment variable if set, otherwise
+    ``rpymostat`` under ``XDG_STATE_HOME`` (default ``~/.local/state``).
+
+    :return: absolute path to the state directory (which may not exist yet)
+    :rtype: str
+    """
+    if os.environ.get('RPYMOSTAT_STATE_DIR', '') != '':
+        return os.environ['RPYMOSTAT_STATE_DIR']
+    base = os.environ.get('XDG_STATE_HOME', '')
+    if base == '':
+        base = os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'rpymostat')
+
+
+def read_json(path):
+    """
+    Read and return the JSON-deserialized contents of ``path``. Return None
+    (and log at debug level) if the file does not exist or cannot be parsed;
+    callers are expected to treat this as a cache miss.
+
+    :param path: path to the JSON file to read
+    :type path: str
+    :return: deserialized file contents, or None
+    """
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except (IOError, OSError, ValueError):
+        logger.debug('Unable to read JSON cache file %s', path, exc_info=1)
+    return None
+
+
+def _fsync_dir(dirname):
+    """
+    Flush a directory to disk, so that a rename or link in it survives a
+    power failure. Ignored where directories cannot be opened (i.e.
+    Windows).
+
+    :param dirname: path to the directory
+    :type dirname: str
+    """
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except (IOError, OSError):
+        return
+    try:
+        os.fsync(fd)
+    except (IOError, OSError):
+        logger.debug('Unable to fsync directory %s', dirname, exc_info=1)
+    finally:
+        os.close(fd)
+
+
+def write_json(path, data, durable=False, exclusive=False):
+    """
+    Atomically write ``data`` as JSON to ``path``, creating the parent
+    directory if needed. The data is written to a temporary file in the same
+    directory, which is then renamed over ``path``, so readers never see a
+    partially-written file. Failures (i.e. on a read-only filesystem) are
+    logged at debug level and otherwise ignored.
+
+    :param path: path to write to
+    :type path: str
+    :param data: JSON-serializable data to write
+    :param durable: whether to fsync the file and its directory, so that the
+      write survives a power failure rather than leaving an empty file
+    :type durable: bool
+    :param exclusive: if True, never replace an existing ``path``; the
+      temporary file is published with a hard link, which fails if ``path``
+      exists, so that exactly one of several concurrent writers succeeds
+    :type exclusive: bool
+    :return: whether or not the file was written
+    :rtype: bool
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    except (IOError, OSError):
+        logger.debug('Unable to write JSON cache file %s', path, exc_info=1)
+        return False
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(data, fh)
+            if durable:
+                fh.flush()
+                os.fsync(fh.fileno())
+        if exclusive:
+            try:
+                os.link(tmp_path, path)
+            finally:
+                os.unlink(tmp_path)
+        else:
+            os.rename(tmp_path, path)
+        if durable:
+            _fsync_dir(dirname)
+    except (IOError, OSError, TypeError, ValueError) as ex:
+        if exclusive and getattr(ex, 'errno', None) == errno.EEXIST:
+            logger.debug('Not writing JSON file %s; it already exists', path)
+        else:
+            logger.debug('Unable to write JSON cache file %s', path,
+                         exc_info=1)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
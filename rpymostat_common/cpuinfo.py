@@ -0,0 +1,204 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+#: Default path to read CPU information from.
+CPUINFO_PATH = '/proc/cpuinfo'
+
+
+class CpuInfo(object):
+    """
+    Parsed contents of ``/proc/cpuinfo``, as returned by
+    :py:func:`~.parse_cpuinfo`. Field names are lower-cased, and values are
+    strings with surrounding whitespace removed.
+    """
+
+    __slots__ = ['processors', 'fields']
+
+    def __init__(self, processors=(), fields=None):
+        """
+        :param processors: one dict of fields per ``processor`` block
+        :type processors: tuple
+        :param fields: fields that are not part of any ``processor`` block,
+          i.e. ``hardware``, ``revision`` and ``serial`` on ARM
+        :type fields: dict
+        """
+        self.processors = tuple(processors)
+        self.fields = fields if fields is not None else {}
+
+    def get(self, name, default=None):
+        """
+        Return the value of global field ``name``; if there is none, return
+        its value from the first processor block that has it, or ``default``.
+
+        :param name: field name (case-insensitive)
+        :type name: str
+        :rtype: str
+        """
+        name = name.lower()
+        if name in self.fields:
+            return self.fields[name]
+        for proc in self.processors:
+            if name in proc:
+                return proc[name]
+        return default
+
+    @property
+    def hardware(self):
+        """
+        :return: the ``Hardware`` field, or None
+        :rtype: str
+        """
+        return self.get('hardware')
+
+    @property
+    def revision(self):
+        """
+        :return: the ``Revision`` field, or None
+        :rtype: str
+        """
+        return self.get('revision')
+
+    @property
+    def serial(self):
+        """
+        :return: the ``Serial`` field, or None
+        :rtype: str
+        """
+        return self.get('serial')
+
+    @property
+    def model(self):
+        """
+        :return: the ``Model`` field, or None
+        :rtype: str
+        """
+        return self.get('model')
+
+    def as_dict(self):
+        """
+        :return: this CPU information as a dict
+        :rtype: dict
+        """
+        return {
+            'processors': [dict(p) for p in self.processors],
+            'fields': dict(self.fields)
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, CpuInfo):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    def __repr__(self):
+        return '<CpuInfo %s>' % self.as_dict()
+
+
+def parse_cpuinfo(lines):
+    """
+    Parse ``/proc/cpuinfo`` content in a single pass. Each ``processor``
+    line starts a per-processor block, which runs until the next blank line;
+    all other fields are global.
+
+    :param lines: iterable of lines, i.e. an open file
+    :type lines: iterable
+    :rtype: CpuInfo
+    """
+    processors = []
+    fields = {}
+    current = None
+    for line in lines:
+        key, sep, value = line.partition(':')
+        if not sep:
+            if not line.strip():
+                current = None
+            continue
+        key = key.strip().lower()
+        if key == 'processor':
+            current = {}
+            processors.append(current)
+        target = fields if current is None else current
+        # like the previous regex search, the first occurrence wins
+        target.setdefault(key, value.strip())
+    return CpuInfo(processors, fields)
+
+
+def read_cpuinfo(path=CPUINFO_PATH):
+    """
+    Read and parse ``path``.
+
+    :param path: path to read
+    :type path: str
+    :rtype: CpuInfo
+    :raises: IOError or OSError if the file cannot be read
+    """
+    with open(path, 'r') as fh:
+        return parse_cpuinfo(fh)
+
+
+_cache = {}
+
+
+def get_cpuinfo(path=CPUINFO_PATH):
+    """
+    Return the parsed contents of ``path``, reading it only once per process.
+
+    :param path: path to read
+    :type path: str
+    :rtype: CpuInfo
+    :raises: IOError or OSError if the file cannot be read
+    """
+    if path not in _cache:
+        _cache[path] = read_cpuinfo(path)
+        logger.debug('Read CPU information from %s', path)
+    return _cache[path]
+
+
+def invalidate():
+    """
+    Clear the cache used by :py:func:`~.get_cpuinfo`.
+    """
+    _cache.clear()
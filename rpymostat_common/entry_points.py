@@ -0,0 +1,763 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import fnmatch
+import importlib
+import logging
+import os
+import re
+import sys
+import zlib
+from collections import OrderedDict
+
+from rpymostat_common.cache import cache_dir, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+#: Version of the on-disk index format; bump this when the format changes.
+INDEX_FORMAT_VERSION = 1
+
+#: Suffixes of directory entries (on ``sys.path`` directories) that hold
+#: distribution metadata, and therefore may contain entry points.
+METADATA_SUFFIXES = ('.dist-info', '.egg-info', '.egg', '.egg-link')
+
+#: Default name of the generated static plugin registry module; see
+#: :py:mod:`rpymostat_common.static_registry`.
+STATIC_REGISTRY_MODULE = 'rpymostat_static_registry'
+
+#: Prefix of entry point extras which declare a base class or capability tag
+#: of the entry point's target; see :py:attr:`EntryPoint.provides`.
+PROVIDES_PREFIX = 'provides.'
+
+
+class EntryPoint(object):
+    """
+    Lightweight, importable description of a single entry point, as stored in
+    the :py:class:`~.EntryPointIndex`. Unlike ``pkg_resources.EntryPoint``
+    this does not hold a reference to its distribution, and ``load()`` does
+    not attempt to resolve the entry point's extras requirements.
+    """
+
+    __slots__ = ['name', 'value', 'group', 'dist_name', 'dist_version']
+
+    # regex to split an entry point value ("module:attrs [extras]")
+    value_re = re.compile(
+        r'^\s*(?P<module>[\w.]+)\s*(?::\s*(?P<attrs>[\w.]+))?\s*'
+        r'(?:\[(?P<extras>[^\]]*)\])?\s*$'
+    )
+
+    def __init__(self, name, value, group, dist_name=None, dist_version=None):
+        """
+        :param name: the entry point name
+        :type name: str
+        :param value: the entry point value, i.e. ``module.name:ClassName``
+        :type value: str
+        :param group: the entry point group name
+        :type group: str
+        :param dist_name: name of the distribution providing the entry point
+        :type dist_name: str
+        :param dist_version: version of the distribution providing the entry
+          point
+        :type dist_version: str
+        """
+        self.name = name
+        self.value = value
+        self.group = group
+        self.dist_name = dist_name
+        self.dist_version = dist_version
+
+    def _parts(self):
+        m = self.value_re.match(self.value)
+        if m is None:
+            raise ValueError('Invalid entry point value: %s' % self.value)
+        return m
+
+    @property
+    def module_name(self):
+        """
+        :return: the name of the module this entry point refers to
+        :rtype: str
+        """
+        return self._parts().group('module')
+
+    @property
+    def attrs(self):
+        """
+        :return: the attribute path within the module, as a tuple of names
+        :rtype: tuple
+        """
+        attrs = self._parts().group('attrs')
+        if attrs is None:
+            return ()
+        return tuple(attrs.split('.'))
+
+    @property
+    def extras(self):
+        """
+        :return: the extras declared on the entry point, as a tuple
+        :rtype: tuple
+        """
+        extras = self._parts().group('extras')
+        if extras is None:
+            return ()
+        return tuple(x.strip() for x in extras.split(',') if x.strip() != '')
+
+    @property
+    def provides(self):
+        """
+        The base classes and/or capability tags that the entry point declares
+        its target provides, so that it can be filtered without importing
+        it. These are declared as extras prefixed with
+        :py:data:`~.PROVIDES_PREFIX`, i.e.
+        ``temp = acme.sensors:Temp [provides.rpymostat_common.base.Sensor]``
+        for a class with ``rpymostat_common.base.Sensor`` as a base class;
+        other extras are ignored. Tags are normalized with
+        :py:func:`~.normalize_tag`.
+
+        :return: normalized tags, or an empty tuple if none are declared
+        :rtype: tuple
+        """
+        return tuple(
+            normalize_tag(x[len(PROVIDES_PREFIX):]) for x in self.extras
+            if normalize_tag(x).startswith(PROVIDES_PREFIX)
+        )
+
+    def load(self):
+        """
+        Import the entry point's module and return the object it refers to.
+
+        :return: the loaded object (usually a class)
+        """
+        obj = __import__(self.module_name, fromlist=['__name__'], level=0)
+        for attr in self.attrs:
+            obj = getattr(obj, attr)
+        return obj
+
+    def as_list(self):
+        """
+        :return: this entry point's name, value, distribution name and
+          distribution version, as stored in the on-disk index
+        :rtype: list
+        """
+        return [self.name, self.value, self.dist_name, self.dist_version]
+
+    def __eq__(self, other):
+        if not isinstance(other, EntryPoint):
+            return NotImplemented
+        return (
+            self.group == other.group and
+            self.as_list() == other.as_list()
+        )
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    def __hash__(self):
+        return hash((self.group, self.name, self.value))
+
+    def __repr__(self):
+        return '<EntryPoint %s = %s (group=%s, dist=%s %s)>' % (
+            self.name, self.value, self.group, self.dist_name,
+            self.dist_version
+        )
+
+
+def _scan_pkg_resources():
+    """
+    Walk every distribution in the ``pkg_resources`` working set and return
+    all of their entry points.
+
+    :return: dict of entry point group name to list of :py:class:`~.EntryPoint`
+    :rtype: dict
+    """
+    import pkg_resources
+    groups = {}
+    for dist in pkg_resources.working_set:
+        for group, eps in sorted(dist.get_entry_map().items()):
+            for ep in eps.values():
+                value = ep.module_name
+                if ep.attrs:
+                    value += ':' + '.'.join(ep.attrs)
+                if ep.extras:
+                    value += ' [%s]' % ','.join(ep.extras)
+                groups.setdefault(group, []).append(EntryPoint(
+                    ep.name, value, group, dist.project_name, dist.version
+                ))
+    return groups
+
+
+def _metadata_module():
+    """
+    Return the ``importlib.metadata`` module (or its ``importlib_metadata``
+    backport, if installed), or None if neither is available.
+    """
+    try:
+        import importlib.metadata as metadata
+        return metadata
+    except ImportError:
+        pass
+    try:
+        import importlib_metadata as metadata
+        return metadata
+    except ImportError:
+        return None
+
+
+def _scan_importlib_metadata():
+    """
+    Walk every distribution visible to ``importlib.metadata`` and return all
+    of their entry points. As with the ``pkg_resources`` working set, only
+    the first distribution found on ``sys.path`` with a given name is used.
+
+    :return: dict of entry point group name to list of :py:class:`~.EntryPoint`
+    :rtype: dict
+    """
+    metadata = _metadata_module()
+    groups = {}
+    seen = set()
+    for dist in metadata.distributions():
+        name = dist.metadata['Name']
+        key = normalize_name(name)
+        if key in seen:
+            continue
+        seen.add(key)
+        for ep in sorted(dist.entry_points, key=lambda x: x.group):
+            groups.setdefault(ep.group, []).append(EntryPoint(
+                ep.name, ep.value, ep.group, name, dist.version
+            ))
+    return groups
+
+
+def normalize_name(name):
+    """
+    Normalize a distribution name for comparison, per PEP 503.
+
+    :param name: distribution name
+    :type name: str
+    :rtype: str
+    """
+    return re.sub(r'[-_.]+', '-', name or '').lower()
+
+
+def normalize_tag(tag):
+    """
+    Normalize a :py:attr:`EntryPoint.provides` tag for comparison, the same
+    way setuptools normalizes extras names (which lowercases them).
+
+    :param tag: tag, i.e. a dotted class name
+    :type tag: str
+    :rtype: str
+    """
+    return re.sub(r'[^A-Za-z0-9.-]+', '_', tag).lower()
+
+
+def _metadata_dir(meta_path):
+    """
+    Return the directory containing the metadata files for the distribution
+    metadata path ``meta_path`` (a directory ending in one of
+    :py:data:`~.METADATA_SUFFIXES`), or None if it is not a directory.
+    """
+    if not os.path.isdir(meta_path):
+        # .egg-link file or zipped egg
+        return None
+    if meta_path.endswith('.egg'):
+        return os.path.join(meta_path, 'EGG-INFO')
+    return meta_path
+
+
+def _read_headers(path, names):
+    """
+    Read the RFC 822 style headers in ``names`` from a ``METADATA`` or
+    ``PKG-INFO`` file, stopping at the first blank line. Missing headers (or
+    an unreadable file) are returned as None.
+    """
+    result = dict((name, None) for name in names)
+    try:
+        with open(path) as fh:
+            for line in fh:
+                if not line.strip():
+                    break
+                key, _, value = line.partition(':')
+                if key in result and result[key] is None:
+                    result[key] = value.strip()
+    except (IOError, OSError):
+        pass
+    return result
+
+
+def scan_distribution(meta_path):
+    """
+    Return the entry points of the single distribution whose metadata is at
+    ``meta_path`` (i.e. ``site-packages/foo-1.0.dist-info``), by reading its
+    ``entry_points.txt`` directly. This is much cheaper than a full
+    :py:func:`~.scan`, and is used to re-scan only the distributions whose
+    :py:func:`~.fingerprint` entries changed.
+
+    Only metadata directories can be scanned this way; for ``.egg-link``
+    files and zipped eggs this returns None, and a full :py:func:`~.scan` is
+    needed instead.
+
+    :param meta_path: path to a ``.dist-info``, ``.egg-info`` or ``.egg``
+      directory
+    :type meta_path: str
+    :return: list of :py:class:`~.EntryPoint`, or None
+    :rtype: list
+    """
+    meta_dir = _metadata_dir(meta_path)
+    if meta_dir is None:
+        return None
+    headers = _read_headers(
+        os.path.join(
+            meta_dir,
+            'METADATA' if meta_dir.endswith('.dist-info') else 'PKG-INFO'
+        ),
+        ['Name', 'Version']
+    )
+    name = headers['Name']
+    version = headers['Version']
+    if name is None:
+        # fall back to the "name-version.suffix" directory name
+        base = os.path.splitext(os.path.basename(meta_path))[0]
+        name, _, fn_version = base.partition('-')
+        version = version or fn_version.partition('-')[0] or None
+    result = []
+    group = None
+    try:
+        with open(os.path.join(meta_dir, 'entry_points.txt')) as fh:
+            for line in fh:
+                line = line.strip()
+                if not line or line[0] in '#;':
+                    continue
+                if line.startswith('[') and line.endswith(']'):
+                    group = line[1:-1].strip()
+                    continue
+                ep_name, sep, value = line.partition('=')
+                if group is None or not sep:
+                    continue
+                result.append(EntryPoint(
+                    ep_name.strip(), value.strip(), group, name, version
+                ))
+    except (IOError, OSError):
+        # distribution has no entry points
+        pass
+    return result
+
+
+#: Entry point scanning functions, by backend name.
+BACKENDS = {
+    'importlib.metadata': _scan_importlib_metadata,
+    'pkg_resources': _scan_pkg_resources
+}
+
+
+def get_backend():
+    """
+    Return the name of the entry point scanning backend to use:
+    ``importlib.metadata`` (or its backport) if available, otherwise
+    ``pkg_resources``. The ``RPYMOSTAT_ENTRY_POINT_BACKEND`` environment
+    variable can be set to one of the keys of :py:data:`~.BACKENDS` to
+    override this.
+
+    :return: backend name
+    :rtype: str
+    """
+    name = os.environ.get('RPYMOSTAT_ENTRY_POINT_BACKEND', '')
+    if name in BACKENDS:
+        return name
+    if _metadata_module() is not None:
+        return 'importlib.metadata'
+    return 'pkg_resources'
+
+
+def scan(backend=None):
+    """
+    Scan all installed distributions for entry points.
+
+    :param backend: name of the backend to use (a key of
+      :py:data:`~.BACKENDS`); defaults to :py:func:`~.get_backend`
+    :type backend: str
+    :return: dict of entry point group name to list of :py:class:`~.EntryPoint`
+    :rtype: dict
+    """
+    if backend is None:
+        backend = get_backend()
+    logger.debug('Scanning entry points with %s backend', backend)
+    return BACKENDS[backend]()
+
+
+def _stat_mtime(path):
+    """
+    Return the mtime of ``path``, or None if it cannot be stat'ed.
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def fingerprint(path=None):
+    """
+    Compute a cheap fingerprint of the installed distributions, used to
+    decide whether the on-disk :py:class:`~.EntryPointIndex` is still valid.
+    This lists each directory on ``path`` and stats its distribution metadata
+    (see :py:data:`~.METADATA_SUFFIXES`) and any ``entry_points.txt`` inside
+    it; it never reads or parses metadata, so it is much cheaper than
+    actually scanning for entry points.
+
+    :param path: list of directories to fingerprint; defaults to ``sys.path``
+    :type path: list
+    :return: JSON-serializable fingerprint
+    :rtype: dict
+    """
+    if path is None:
+        path = sys.path
+    dists = []
+    for item in path:
+        item = item or os.getcwd()
+        try:
+            names = os.listdir(item)
+        except OSError:
+            # zipfile, egg file or nonexistent path entry
+            dists.append([item, _stat_mtime(item)])
+            continue
+        for name in sorted(names):
+            if not name.endswith(METADATA_SUFFIXES):
+                continue
+            meta_path = os.path.join(item, name)
+            dists.append([
+                meta_path,
+                _stat_mtime(meta_path),
+                _stat_mtime(os.path.join(meta_path, 'entry_points.txt'))
+            ])
+    return {
+        'python': sys.version,
+        'path': list(path),
+        'dists': dists
+    }
+
+
+def _index_filename():
+    """
+    Return the default on-disk index file name, which includes a short hash
+    of ``sys.executable`` and ``sys.path`` so that different interpreters,
+    virtualenvs and script directories on the same host each keep their own
+    index, rather than invalidating a shared one.
+
+    :rtype: str
+    """
+    key = '\0'.join([sys.executable or ''] + list(sys.path))
+    return 'entry_points-%08x.json' % (
+        zlib.crc32(key.encode('utf-8')) & 0xffffffff
+    )
+
+
+class EntryPointIndex(object):
+    """
+    Index of all installed entry points, by group, which is persisted to disk
+    and only rebuilt when the :py:func:`~.fingerprint` of installed
+    distributions changes. This lets :py:func:`~.iter_entry_points` avoid
+    walking every distribution on ``sys.path`` at startup.
+    """
+
+    def __init__(self, path=None, persist=True, backend=None):
+        """
+        :param path: path to the on-disk index file; defaults to
+          ``entry_points-<hash>.json`` (see :py:func:`~._index_filename`) in
+          :py:func:`rpymostat_common.cache.cache_dir`
+        :type path: str
+        :param persist: whether or not to read and write the on-disk index;
+          if False, the index is only kept in memory.
+        :type persist: bool
+        :param backend: name of the scanning backend to use when rebuilding
+          the index; defaults to :py:func:`~.get_backend`
+        :type backend: str
+        """
+        if path is None:
+            path = os.path.join(cache_dir(), _index_filename())
+        self.path = path
+        self.persist = persist
+        self.backend = backend
+        self._groups = None
+
+    def groups(self):
+        """
+        Return all indexed entry points. On first call, this loads the
+        on-disk index if its fingerprint matches the currently-installed
+        distributions, and otherwise rebuilds it; the result is then kept in
+        memory until :py:meth:`~.invalidate` is called.
+
+        :return: dict of entry point group name to list of
+          :py:class:`~.EntryPoint`
+        :rtype: dict
+        """
+        if self._groups is not None:
+            return self._groups
+        fp = fingerprint()
+        if self.persist:
+            self._groups = self._load(fp)
+            if self._groups is not None:
+                logger.debug('Using entry point index from %s', self.path)
+                return self._groups
+        return self.rebuild(fp)
+
+    def entry_points(self, group):
+        """
+        Return the list of indexed entry points in the given group.
+
+        :param group: entry point group name
+        :type group: str
+        :return: list of :py:class:`~.EntryPoint`
+        :rtype: list
+        """
+        return list(self.groups().get(group, []))
+
+    def select(self, patterns):
+        """
+        Return the indexed entry points for several groups at once, from a
+        single pass over the index. Each pattern is either an exact group
+        name, or a shell-style wildcard pattern (i.e. ``rpymostat.*``) as
+        understood by :py:func:`fnmatch.fnmatchcase`. Exact group names are
+        always present in the result (with an empty list if the group has no
+        entry points); groups matching a wildcard pattern are only present if
+        they have entry points.
+
+        :param patterns: group name or pattern, or list of them
+        :type patterns: ``str`` or ``list``
+        :return: OrderedDict of group name to list of :py:class:`~.EntryPoint`,
+          in the order of ``patterns`` (and sorted by group name within each
+          wildcard pattern)
+        :rtype: collections.OrderedDict
+        """
+        if not isinstance(patterns, (list, tuple, set)):
+            patterns = [patterns]
+        groups = self.groups()
+        result = OrderedDict()
+        for pattern in patterns:
+            if not _is_pattern(pattern):
+                names = [pattern]
+            else:
+                names = sorted(
+                    g for g in groups if fnmatch.fnmatchcase(g, pattern)
+                )
+            for name in names:
+                if name not in result:
+                    result[name] = list(groups.get(name, []))
+        return result
+
+    def rebuild(self, fp=None):
+        """
+        Scan all installed distributions for entry points, and (if
+        ``persist`` is True) write the resulting index to disk.
+
+        :param fp: current :py:func:`~.fingerprint`, if already computed
+        :type fp: dict
+        :return: dict of entry point group name to list of
+          :py:class:`~.EntryPoint`
+        :rtype: dict
+        """
+        logger.debug('Rebuilding entry point index')
+        if fp is None:
+            fp = fingerprint()
+        self._groups = scan(self.backend)
+        if self.persist:
+            write_json(self.path, {
+                'version': INDEX_FORMAT_VERSION,
+                'fingerprint': fp,
+                'groups': dict(
+                    (group, [ep.as_list() for ep in eps])
+                    for group, eps in self._groups.items()
+                )
+            })
+        return self._groups
+
+    def invalidate(self):
+        """
+        Discard the in-memory index, so that the next call to
+        :py:meth:`~.groups` re-checks the fingerprint.
+        """
+        self._groups = None
+
+    def _load(self, fp):
+        """
+        Load the on-disk index, returning None if it is missing, in an old
+        format, or has a fingerprint other than ``fp``.
+        """
+        data = read_json(self.path)
+        if not isinstance(data, dict):
+            return None
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            logger.debug('Entry point index %s is in an old format', self.path)
+            return None
+        if data.get('fingerprint') != fp:
+            logger.debug('Entry point index %s is stale', self.path)
+            return None
+        groups = {}
+        for group, eps in data.get('groups', {}).items():
+            groups[group] = [EntryPoint(x[0], x[1], group, x[2], x[3])
+                             for x in eps]
+        return groups
+
+
+class StaticEntryPointIndex(EntryPointIndex):
+    """
+    Entry point index backed by a static plugin registry module generated
+    by :py:mod:`rpymostat_common.static_registry`, for frozen or otherwise
+    read-only deployments. Installed distributions are never scanned or
+    fingerprinted; only the groups in the registry have entry points.
+    """
+
+    def __init__(self, module):
+        """
+        :param module: the generated registry module
+        :type module: module
+        """
+        super(StaticEntryPointIndex, self).__init__(
+            path=getattr(module, '__file__', None), persist=False
+        )
+        self.module = module
+        self._groups = None
+
+    def groups(self):
+        """
+        Return all entry points in the static registry, built from its
+        ``ENTRY_POINTS`` tuples on first call.
+
+        :return: dict of entry point group name to list of
+          :py:class:`~.EntryPoint`
+        :rtype: dict
+        """
+        if self._groups is None:
+            self._groups = dict(
+                (group, [EntryPoint(*args) for args in eps])
+                for group, eps in self.module.ENTRY_POINTS.items()
+            )
+        return self._groups
+
+    def rebuild(self, fp=None):
+        """
+        A static registry cannot be rebuilt at runtime; this just returns
+        :py:meth:`~.groups`.
+        """
+        return self.groups()
+
+
+def _static_registry():
+    """
+    Import and return the generated static registry module, or None if
+    there is none. The module name is taken from the
+    ``RPYMOSTAT_STATIC_REGISTRY`` environment variable, defaulting to
+    :py:data:`~.STATIC_REGISTRY_MODULE`; setting it to an empty string
+    disables the static registry.
+    """
+    name = os.environ.get('RPYMOSTAT_STATIC_REGISTRY', STATIC_REGISTRY_MODULE)
+    if not name:
+        return None
+    try:
+        return importlib.import_module(name)
+    except ImportError as ex:
+        if (
+            getattr(ex, 'name', None) == name or
+            str(ex) == 'No module named %s' % name
+        ):
+            logger.debug('No static plugin registry module %s', name)
+        else:
+            logger.warning('Unable to import static plugin registry %s; '
+                           'scanning entry points instead', name,
+                           exc_info=1)
+        return None
+
+
+def _is_pattern(group):
+    """
+    Return whether a group name contains :py:mod:`fnmatch` wildcards.
+    """
+    return any(c in group for c in '*?[')
+
+
+_index = None
+
+
+def get_index():
+    """
+    Return the process-wide default :py:class:`~.EntryPointIndex`. If a
+    generated static plugin registry module is importable (see
+    :py:mod:`rpymostat_common.static_registry`), this is a
+    :py:class:`~.StaticEntryPointIndex` for it. Otherwise, setting the
+    ``RPYMOSTAT_ENTRY_POINT_INDEX`` environment variable overrides the
+    index's on-disk path; setting it to an empty string disables
+    persistence.
+
+    :rtype: EntryPointIndex
+    """
+    global _index
+    if _index is None:
+        static = _static_registry()
+        if static is not None:
+            logger.debug('Using static plugin registry %s', static.__name__)
+            _index = StaticEntryPointIndex(static)
+            return _index
+        path = os.environ.get('RPYMOSTAT_ENTRY_POINT_INDEX', None)
+        _index = EntryPointIndex(path=path or None, persist=(path != ''))
+    return _index
+
+
+def iter_entry_points(group):
+    """
+    Iterate over the entry points in ``group`` from the default index. This
+    is a drop-in replacement for ``pkg_resources.iter_entry_points``.
+
+    :param group: entry point group name
+    :type group: str
+    :return: iterator over :py:class:`~.EntryPoint`
+    """
+    return iter(get_index().entry_points(group))
+
+
+def select_entry_points(patterns):
+    """
+    Return the entry points for several groups from the default index; see
+    :py:meth:`EntryPointIndex.select`.
+
+    :param patterns: group name or pattern, or list of them
+    :type patterns: ``str`` or ``list``
+    :return: OrderedDict of group name to list of :py:class:`~.EntryPoint`
+    :rtype: collections.OrderedDict
+    """
+    return get_index().select(patterns)
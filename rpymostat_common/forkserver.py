@@ -0,0 +1,304 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import gc
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+
+from rpymostat_common.loader import load_groups
+
+logger = logging.getLogger(__name__)
+
+
+class PluginForkServer(object):
+    """
+    Loads plugin groups once, and then forks worker processes which start
+    with the loaded plugins already in memory. The workers share the
+    imported modules with the fork server (and each other) copy-on-write,
+    so worker startup does no plugin imports at all.
+
+    :py:meth:`~.preload` loads the plugins and then forks a dedicated,
+    single-threaded server process; :py:meth:`~.spawn` and :py:meth:`~.join`
+    send requests to it over a pipe, and it forks (and reaps) the workers.
+    The calling process may therefore start threads once
+    :py:meth:`~.preload` has returned, but should not do so before it. Since
+    workers are forked from the server, ``target`` and its arguments are
+    sent to it by pickling, and so must be picklable (i.e. module-level
+    functions).
+
+    Only available on platforms with :py:func:`os.fork`.
+    """
+
+    def __init__(self, groups, superclass=None, **kwargs):
+        """
+        :param groups: entry point group name or pattern, or list of them,
+          as for :py:func:`rpymostat_common.loader.load_groups`
+        :type groups: ``str`` or ``list``
+        :param superclass: class / classinfo to restrict all groups to, or
+          dict of group name to class / classinfo
+        :type superclass: ``class``, ``classinfo`` or ``dict``
+        :param kwargs: other keyword arguments to pass to
+          :py:func:`rpymostat_common.loader.load_groups`; ``lazy`` is not
+          supported, as it would defeat the purpose of preloading
+        """
+        if not hasattr(os, 'fork'):
+            raise NotImplementedError(
+                'PluginForkServer requires os.fork(), which is not '
+                'available on this platform'
+            )
+        if kwargs.get('lazy', False):
+            raise ValueError('PluginForkServer does not support lazy=True')
+        self.groups = groups
+        self.superclass = superclass
+        self.load_kwargs = kwargs
+        #: dict of group name to list of loaded plugins, once preloaded
+        self.plugins = None
+        #: dict of worker PID to worker name, for running workers
+        self.workers = {}
+        #: PID of the server process, once started
+        self.server_pid = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def preload(self):
+        """
+        Load the plugin groups in this process and start the server process,
+        if not already done. This is called automatically by
+        :py:meth:`~.spawn`, but should be called explicitly before the
+        calling process starts any threads.
+
+        :return: dict of group name to list of loaded plugins
+        :rtype: dict
+        """
+        if self.plugins is None:
+            self.plugins = load_groups(
+                self.groups, superclass=self.superclass, **self.load_kwargs
+            )
+            logger.debug('Preloaded plugins for fork server: %s',
+                         dict((g, len(c)) for g, c in self.plugins.items()))
+        if self.server_pid is None:
+            self._start_server()
+        return self.plugins
+
+    def _start_server(self):
+        """
+        Fork the server process, which runs :py:meth:`~._serve`.
+        """
+        conn, server_conn = multiprocessing.Pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            self._serve(server_conn)
+        server_conn.close()
+        self._conn = conn
+        self.server_pid = pid
+        logger.debug('Started fork server with PID %s', pid)
+
+    def _serve(self, conn):
+        """
+        Server process main loop: fork workers and report their exit status
+        as requested over ``conn``, until it is closed or a ``stop`` request
+        is received, and then exit; never returns.
+        """
+        status = 0
+        try:
+            # Collect now so the workers don't inherit garbage, then (on
+            # 3.7+) move every tracked object to the permanent generation, so
+            # that collections in the workers do not touch (and thereby
+            # un-share) the pages holding the preloaded modules.
+            gc.collect()
+            if hasattr(gc, 'freeze'):
+                gc.freeze()
+            while True:
+                try:
+                    req = conn.recv()
+                except EOFError:
+                    break
+                if req[0] == 'stop':
+                    break
+                try:
+                    if req[0] == 'spawn':
+                        res = self._fork_worker(conn, *req[1:])
+                    else:
+                        res = self._wait(*req[1:])
+                except Exception as ex:
+                    conn.send(('error', '%s: %s' % (type(ex).__name__, ex)))
+                else:
+                    conn.send(('ok', res))
+        except:
+            logger.error('Exception in fork server', exc_info=1)
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def _fork_worker(self, conn, target, args, kwargs, name):
+        """
+        In the server process, fork a worker; return its PID.
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            self._run_worker(target, self.plugins, args, kwargs, name)
+        self.workers[pid] = name
+        return pid
+
+    def _wait(self, pids):
+        """
+        In the server process, wait for each of ``pids`` to exit; return a
+        dict of PID to exit status (negative for a signal).
+        """
+        result = {}
+        for p in pids:
+            status = os.waitpid(p, 0)[1]
+            if os.WIFSIGNALED(status):
+                result[p] = -os.WTERMSIG(status)
+            else:
+                result[p] = os.WEXITSTATUS(status)
+            self.workers.pop(p, None)
+        return result
+
+    def _request(self, *req):
+        """
+        Send a request to the server process, and return its result.
+        """
+        with self._lock:
+            self._conn.send(req)
+            status, res = self._conn.recv()
+        if status == 'error':
+            raise RuntimeError('Fork server request failed: %s' % res)
+        return res
+
+    def spawn(self, target, args=(), kwargs=None, name=None):
+        """
+        Have the server process fork a worker which calls
+        ``target(plugins, *args, **kwargs)``, where ``plugins`` is the dict
+        of group name to list of preloaded plugins, and then exits with
+        ``target``'s return value as its exit status (0 if it returned None,
+        1 if it raised an exception).
+
+        :param target: picklable callable to run in the worker
+        :type target: callable
+        :param args: extra positional arguments for ``target``; must be
+          picklable
+        :type args: tuple
+        :param kwargs: keyword arguments for ``target``; must be picklable
+        :type kwargs: dict
+        :param name: name of the worker, for logging
+        :type name: str
+        :return: the worker's PID
+        :rtype: int
+        """
+        self.preload()
+        if kwargs is None:
+            kwargs = {}
+        if name is None:
+            name = getattr(target, '__name__', 'worker')
+        pid = self._request('spawn', target, tuple(args), kwargs, name)
+        logger.debug('Forked worker %s with PID %s', name, pid)
+        self.workers[pid] = name
+        return pid
+
+    def _run_worker(self, target, plugins, args, kwargs, name):
+        """
+        Run ``target`` in a forked worker, and exit; never returns.
+        """
+        status = 1
+        try:
+            self.workers = {}
+            res = target(plugins, *args, **kwargs)
+            status = 0 if res is None else int(res)
+        except SystemExit as ex:
+            if ex.code is None:
+                status = 0
+            elif isinstance(ex.code, int):
+                status = ex.code
+            else:
+                sys.stderr.write('%s\n' % (ex.code,))
+        except:
+            logger.error('Exception in worker %s', name, exc_info=1)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def join(self, pid=None):
+        """
+        Wait for one worker (or all of them, if ``pid`` is None) to exit.
+
+        :param pid: PID of the worker to wait for
+        :type pid: int
+        :return: dict of PID to exit status (negative for a signal) for the
+          workers that exited
+        :rtype: dict
+        """
+        pids = list(self.workers) if pid is None else [pid]
+        if not pids:
+            return {}
+        result = self._request('join', pids)
+        for p in pids:
+            logger.debug('Worker %s (PID %s) exited with status %s',
+                         self.workers.pop(p, None), p, result[p])
+        return result
+
+    def stop(self):
+        """
+        Stop the server process, if running, and wait for it to exit.
+        Workers which are still running are not affected, but can no longer
+        be joined.
+        """
+        if self.server_pid is None:
+            return
+        with self._lock:
+            try:
+                self._conn.send(('stop',))
+            except (IOError, OSError):
+                pass
+            self._conn.close()
+            os.waitpid(self.server_pid, 0)
+        logger.debug('Stopped fork server with PID %s', self.server_pid)
+        self._conn = None
+        self.server_pid = None
+        self.workers = {}
@@ -0,0 +1,425 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import inspect
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Any occurrence of one of these field markers ends the preceding docstring
+# field; a marker at the start of a line (after optional whitespace) also
+# starts a new field.
+_marker_re = re.compile(r':(param|type|return|rtype|raise)')
+
+# Remainder of a field header following a marker that starts a field, keyed
+# by marker kind. The ``name`` group, if any, captures the field's name.
+_header_res = {
+    'param': re.compile(r' (?P<name>[^:\n]+):'),
+    'type': re.compile(r' (?P<name>[^:\n]+):'),
+    'return': re.compile(r's?[ \t]*:'),
+    'rtype': re.compile(r'[ \t]*:'),
+    'raise': re.compile(r's?(?:[ \t]+(?P<name>[^:\n]+))?:'),
+}
+
+
+def _iter_fields(docstring):
+    """
+    Tokenize ``docstring`` in a single linear pass, yielding every
+    ``:param:``, ``:type:``, ``:return:`` / ``:returns:``, ``:rtype:`` and
+    ``:raises:`` field in it.
+
+    :param docstring: docstring to parse
+    :type docstring: str
+    :return: generator of (kind, name, body) 3-tuples, where kind is one of
+      ``param``, ``type``, ``return``, ``rtype`` or ``raise``; name is the
+      stripped field name (or None for fields without one) and body is the
+      field text with whitespace collapsed.
+    """
+    # the field currently being read: (kind, name, body start offset)
+    current = None
+    for m in _marker_re.finditer(docstring):
+        pos = m.start()
+        if current is not None:
+            yield _field(docstring, current, pos)
+            current = None
+        line_start = docstring.rfind('\n', 0, pos) + 1
+        if docstring[line_start:pos].strip(' \t') != '':
+            # not at the start of a line
+            continue
+        header = _header_res[m.group(1)].match(docstring, m.end())
+        if header is None:
+            continue
+        name = header.groupdict().get('name')
+        if name is not None:
+            name = name.strip()
+        current = (m.group(1), name, header.end())
+    if current is not None:
+        yield _field(docstring, current, len(docstring))
+
+
+def _field(docstring, current, end):
+    """
+    Helper for :py:func:`~._iter_fields`; return the (kind, name, body)
+    3-tuple for ``current``, whose body ends at offset ``end``.
+    """
+    kind, name, start = current
+    return kind, name, ' '.join(docstring[start:end].split())
+
+
+def parse_docstring(docstring):
+    """
+    Given a docstring, attempt to parse out all ``:param foo:`` and
+    ``:type foo:`` directives and their matching strings, collapsing
+    whitespace. Return a dict of keys 'params' and 'types', each being a
+    dict of name to string.
+
+    :param docstring: docstring to parse
+    :type docstring: str
+    :rtype: dict
+    """
+    res = {'params': {}, 'types': {}}
+    for kind, name, body in _iter_fields(docstring):
+        if kind == 'param':
+            res['params'][name] = body
+        elif kind == 'type':
+            res['types'][name] = body
+    return res
+
+
+class ArgumentInfo(object):
+    """
+    Description of one argument accepted by a class's ``__init__`` method, as
+    returned by :py:func:`~.get_arguments`.
+    """
+
+    __slots__ = ['name', 'has_default', 'default', 'type', 'description']
+
+    def __init__(self, name, has_default=False, default=None, type=None,
+                 description=None):
+        """
+        :param name: argument name
+        :type name: str
+        :param has_default: whether the argument has a default value (i.e.
+          is optional)
+        :type has_default: bool
+        :param default: the argument's default value, if ``has_default``
+        :param type: the argument's type, from the ``:type:`` docstring field
+        :type type: str
+        :param description: the argument's description, from the
+          ``:param:`` docstring field
+        :type description: str
+        """
+        self.name = name
+        self.has_default = has_default
+        self.default = default
+        self.type = type
+        self.description = description
+
+    @property
+    def varname(self):
+        """
+        :return: the argument name, followed by ``=`` and its default value
+          if it has one
+        :rtype: str
+        """
+        if self.has_default:
+            return '%s=%s' % (self.name, self.default)
+        return self.name
+
+    @property
+    def help(self):
+        """
+        :return: the argument's type in parentheses (if known) followed by
+          its description (if known)
+        :rtype: str
+        """
+        s = ''
+        if self.type is not None:
+            s = '(%s) ' % self.type
+        if self.description is not None:
+            s += self.description
+        return s
+
+    def as_dict(self):
+        """
+        :return: this argument's attributes as a dict
+        :rtype: dict
+        """
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, ArgumentInfo):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    def __repr__(self):
+        return '<ArgumentInfo %s>' % self.as_dict()
+
+
+class ClassInfo(object):
+    """
+    Help information about a plugin class: its name, ``_description`` and the
+    arguments its ``__init__`` method accepts.
+    """
+
+    __slots__ = ['name', 'description', 'arguments']
+
+    def __init__(self, name, description=None, arguments=()):
+        """
+        :param name: the class name
+        :type name: str
+        :param description: the class's ``_description`` attribute, if any
+        :type description: str
+        :param arguments: the arguments accepted by the class's ``__init__``
+        :type arguments: tuple of :py:class:`~.ArgumentInfo`
+        """
+        self.name = name
+        self.description = description
+        self.arguments = tuple(arguments)
+
+    def varnames(self):
+        """
+        :return: dict of argument :py:attr:`~.ArgumentInfo.varname` to
+          :py:attr:`~.ArgumentInfo.help`
+        :rtype: dict
+        """
+        return dict((arg.varname, arg.help) for arg in self.arguments)
+
+    def as_dict(self):
+        """
+        :return: this class info as a dict, with arguments as a list of dicts
+        :rtype: dict
+        """
+        return {
+            'name': self.name,
+            'description': self.description,
+            'arguments': [a.as_dict() for a in self.arguments]
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Construct a ClassInfo from the output of :py:meth:`~.as_dict`.
+
+        :param d: dict to construct from
+        :type d: dict
+        :rtype: ClassInfo
+        """
+        return cls(
+            d['name'], description=d['description'],
+            arguments=[ArgumentInfo(**a) for a in d['arguments']]
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, ClassInfo):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    def __repr__(self):
+        return '<ClassInfo %s>' % self.as_dict()
+
+
+def _signature_args(func):
+    """
+    Return a list of (name, has_default, default) 3-tuples for the named
+    arguments of ``func`` (an ``__init__`` method), excluding the first
+    (``self``) argument and any ``*args`` or ``**kwargs``.
+    """
+    if hasattr(inspect, 'signature'):
+        try:
+            params = list(inspect.signature(func).parameters.values())
+        except (TypeError, ValueError):
+            return []
+        return [
+            (p.name, p.default is not p.empty,
+             None if p.default is p.empty else p.default)
+            for p in params[1:]
+            if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)
+        ]
+    # Python 2
+    try:
+        spec = inspect.getargspec(func)
+    except TypeError:
+        # i.e. object.__init__, which is not a Python function
+        return []
+    args = spec.args[1:]
+    defaults = spec.defaults or ()
+    num_required = len(args) - len(defaults)
+    return [
+        (name, idx >= num_required,
+         defaults[idx - num_required] if idx >= num_required else None)
+        for idx, name in enumerate(args)
+    ]
+
+
+def _init_arguments(klass):
+    """
+    Introspect the arguments of ``klass.__init__``, combining its signature
+    with the ``:param:`` and ``:type:`` fields of its docstring.
+
+    :param klass: the class to introspect
+    :type klass: type
+    :return: list of :py:class:`~.ArgumentInfo`
+    :rtype: list
+    """
+    func = klass.__init__
+    docstr = parse_docstring(func.__doc__ or '')
+    return [
+        ArgumentInfo(
+            name, has_default=has_default, default=default,
+            type=docstr['types'].get(name),
+            description=docstr['params'].get(name)
+        )
+        for name, has_default, default in _signature_args(func)
+    ]
+
+
+class IntrospectionCache(object):
+    """
+    Bounded LRU cache of :py:func:`~._init_arguments` results, keyed by class
+    identity.
+    """
+
+    def __init__(self, maxsize=256):
+        """
+        :param maxsize: maximum number of classes to cache
+        :type maxsize: int
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def arguments(self, klass):
+        """
+        Return the (possibly cached) arguments of ``klass.__init__``.
+
+        :param klass: the class to introspect
+        :type klass: type
+        :return: tuple of :py:class:`~.ArgumentInfo`
+        :rtype: tuple
+        """
+        with self._lock:
+            if klass in self._cache:
+                self.hits += 1
+                # move to the most-recently-used end
+                res = self._cache.pop(klass)
+                self._cache[klass] = res
+                return res
+            self.misses += 1
+        res = tuple(_init_arguments(klass))
+        with self._lock:
+            self._cache[klass] = res
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return res
+
+    def invalidate(self, klass=None):
+        """
+        Remove ``klass`` from the cache, or clear the whole cache if
+        ``klass`` is None.
+
+        :param klass: the class to remove
+        :type klass: type
+        """
+        with self._lock:
+            if klass is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(klass, None)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+#: Process-wide default :py:class:`~.IntrospectionCache`.
+cache = IntrospectionCache()
+
+
+def get_arguments(klass):
+    """
+    Return information about the arguments accepted by ``klass.__init__``,
+    using the process-wide :py:data:`~.cache`.
+
+    :param klass: the class to introspect
+    :type klass: type
+    :return: tuple of :py:class:`~.ArgumentInfo`
+    :rtype: tuple
+    """
+    return cache.arguments(klass)
+
+
+def class_info(klass):
+    """
+    Return help information about ``klass``, using the process-wide
+    :py:data:`~.cache` for its arguments.
+
+    :param klass: the class to introspect
+    :type klass: type
+    :rtype: ClassInfo
+    """
+    return ClassInfo(
+        klass.__name__, description=getattr(klass, '_description', None),
+        arguments=get_arguments(klass)
+    )
+
+
+def invalidate(klass=None):
+    """
+    Remove ``klass`` (or, if None, all classes) from the process-wide
+    :py:data:`~.cache`.
+
+    :param klass: the class to remove
+    :type klass: type
+    """
+    cache.invalidate(klass)
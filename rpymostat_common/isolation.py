@@ -0,0 +1,297 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import logging
+import multiprocessing
+import pickle
+import sys
+import time
+
+from rpymostat_common.introspection import ClassInfo, class_info
+
+logger = logging.getLogger(__name__)
+
+# clock used for check timeouts; prefer a monotonic clock where available
+_now = getattr(time, 'monotonic', time.time)
+
+
+class PluginCheck(object):
+    """
+    Result of importing and validating a single entry point in a worker
+    process, as returned by :py:func:`~.check_entry_points`.
+    """
+
+    __slots__ = [
+        'entry_point', 'loaded', 'compatible', 'description', 'class_info',
+        'exception', 'exitcode', 'timed_out', 'duration'
+    ]
+
+    def __init__(self, entry_point):
+        """
+        :param entry_point: the entry point this check describes
+        :type entry_point: rpymostat_common.entry_points.EntryPoint
+        """
+        #: the entry point that was checked
+        self.entry_point = entry_point
+        #: whether the entry point imported successfully
+        self.loaded = False
+        #: whether the loaded object is a subclass of the ``superclass``
+        #: given to :py:func:`~.check_entry_points`
+        self.compatible = False
+        #: the loaded object's ``_description`` attribute, if any
+        self.description = None
+        #: :py:class:`~rpymostat_common.introspection.ClassInfo` for the
+        #: loaded class, if it could be introspected
+        self.class_info = None
+        #: name of the exception class raised in the worker, if any
+        self.exception = None
+        #: exit code of a worker which exited without reporting a result,
+        #: i.e. ``-11`` for a segfault; None otherwise
+        self.exitcode = None
+        #: whether the worker exceeded the ``timeout`` and was terminated
+        self.timed_out = False
+        #: wall time spent on the check, in seconds
+        self.duration = None
+
+    @property
+    def name(self):
+        """
+        :return: the entry point name
+        :rtype: str
+        """
+        return self.entry_point.name
+
+    @property
+    def passed(self):
+        """
+        :return: whether the entry point loaded and is compatible, i.e. is
+          safe to import in the parent process
+        :rtype: bool
+        """
+        return self.loaded and self.compatible
+
+    @property
+    def crashed(self):
+        """
+        :return: whether the worker exited without reporting a result
+        :rtype: bool
+        """
+        return self.exitcode is not None
+
+    @property
+    def reason(self):
+        """
+        :return: short description of why the check did not pass, or None
+        :rtype: str
+        """
+        if self.timed_out:
+            return 'timeout'
+        if self.crashed:
+            return 'exitcode %s' % self.exitcode
+        if self.exception is not None:
+            return self.exception
+        if not self.compatible:
+            return 'incompatible'
+        return None
+
+    def as_dict(self):
+        """
+        :return: this check as a JSON-serializable dict
+        :rtype: dict
+        """
+        d = dict((k, getattr(self, k)) for k in self.__slots__)
+        d['entry_point'] = self.entry_point.as_list()
+        d['name'] = self.name
+        d['group'] = self.entry_point.group
+        if self.class_info is not None:
+            d['class_info'] = self.class_info.as_dict()
+        return d
+
+    def __repr__(self):
+        return '<PluginCheck %s passed=%s reason=%s>' % (
+            self.name, self.passed, self.reason
+        )
+
+
+def _picklable(value):
+    """
+    Return ``value`` if it can be pickled (and so sent to the parent
+    process), otherwise its ``repr()``.
+    """
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return repr(value)
+    return value
+
+
+def _check_worker(entry_point, superclass, conn):
+    """
+    Worker process target: import and validate ``entry_point``, and send the
+    result dict over ``conn``. The ``_description`` and argument default
+    values are sent as their ``repr()`` if they cannot be pickled.
+    """
+    result = {
+        'loaded': False, 'compatible': False, 'description': None,
+        'class_info': None, 'exception': None
+    }
+    try:
+        obj = entry_point.load()
+        result['loaded'] = True
+        result['description'] = _picklable(getattr(obj, '_description', None))
+        result['compatible'] = (
+            superclass is None or
+            isinstance(obj, type) and issubclass(obj, superclass)
+        )
+        if isinstance(obj, type):
+            info = class_info(obj).as_dict()
+            info['description'] = _picklable(info['description'])
+            for arg in info['arguments']:
+                arg['default'] = _picklable(arg['default'])
+            result['class_info'] = info
+    except:
+        result['exception'] = sys.exc_info()[0].__name__
+    try:
+        conn.send(result)
+    except Exception:
+        logger.debug('Unable to send check result for %s; sending it '
+                     'without metadata', entry_point.name, exc_info=1)
+        result['description'] = None
+        result['class_info'] = None
+        conn.send(result)
+    conn.close()
+
+
+def check_entry_points(entry_points, superclass=None, processes=None,
+                       timeout=None, poll_interval=0.01):
+    """
+    Import and validate each of ``entry_points`` in its own short-lived
+    worker process, running up to ``processes`` at a time, so that plugins
+    which crash, leak memory or hang at import time cannot affect the
+    calling process. Nothing is imported in the calling process.
+
+    :param entry_points: the entry points to check
+    :type entry_points: list
+    :param superclass: if specified, entry points are only compatible if
+      they load a subclass of this class / classinfo; it must be importable
+      by the worker processes
+    :type superclass: ``class or classinfo``
+    :param processes: maximum number of concurrent worker processes;
+      defaults to the number of CPUs
+    :type processes: int
+    :param timeout: maximum time in seconds to allow for each check, or None
+      for no limit
+    :type timeout: float
+    :param poll_interval: how often to poll workers, in seconds
+    :type poll_interval: float
+    :return: list of :py:class:`~.PluginCheck`, in the same order as
+      ``entry_points``
+    :rtype: list
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    checks = [PluginCheck(ep) for ep in entry_points]
+    pending = list(reversed(checks))
+    running = []
+    while pending or running:
+        while pending and len(running) < processes:
+            check = pending.pop()
+            logger.debug('Checking entry point in worker process: %s',
+                         check.name)
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(
+                target=_check_worker,
+                args=(check.entry_point, superclass, child_conn)
+            )
+            proc.daemon = True
+            proc.start()
+            child_conn.close()
+            running.append((check, proc, parent_conn, _now()))
+        finished = []
+        for item in running:
+            if _poll_worker(item, timeout):
+                finished.append(item)
+        for item in finished:
+            running.remove(item)
+            item[2].close()
+        if not finished:
+            time.sleep(poll_interval)
+    return checks
+
+
+def _poll_worker(item, timeout):
+    """
+    Update a running check from its worker, returning whether the check is
+    finished.
+    """
+    check, proc, conn, started = item
+    duration = _now() - started
+    if conn.poll():
+        try:
+            result = conn.recv()
+        except EOFError:
+            # worker exited without sending a result
+            proc.join()
+            check.exitcode = proc.exitcode
+            logger.warning('Worker checking entry point %s exited with '
+                           'code %s', check.name, check.exitcode)
+        else:
+            proc.join()
+            for k in ('loaded', 'compatible', 'description', 'exception'):
+                setattr(check, k, result[k])
+            if result['class_info'] is not None:
+                check.class_info = ClassInfo.from_dict(result['class_info'])
+        check.duration = duration
+        return True
+    if not proc.is_alive():
+        if conn.poll():
+            # result arrived between the poll and the liveness check
+            return _poll_worker(item, timeout)
+        check.exitcode = proc.exitcode
+        check.duration = duration
+        logger.warning('Worker checking entry point %s exited with code %s',
+                       check.name, check.exitcode)
+        return True
+    if timeout is not None and duration >= timeout:
+        logger.warning('Timed out after %s seconds checking entry point %s',
+                       timeout, check.name)
+        proc.terminate()
+        proc.join()
+        check.timed_out = True
+        check.duration = duration
+        return True
+    return False
@@ -35,138 +35,1324 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ##################################################################################
 """
 
+import fnmatch
+import gc
+import itertools
+import json
 import logging
-import pkg_resources
-import re
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import ModuleType
+
+from rpymostat_common.entry_points import (
+    iter_entry_points, select_entry_points, normalize_tag
+)
+from rpymostat_common.introspection import (
+    ClassInfo, class_info, get_arguments
+)
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 
 logger = logging.getLogger(__name__)
 
+# clock used for load timeouts; prefer a monotonic clock where available, as
+# the wall clock commonly jumps when NTP syncs during boot.
+_now = getattr(time, 'monotonic', time.time)
+
+# marker for an entry point which did not load within its time budget
+_TIMED_OUT = object()
+
+
+class LazyPlugin(object):
+    """
+    Lightweight handle for a plugin entry point which has not been imported
+    yet, as returned by :py:func:`~.load_classes` with ``lazy=True``. The
+    entry point is only loaded on first real use of the handle: calling it
+    (i.e. to instantiate the class), accessing any attribute other than the
+    ones defined here, or calling :py:meth:`~.load`.
+
+    Note that handles are not classes themselves; use :py:meth:`~.load` to
+    get the actual class, i.e. for ``issubclass()`` checks.
+    """
+
+    __slots__ = ['entry_point', 'superclass', '_obj']
+
+    def __init__(self, entry_point, superclass=None):
+        """
+        :param entry_point: the entry point to load
+        :type entry_point: rpymostat_common.entry_points.EntryPoint
+        :param superclass: if specified, raise TypeError on load if the
+          loaded object is not a subclass of this class / classinfo
+        :type superclass: ``class or classinfo``
+        """
+        self.entry_point = entry_point
+        self.superclass = superclass
+        self._obj = None
+
+    @property
+    def name(self):
+        """
+        :return: the entry point name
+        :rtype: str
+        """
+        return self.entry_point.name
+
+    @property
+    def target(self):
+        """
+        :return: the entry point target, i.e. ``module.name:ClassName``
+        :rtype: str
+        """
+        return self.entry_point.value
+
+    @property
+    def __name__(self):
+        """
+        The name of the target object, determined without loading it.
+        """
+        attrs = self.entry_point.attrs
+        if len(attrs) > 0:
+            return attrs[-1]
+        return self.entry_point.module_name
+
+    @property
+    def loaded(self):
+        """
+        :return: whether or not the entry point has been loaded yet
+        :rtype: bool
+        """
+        return self._obj is not None
+
+    def load(self):
+        """
+        Load (if not already loaded) and return the entry point's target.
+
+        :return: the loaded object (usually a class)
+        :raises: TypeError if ``superclass`` was specified and the loaded
+          object is not a subclass of it
+        """
+        if self._obj is None:
+            logger.debug('Lazy-loading entry point: %s', self.name)
+            obj = self.entry_point.load()
+            if (
+                self.superclass is not None and
+                not issubclass(obj, self.superclass)
+            ):
+                raise TypeError('Entry point %s (%s) is not a subclass of %s'
+                                '' % (self.name, self.target,
+                                      self.superclass))
+            self._obj = obj
+        return self._obj
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name in LazyPlugin.__slots__ or name.startswith('__'):
+            # unset slot or special method lookup, i.e. from copy or pickle
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __getstate__(self):
+        return self.entry_point, self.superclass
+
+    def __setstate__(self, state):
+        self.entry_point, self.superclass = state
+        self._obj = None
+
+    def __repr__(self):
+        return '<LazyPlugin %s = %s (%s)>' % (
+            self.name, self.target, 'loaded' if self.loaded else 'not loaded'
+        )
+
+
+class PluginLoadRecord(object):
+    """
+    Instrumentation record for loading a single entry point, as delivered to
+    the ``report`` callback of :py:func:`~.load_classes`.
+    """
+
+    __slots__ = [
+        'name', 'target', 'group', 'dist_name', 'dist_version', 'loaded',
+        'duration', 'exception', 'timed_out', 'memory_delta', 'rejected',
+        'skipped', 'modules'
+    ]
+
+    def __init__(self, entry_point):
+        """
+        :param entry_point: the entry point this record describes
+        :type entry_point: rpymostat_common.entry_points.EntryPoint
+        """
+        #: entry point name
+        self.name = entry_point.name
+        #: entry point target, i.e. ``module.name:ClassName``
+        self.target = entry_point.value
+        #: entry point group
+        self.group = entry_point.group
+        #: name of the distribution providing the entry point
+        self.dist_name = entry_point.dist_name
+        #: version of the distribution providing the entry point
+        self.dist_version = entry_point.dist_version
+        #: whether the entry point was loaded successfully
+        self.loaded = False
+        #: wall time spent loading the entry point, in seconds
+        self.duration = None
+        #: name of the exception class raised while loading, if any
+        self.exception = None
+        #: whether loading exceeded the ``timeout`` budget
+        self.timed_out = False
+        #: change in memory allocated by Python (per :py:mod:`tracemalloc`)
+        #: while loading, in bytes; None if not available
+        self.memory_delta = None
+        #: whether the loaded object was rejected by the ``superclass`` check
+        self.rejected = False
+        #: whether the entry point was not loaded at all because it failed
+        #: recently (per :py:class:`~.NegativeCache`)
+        self.skipped = False
+        #: names of the modules newly imported while loading, if tracked
+        #: (see the ``unload_rejected`` option); otherwise None
+        self.modules = None
+
+    def as_dict(self):
+        """
+        :return: this record as a dict
+        :rtype: dict
+        """
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __repr__(self):
+        return '<PluginLoadRecord %s>' % self.as_dict()
+
+
+class UnloadReport(object):
+    """
+    Result of :py:func:`~.unload_modules`.
+    """
+
+    __slots__ = ['removed', 'retained', 'rss_before', 'rss_after']
+
+    def __init__(self, removed, retained, rss_before, rss_after):
+        #: names of the modules removed from ``sys.modules``
+        self.removed = removed
+        #: names of the modules which were kept because something outside
+        #: the unloaded set still references them
+        self.retained = retained
+        #: resident set size in bytes before and after unloading, or None
+        #: if it cannot be determined on this platform
+        self.rss_before = rss_before
+        self.rss_after = rss_after
+
+    @property
+    def reclaimed_rss(self):
+        """
+        The decrease in resident set size, in bytes, or None if unknown.
+        Note that the Python allocator does not always return freed memory
+        to the operating system, so this may be less than the memory the
+        unloaded modules actually used.
+
+        :rtype: int
+        """
+        if self.rss_before is None or self.rss_after is None:
+            return None
+        return self.rss_before - self.rss_after
+
+    def as_dict(self):
+        """
+        :return: this report as a dict
+        :rtype: dict
+        """
+        d = dict((k, getattr(self, k)) for k in self.__slots__)
+        d['reclaimed_rss'] = self.reclaimed_rss
+        return d
+
+    def __repr__(self):
+        return '<UnloadReport %s>' % self.as_dict()
+
+
+def _current_rss():
+    """
+    Return the current resident set size of this process in bytes, from
+    ``/proc/self/statm``, or None if unavailable.
+    """
+    try:
+        with open('/proc/self/statm') as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _internal_refs(modules, retained):
+    """
+    Count the references to each of ``modules`` held in the namespaces of
+    the others (excluding those named in ``retained``).
+
+    :param modules: module name to module object
+    :type modules: dict
+    :param retained: names of modules whose references are external
+    :type retained: set
+    :return: module name to count of internal references
+    :rtype: dict
+    """
+    counts = dict((name, 0) for name in modules)
+    by_id = dict((id(mod), name) for name, mod in modules.items())
+    for name, mod in modules.items():
+        if name in retained:
+            continue
+        for value in vars(mod).values():
+            if id(value) in by_id:
+                counts[by_id[id(value)]] += 1
+    return counts
+
+
+#: the namespace descriptor of plain module objects
+_module_dict = ModuleType.__dict__['__dict__']
+
+
+def _object_refs(modules, names):
+    """
+    Return the names, among ``names``, of the modules that objects in the
+    namespaces of ``modules`` were defined in, according to their
+    ``__module__`` attribute (and those of their base classes, for
+    classes); i.e. ``from helper import Thing`` in one of ``modules``
+    references ``helper`` through ``Thing``.
+
+    :param modules: module objects whose namespaces to check
+    :type modules: list
+    :param names: names of the modules of interest
+    :type names: set
+    :return: set of module names, or None if the ``__module__`` of a value
+      could not be determined
+    :rtype: set
+    """
+    result = set()
+    for mod in modules:
+        if not isinstance(mod, ModuleType):
+            continue
+        # bypass any ``__dict__`` override, i.e. lazy modules which import
+        # all of their attributes when it is accessed
+        namespace = _module_dict.__get__(mod)
+        for value in list(namespace.values()):
+            if isinstance(value, ModuleType):
+                # references to modules themselves are found by reference
+                # count; lazy modules may import on attribute access
+                continue
+            objs = [value]
+            if isinstance(value, type):
+                objs = value.__mro__
+            for obj in objs:
+                try:
+                    mod_name = getattr(obj, '__module__', None)
+                except Exception:
+                    return None
+                if isinstance(mod_name, str) and mod_name in names:
+                    result.add(mod_name)
+    return result
+
+
+def unload_modules(names):
+    """
+    Remove the named modules from ``sys.modules`` (and from their parent
+    package's attributes), and garbage-collect them. Any module which is
+    still referenced from elsewhere (i.e. imported by a module that is being
+    kept) is restored, so that it is never imported twice, as is any
+    package with a submodule that remains loaded, and any module that
+    defined an object (by its ``__module__``) referenced from a module that
+    is being kept. If that cannot be determined, nothing is unloaded.
+
+    This relies on reference counts, so on Python implementations without
+    :py:func:`sys.getrefcount` (i.e. PyPy) nothing is unloaded.
 
-def load_classes(entrypoint_name, superclass=None):
+    :param names: names of the modules to unload
+    :type names: list
+    :return: what was unloaded, and the change in RSS
+    :rtype: UnloadReport
     """
-    Attempt to load all pkg_resources entrypoints matching the given name,
-    and return a list of the objects they load (usually classes). If
-    ``superclass`` is specified, restrict the returned list to those which are
-    subclasses of ``superclass``.
+    rss_before = _current_rss()
+    getrefcount = getattr(sys, 'getrefcount', None)
+    if getrefcount is None:
+        logger.debug('Cannot unload modules without sys.getrefcount()')
+        return UnloadReport([], sorted(set(names)), rss_before, rss_before)
+    names = set(names)
+    removed = {}
+    parents = {}
+    for name in sorted(names, reverse=True):
+        mod = sys.modules.pop(name, None)
+        if mod is None:
+            continue
+        removed[name] = mod
+        parent, _, child = name.rpartition('.')
+        if parent and getattr(sys.modules.get(parent), child, None) is mod:
+            delattr(sys.modules[parent], child)
+            parents[name] = (sys.modules[parent], child)
+    mod = None
+    gc.collect()
+    # objects imported from a module (i.e. ``from helper import Thing``)
+    # keep it in use without referencing the module object itself
+    referenced = _object_refs(list(sys.modules.values()), removed)
+    # a removed module referenced only from the namespaces of other removed
+    # modules is freed along with them; once a module is retained, its
+    # references count as external too, so repeat until stable
+    retained = set()
+    while True:
+        if referenced is None:
+            logger.debug('Cannot determine which modules are in use by '
+                         'their objects; not unloading any')
+            retained = set(removed)
+            break
+        internal = _internal_refs(removed, retained)
+        # other references: the ``removed`` dict and getrefcount's argument
+        newly = set(
+            name for name in removed if name not in retained and (
+                name in referenced or
+                getrefcount(removed[name]) - internal[name] > 2
+            )
+        )
+        # packages must stay loaded if any of their submodules do
+        for name in set(sys.modules) | retained | newly:
+            parent = name.rpartition('.')[0]
+            while parent:
+                if parent in removed and parent not in retained:
+                    newly.add(parent)
+                parent = parent.rpartition('.')[0]
+        if not newly:
+            break
+        retained.update(newly)
+        refs = _object_refs([removed[n] for n in newly], removed)
+        referenced = None if refs is None else referenced | refs
+    for name in retained:
+        sys.modules[name] = removed[name]
+        if name in parents:
+            setattr(parents[name][0], parents[name][1], removed[name])
+    unloaded = sorted(set(removed) - retained)
+    for name in unloaded:
+        del removed[name]
+    removed = None
+    gc.collect()
+    result = UnloadReport(unloaded, sorted(retained), rss_before,
+                          _current_rss())
+    logger.debug('Unloaded modules: %s', result)
+    return result
+
+
+class NegativeCache(object):
+    """
+    In-process record of entry points which failed (or timed out) while
+    loading, so that :py:func:`~.load_classes` does not retry a known-bad
+    import on every call. Failures are keyed by entry point group, entry
+    point name and distribution version, so upgrading (or downgrading) the
+    distribution that provides a plugin makes it eligible to load again
+    immediately; otherwise it is retried once ``ttl`` seconds have passed
+    since the failure.
+    """
+
+    def __init__(self, ttl=300):
+        """
+        :param ttl: number of seconds to skip a failed entry point for, or
+          None to skip it until the distribution version changes
+        :type ttl: float
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> dict of failure details; see :py:meth:`~.failures`
+        self._failures = {}
+
+    @staticmethod
+    def _key(entry_point):
+        return (
+            entry_point.group, entry_point.name, entry_point.dist_version
+        )
+
+    def _expired(self, failure, now):
+        return self.ttl is not None and now - failure['failed_at'] >= self.ttl
+
+    def add(self, entry_point, reason=None):
+        """
+        Record that an entry point failed to load.
+
+        :param entry_point: the entry point that failed
+        :type entry_point: rpymostat_common.entry_points.EntryPoint
+        :param reason: short description of the failure, i.e. the exception
+          class name
+        :type reason: str
+        """
+        now = _now()
+        with self._lock:
+            self._prune(now)
+            self._failures[self._key(entry_point)] = {
+                'group': entry_point.group,
+                'name': entry_point.name,
+                'target': entry_point.value,
+                'dist_name': entry_point.dist_name,
+                'dist_version': entry_point.dist_version,
+                'reason': reason,
+                'failed_at': now,
+                'skipped': 0
+            }
+
+    def discard(self, entry_point):
+        """
+        Forget any recorded failure for an entry point, i.e. after it loaded
+        successfully.
+
+        :param entry_point: the entry point
+        :type entry_point: rpymostat_common.entry_points.EntryPoint
+        """
+        with self._lock:
+            self._failures.pop(self._key(entry_point), None)
+
+    def should_skip(self, entry_point):
+        """
+        Return whether an entry point has a current (unexpired) failure
+        recorded for its distribution version. If so, the failure's skip
+        count is incremented.
+
+        :param entry_point: the entry point
+        :type entry_point: rpymostat_common.entry_points.EntryPoint
+        :return: whether the entry point should be skipped
+        :rtype: bool
+        """
+        key = self._key(entry_point)
+        now = _now()
+        with self._lock:
+            failure = self._failures.get(key)
+            if failure is None:
+                return False
+            if self._expired(failure, now):
+                del self._failures[key]
+                return False
+            failure['skipped'] += 1
+            return True
+
+    def __contains__(self, entry_point):
+        """
+        Return whether an entry point has a current (unexpired) failure
+        recorded, without counting it as skipped.
+        """
+        key = self._key(entry_point)
+        with self._lock:
+            failure = self._failures.get(key)
+            return failure is not None and not self._expired(failure, _now())
+
+    def _prune(self, now):
+        for key, failure in list(self._failures.items()):
+            if self._expired(failure, now):
+                del self._failures[key]
+
+    def failures(self):
+        """
+        Return details of all current (unexpired) failures, for diagnostics.
+        Each is a dict with keys ``group``, ``name``, ``target``,
+        ``dist_name``, ``dist_version``, ``reason`` (exception class name,
+        or ``'timeout'``), ``age`` (seconds since the failure) and
+        ``skipped`` (number of loads that skipped the entry point since).
+
+        :return: list of failure dicts, sorted by group and name
+        :rtype: list
+        """
+        now = _now()
+        with self._lock:
+            self._prune(now)
+            result = []
+            for failure in self._failures.values():
+                d = dict(failure)
+                d['age'] = now - d.pop('failed_at')
+                result.append(d)
+        return sorted(result, key=lambda d: (str(d['group']), str(d['name'])))
+
+    def skipped(self):
+        """
+        Return details of the current failures which have caused an entry
+        point to be skipped at least once; see :py:meth:`~.failures`.
+
+        :return: list of failure dicts
+        :rtype: list
+        """
+        return [f for f in self.failures() if f['skipped'] > 0]
+
+    def clear(self):
+        """
+        Forget all recorded failures.
+        """
+        with self._lock:
+            self._failures.clear()
+
+    def __len__(self):
+        with self._lock:
+            self._prune(_now())
+            return len(self._failures)
+
+
+#: default :py:class:`~.NegativeCache` used by :py:func:`~.load_classes`
+default_negative_cache = NegativeCache()
+
+
+def load_classes(entrypoint_name, superclass=None, lazy=False,
+                 max_workers=None, timeout=None, report=None,
+                 negative_cache=True, names=None, isolated=False,
+                 unload_rejected=False):
+    """
+    Attempt to load all entrypoints matching the given name, and return a
+    list of the objects they load (usually classes). If ``superclass`` is
+    specified, restrict the returned list to those which are subclasses of
+    ``superclass``.
+
+    If ``lazy`` is True, nothing is imported; instead a
+    :py:class:`~.LazyPlugin` handle is returned for every entry point in the
+    group, which imports its target on first use. In this case the
+    ``superclass`` check is deferred until the handle is loaded, and loading
+    errors are raised to the caller at that time.
+
+    If ``max_workers`` or ``timeout`` is specified, entry points are imported
+    concurrently on up to ``max_workers`` (default 1) threads, and any entry
+    point that takes longer than ``timeout`` seconds to import is logged and
+    skipped, just like one that raised an exception. The returned list is in
+    the same order as when importing sequentially. Note that a timed-out
+    import cannot be interrupted, and continues in a daemon thread. Imports
+    only actually run concurrently on Python 3.3 and newer; older versions
+    serialize them with a global import lock.
+
+    If ``report`` is specified, it is called with a
+    :py:class:`~.PluginLoadRecord` for every entry point in the group, after
+    that entry point is loaded (or fails to load). Pass ``list.append`` of a
+    list to collect the whole report. When reporting on a sequential load,
+    :py:mod:`tracemalloc` (if available) is used to record the change in
+    memory allocated during each import, and is started for the duration of
+    the load if it is not already tracing.
+
+    Entry points which fail (or time out) while loading are recorded in a
+    :py:class:`~.NegativeCache`, and skipped by later calls until their
+    distribution's version changes or the cache's TTL expires; skipped entry
+    points are reported with ``skipped`` set. By default the module-level
+    :py:data:`~.default_negative_cache` is used; pass False to disable this,
+    or a :py:class:`~.NegativeCache` instance to use instead.
+
+    Entry points may declare the base classes or capability tags their
+    target provides as ``provides.`` extras (see
+    :py:attr:`rpymostat_common.entry_points.EntryPoint.provides`). When
+    ``superclass`` is specified, entry points which declare tags but none
+    that match ``superclass`` (its dotted ``module.ClassName``, or its
+    ``_plugin_tag`` attribute) are rejected without being imported; those
+    that match, or declare nothing, are still checked with ``issubclass()``
+    after import. Plugins must therefore declare every base class that
+    loaders may filter on, not only their direct base class.
+
+    If ``names`` is specified, entry points with other names are ignored
+    entirely; pass the names of the configured plugins to avoid importing
+    the others.
+
+    If ``isolated`` is True, each entry point is first imported and
+    validated in its own worker process (see
+    :py:func:`rpymostat_common.isolation.check_entry_points`), with
+    ``max_workers`` and ``timeout`` applying to the workers instead, and
+    only the entry points which loaded and are subclasses of ``superclass``
+    are then imported in this process. This protects the calling process
+    from plugins which crash, leak memory or hang at import time.
+
+    If ``unload_rejected`` is True (or a callable), the modules newly
+    imported by each entry point are recorded in its
+    :py:class:`~.PluginLoadRecord`, and after loading, those imported by
+    entry points which failed or were rejected by ``superclass`` are removed
+    from ``sys.modules`` so that their memory can be reclaimed; see
+    :py:func:`~.unload_modules`. A callable is passed the resulting
+    :py:class:`~.UnloadReport`. This requires sequential loading, i.e. it
+    cannot be combined with ``max_workers`` or ``timeout`` (unless
+    ``isolated``, in which case rejected entry points are never imported
+    here anyway).
+
+    Entry points are found via the persistent
+    :py:class:`~rpymostat_common.entry_points.EntryPointIndex`, so installed
+    distributions are only scanned when something was installed or removed.
 
     :param entrypoint_name: name of the entrypoint to load
     :type entrypoint_name: str
     :param superclass: if specified, restrict the return value to only
       subclasses of this class / classinfo
     :type superclass: ``class or classinfo``
+    :param lazy: whether to return :py:class:`~.LazyPlugin` handles instead
+      of importing the entry points
+    :type lazy: bool
+    :param max_workers: maximum number of entry points to import concurrently
+    :type max_workers: int
+    :param timeout: maximum time in seconds to allow for importing each entry
+      point, or None for no limit
+    :type timeout: float
+    :param report: callable to pass a :py:class:`~.PluginLoadRecord` to for
+      each entry point
+    :type report: callable
+    :param negative_cache: negative cache to use; True for the module
+      default, or False/None to disable
+    :type negative_cache: :py:class:`~.NegativeCache` or bool
+    :param names: if specified, only load entry points with these names,
+      i.e. the configured plugins
+    :type names: ``list`` or ``set``
+    :param isolated: whether to check entry points in worker processes
+      before importing them
+    :type isolated: bool
+    :param unload_rejected: whether to unload modules imported only by
+      rejected or failed entry points; True, or a callable to pass the
+      :py:class:`~.UnloadReport` to
+    :type unload_rejected: ``bool`` or ``callable``
     :return: list of loaded entrypoints (usually classes)
     :rtype: list
     """
     logger.debug("Loading classes for entrypoint: %s", entrypoint_name)
+    return _load_group(
+        entrypoint_name, iter_entry_points(entrypoint_name),
+        superclass=superclass, lazy=lazy, max_workers=max_workers,
+        timeout=timeout, report=report, negative_cache=negative_cache,
+        names=names, isolated=isolated, unload_rejected=unload_rejected
+    )
+
+
+def load_groups(groups, superclass=None, lazy=False, max_workers=None,
+                timeout=None, report=None, negative_cache=True, names=None,
+                isolated=False, unload_rejected=False):
+    """
+    Load the entry points of several groups at once, from a single pass over
+    the entry point index, and return a dict of group name to the list of
+    objects loaded from it (usually classes). This is equivalent to calling
+    :py:func:`~.load_classes` for each group, and all other arguments have
+    the same meaning.
+
+    ``groups`` may contain exact group names and/or shell-style wildcard
+    patterns such as ``rpymostat.*``; see
+    :py:meth:`rpymostat_common.entry_points.EntryPointIndex.select`. Exact
+    group names are always present in the result.
+
+    ``superclass`` may be a single class / classinfo applied to every group,
+    or a dict of group name to class / classinfo; groups not in the dict are
+    not filtered.
+
+    :param groups: entry point group name or pattern, or list of them
+    :type groups: ``str`` or ``list``
+    :param superclass: class / classinfo to restrict all groups to, or dict
+      of group name to class / classinfo
+    :type superclass: ``class``, ``classinfo`` or ``dict``
+    :param lazy: whether to return :py:class:`~.LazyPlugin` handles instead
+      of importing the entry points
+    :type lazy: bool
+    :param max_workers: maximum number of entry points to import concurrently
+    :type max_workers: int
+    :param timeout: maximum time in seconds to allow for importing each entry
+      point, or None for no limit
+    :type timeout: float
+    :param report: callable to pass a :py:class:`~.PluginLoadRecord` to for
+      each entry point
+    :type report: callable
+    :param negative_cache: negative cache to use; True for the module
+      default, or False/None to disable
+    :type negative_cache: :py:class:`~.NegativeCache` or bool
+    :param names: if specified, only load entry points with these names,
+      i.e. the configured plugins
+    :type names: ``list`` or ``set``
+    :param isolated: whether to check entry points in worker processes
+      before importing them
+    :type isolated: bool
+    :param unload_rejected: whether to unload modules imported only by
+      rejected or failed entry points; True, or a callable to pass the
+      :py:class:`~.UnloadReport` to
+    :type unload_rejected: ``bool`` or ``callable``
+    :return: OrderedDict of group name to list of loaded entrypoints
+    :rtype: collections.OrderedDict
+    """
+    selected = select_entry_points(groups)
+    logger.debug("Loading classes for entrypoint groups: %s", list(selected))
+    result = OrderedDict()
+    for group, entry_points in selected.items():
+        if isinstance(superclass, dict):
+            group_superclass = superclass.get(group, None)
+        else:
+            group_superclass = superclass
+        logger.debug("Loading classes for entrypoint: %s", group)
+        result[group] = _load_group(
+            group, entry_points, superclass=group_superclass, lazy=lazy,
+            max_workers=max_workers, timeout=timeout, report=report,
+            negative_cache=negative_cache, names=names, isolated=isolated,
+            unload_rejected=unload_rejected
+        )
+    return result
+
+
+def _load_group(entrypoint_name, entry_points, superclass=None, lazy=False,
+                max_workers=None, timeout=None, report=None,
+                negative_cache=True, names=None, isolated=False,
+                unload_rejected=False):
+    """
+    Load the given entry points of a single group; see
+    :py:func:`~.load_classes` for the other arguments.
+
+    :param entrypoint_name: name of the entrypoint group
+    :type entrypoint_name: str
+    :param entry_points: iterable of the group's entry points
+    :type entry_points: iterable
+    :return: list of loaded entrypoints (usually classes)
+    :rtype: list
+    """
+    if names is not None:
+        entry_points = [ep for ep in entry_points if ep.name in names]
+    if superclass is not None:
+        entry_points = _prefilter(entry_points, superclass, report)
+    negative_cache = _resolve_negative_cache(negative_cache)
+    if isolated:
+        entry_points = _check_isolated(
+            _skip_failed(entry_points, negative_cache, report), superclass,
+            max_workers, timeout, report, negative_cache
+        )
+        max_workers = timeout = None
+    if unload_rejected and (max_workers is not None or timeout is not None):
+        raise ValueError('unload_rejected cannot be used with max_workers '
+                         'or timeout')
+    if lazy:
+        classes = [
+            LazyPlugin(ep, superclass=superclass) for ep in entry_points
+        ]
+        logger.debug("%s lazy plugin handles for entrypoint %s: %s",
+                     len(classes), entrypoint_name,
+                     [c.name for c in classes])
+        return classes
+    entry_points = _skip_failed(entry_points, negative_cache, report)
+    trace_memory = (
+        report is not None and tracemalloc is not None and
+        max_workers is None and timeout is None
+    )
+    started_tracing = False
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    if max_workers is None and timeout is None:
+        loaded = _load_sequential(entry_points, trace_memory=trace_memory,
+                                  track_modules=bool(unload_rejected))
+    else:
+        loaded = _load_threaded(entry_points, max_workers or 1, timeout)
     classes = []
-    for entry_point in pkg_resources.iter_entry_points(entrypoint_name):
+    unload = []
+    try:
+        for entry_point, obj, record in loaded:
+            if _finish_load(entry_point, obj, record, superclass,
+                            negative_cache, report):
+                classes.append(obj)
+            elif record.modules:
+                unload.extend(record.modules)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    if unload_rejected:
+        result = unload_modules(unload)
+        if callable(unload_rejected):
+            unload_rejected(result)
+    logger.debug("%s classes loaded successfully for entrypoint %s: %s",
+                 len(classes), entrypoint_name, [c.__name__ for c in classes])
+    return classes
+
+
+def _resolve_negative_cache(negative_cache):
+    """
+    Resolve the ``negative_cache`` argument of :py:func:`~.load_classes` to
+    a :py:class:`~.NegativeCache` instance, or None if disabled.
+    """
+    if negative_cache is True:
+        return default_negative_cache
+    if negative_cache is False:
+        return None
+    return negative_cache
+
+
+def _finish_load(entry_point, obj, record, superclass, negative_cache,
+                 report):
+    """
+    Process the result of loading one entry point: update
+    ``negative_cache``, apply the ``superclass`` check and pass the record
+    to ``report``.
+
+    :param entry_point: the entry point that was loaded
+    :type entry_point: rpymostat_common.entry_points.EntryPoint
+    :param obj: the loaded object, or None if loading failed
+    :param record: the load record
+    :type record: :py:class:`~.PluginLoadRecord`
+    :param superclass: class / classinfo to require, or None
+    :type superclass: ``class or classinfo``
+    :param negative_cache: negative cache to update, or None
+    :type negative_cache: :py:class:`~.NegativeCache`
+    :param report: callable to pass ``record`` to, or None
+    :type report: callable
+    :return: whether ``obj`` was loaded and accepted
+    :rtype: bool
+    """
+    if negative_cache is not None:
+        if record.loaded:
+            negative_cache.discard(entry_point)
+        else:
+            negative_cache.add(
+                entry_point,
+                'timeout' if record.timed_out else record.exception
+            )
+    accepted = False
+    if record.loaded:
+        try:
+            if superclass is None or issubclass(obj, superclass):
+                accepted = True
+            else:
+                record.rejected = True
+        except:
+            logger.debug('Exception raised when loading entry point '
+                         '%s', entry_point.name, exc_info=1)
+            record.rejected = True
+            record.exception = sys.exc_info()[0].__name__
+    if report is not None:
+        report(record)
+    return accepted
+
+
+def _superclass_tags(superclass):
+    """
+    Return the set of normalized
+    :py:attr:`~rpymostat_common.entry_points.EntryPoint.provides` tags that
+    match ``superclass``: the dotted ``module.ClassName`` of each class, and
+    its ``_plugin_tag`` attribute, if set.
+
+    :param superclass: class / classinfo
+    :type superclass: ``class or classinfo``
+    :rtype: set
+    """
+    classes = superclass if isinstance(superclass, tuple) else (superclass,)
+    tags = set()
+    for klass in classes:
+        if isinstance(klass, tuple):
+            tags.update(_superclass_tags(klass))
+            continue
+        tags.add(normalize_tag('%s.%s' % (klass.__module__, klass.__name__)))
+        tag = getattr(klass, '_plugin_tag', None)
+        if tag is not None:
+            tags.add(normalize_tag(tag))
+    return tags
+
+
+def _prefilter(entry_points, superclass, report):
+    """
+    Reject, without importing them, entry points which declare
+    ``provides.`` tags that do not match ``superclass``, passing a rejected
+    :py:class:`~.PluginLoadRecord` for each to ``report``.
+
+    :param entry_points: entry points to filter
+    :type entry_points: iterable
+    :param superclass: class / classinfo
+    :type superclass: ``class or classinfo``
+    :param report: callable to pass rejected records to, or None
+    :type report: callable
+    :return: entry points that may match ``superclass``
+    :rtype: list
+    """
+    wanted = _superclass_tags(superclass)
+    result = []
+    for ep in entry_points:
+        try:
+            provides = ep.provides
+        except ValueError:
+            # invalid entry point value; let loading report it
+            provides = ()
+        if not provides or wanted.intersection(provides):
+            result.append(ep)
+            continue
+        logger.debug('Entry point %s provides %s, not %s; not importing it',
+                     ep.name, list(provides), sorted(wanted))
+        if report is not None:
+            record = PluginLoadRecord(ep)
+            record.rejected = True
+            report(record)
+    return result
+
+
+def _check_isolated(entry_points, superclass, processes, timeout, report,
+                    negative_cache):
+    """
+    Check entry points in worker processes, returning those which passed.
+    Failed checks are recorded in ``negative_cache`` (unless the entry point
+    merely failed the ``superclass`` check) and passed to ``report``.
+
+    :param entry_points: entry points to check
+    :type entry_points: list
+    :param superclass: class / classinfo entry points must be subclasses of
+    :type superclass: ``class or classinfo``
+    :param processes: maximum number of concurrent worker processes
+    :type processes: int
+    :param timeout: maximum time in seconds to allow for each check
+    :type timeout: float
+    :param report: callable to pass records for failed checks to, or None
+    :type report: callable
+    :param negative_cache: negative cache to record failures in, or None
+    :type negative_cache: :py:class:`~.NegativeCache`
+    :return: entry points that passed the check
+    :rtype: list
+    """
+    # imported here since it pulls in multiprocessing, and isolated loading
+    # is opt-in
+    from rpymostat_common.isolation import check_entry_points
+    passed = []
+    for check in check_entry_points(
+        list(entry_points), superclass=superclass, processes=processes,
+        timeout=timeout
+    ):
+        if check.passed:
+            passed.append(check.entry_point)
+            continue
+        logger.debug('Entry point %s failed isolated check: %s', check.name,
+                     check.reason)
+        if negative_cache is not None and not check.loaded:
+            negative_cache.add(check.entry_point, check.reason)
+        if report is not None:
+            record = PluginLoadRecord(check.entry_point)
+            record.duration = check.duration
+            record.exception = check.exception
+            record.timed_out = check.timed_out
+            record.rejected = check.loaded
+            report(record)
+    return passed
+
+
+def _skip_failed(entry_points, negative_cache, report):
+    """
+    Filter out entry points with a current failure in ``negative_cache``,
+    passing a skipped :py:class:`~.PluginLoadRecord` for each to ``report``.
+
+    :param entry_points: entry points to filter
+    :type entry_points: list
+    :param negative_cache: negative cache to check, or None to not filter
+    :type negative_cache: :py:class:`~.NegativeCache`
+    :param report: callable to pass skipped records to, or None
+    :type report: callable
+    :return: entry points that should be loaded
+    :rtype: list
+    """
+    result = []
+    for ep in entry_points:
+        if negative_cache is None or not negative_cache.should_skip(ep):
+            result.append(ep)
+            continue
+        logger.debug('Skipping entry point %s; it recently failed to load',
+                     ep.name)
+        if report is not None:
+            record = PluginLoadRecord(ep)
+            record.skipped = True
+            report(record)
+    return result
+
+
+def _load_sequential(entry_points, trace_memory=False, track_modules=False):
+    """
+    Load each of ``entry_points`` in turn, logging any that raise an
+    exception.
+
+    :param entry_points: the entry points to load
+    :type entry_points: iterable
+    :param trace_memory: whether to record the change in traced memory
+      during each load; :py:mod:`tracemalloc` must already be tracing
+    :type trace_memory: bool
+    :param track_modules: whether to record the modules newly imported by
+      each load in :py:attr:`PluginLoadRecord.modules`
+    :type track_modules: bool
+    :return: generator of (entry point, loaded object or None,
+      :py:class:`~.PluginLoadRecord`) 3-tuples
+    """
+    for entry_point in entry_points:
+        record = PluginLoadRecord(entry_point)
+        obj = None
+        if trace_memory:
+            mem_before = tracemalloc.get_traced_memory()[0]
+        if track_modules:
+            modules_before = set(sys.modules)
+        start = _now()
         try:
             logger.debug("Trying to load class from entry point: %s",
                          entry_point.name)
             obj = entry_point.load()
-            if superclass is None:
-                classes.append(obj)
-            elif issubclass(obj, superclass):
-                classes.append(obj)
+            record.loaded = True
         except:
             logger.debug('Exception raised when loading entry point %s',
                          entry_point.name, exc_info=1)
-    logger.debug("%s classes loaded successfully for entrypoint %s: %s",
-                 len(classes), entrypoint_name, [c.__name__ for c in classes])
-    return classes
+            record.exception = sys.exc_info()[0].__name__
+        record.duration = _now() - start
+        if trace_memory:
+            record.memory_delta = (
+                tracemalloc.get_traced_memory()[0] - mem_before
+            )
+        if track_modules:
+            record.modules = sorted(set(sys.modules) - modules_before)
+        yield entry_point, obj, record
+
+
+def _load_threaded(entry_points, max_workers, timeout):
+    """
+    Load ``entry_points`` concurrently, each in its own daemon thread, with
+    at most ``max_workers`` running at once. Entry points that raise an
+    exception or take longer than ``timeout`` seconds to load are logged. A
+    timed-out entry point no longer counts against ``max_workers``, but its
+    thread is left running.
+
+    :param entry_points: the entry points to load
+    :type entry_points: list
+    :param max_workers: maximum number of entry points to load concurrently
+    :type max_workers: int
+    :param timeout: per-entry-point load timeout in seconds, or None
+    :type timeout: float
+    :return: generator of (entry point, loaded object or None,
+      :py:class:`~.PluginLoadRecord`) 3-tuples, in the same order as
+      ``entry_points``
+    """
+    cond = threading.Condition()
+    pending = list(range(len(entry_points)))
+    # index of entry point currently loading, to time it started
+    running = {}
+    # index of entry point to (obj, exc_info, duration) or _TIMED_OUT
+    results = {}
+
+    def worker(idx):
+        start = _now()
+        try:
+            res = (entry_points[idx].load(), None)
+        except:
+            res = (None, sys.exc_info())
+        res += (_now() - start, )
+        with cond:
+            # if idx is no longer running, it already timed out
+            if idx in running:
+                del running[idx]
+                results[idx] = res
+                cond.notify()
+
+    for idx, entry_point in enumerate(entry_points):
+        with cond:
+            while idx not in results:
+                while len(pending) > 0 and len(running) < max_workers:
+                    i = pending.pop(0)
+                    logger.debug("Trying to load class from entry point: %s",
+                                 entry_points[i].name)
+                    running[i] = _now()
+                    t = threading.Thread(target=worker, args=(i,))
+                    t.daemon = True
+                    t.start()
+                if timeout is None:
+                    cond.wait()
+                    continue
+                now = _now()
+                for i, started in list(running.items()):
+                    if now - started >= timeout:
+                        del running[i]
+                        results[i] = _TIMED_OUT
+                if idx not in results and len(running) > 0:
+                    cond.wait(min(running.values()) + timeout - now)
+            res = results.pop(idx)
+        record = PluginLoadRecord(entry_point)
+        if res is _TIMED_OUT:
+            logger.debug('Timed out after %s seconds loading entry point %s',
+                         timeout, entry_point.name)
+            record.timed_out = True
+            record.duration = timeout
+            yield entry_point, None, record
+            continue
+        obj, exc_info, record.duration = res
+        if exc_info is not None:
+            logger.debug('Exception raised when loading entry point %s',
+                         entry_point.name, exc_info=exc_info)
+            record.exception = exc_info[0].__name__
+        else:
+            record.loaded = True
+        yield entry_point, obj, record
 
 
 def list_classes(classes):
     """
     Given a list of class objects, print their names, along with their
     _description attributes (if present) and any arguments they accept. Used in
-    building dynamic CLI help.
+    building dynamic CLI help. :py:class:`~.LazyPlugin` handles in
+    ``classes`` are loaded.
     """
     for cls in classes:
-        if hasattr(cls, '_description'):
-            print('%s (%s)' % (cls.__name__, cls._description))
-        else:
-            print(cls.__name__)
-        v = _get_varnames(cls)
-        if len(v) == 0:
-            print("")
+        if isinstance(cls, LazyPlugin):
+            cls = cls.load()
+        _print_class_help(
+            cls.__name__, getattr(cls, '_description', None),
+            _get_varnames(cls)
+        )
+
+
+def list_classes_static(entrypoint_name):
+    """
+    Print the same help output as :py:func:`~.list_classes` for every
+    entrypoint matching the given name, without importing any of them. Class
+    names, ``_description`` attributes and ``__init__`` arguments are read
+    from the plugin modules' source via
+    :py:func:`rpymostat_common.static_help.static_class_info`. Entry points
+    whose source cannot be read are listed by name only.
+
+    :param entrypoint_name: name of the entrypoint to list
+    :type entrypoint_name: str
+    """
+    # imported here since parsing source needs ast and hashlib, which
+    # nothing else at load time does
+    from rpymostat_common.static_help import static_class_info
+    for entry_point in iter_entry_points(entrypoint_name):
+        info = static_class_info(entry_point)
+        if info is None:
+            _print_class_help(LazyPlugin(entry_point).__name__, None, {})
             continue
-        for vname in sorted(v.keys()):
-            print("    %s - %s" % (vname, v[vname]))
-        print("")
+        _print_class_help(info.name, info.description, info.varnames())
 
 
-def _parse_docstring(docstring):
+def _name_matches(name, pattern):
+    """
+    Return whether class name ``name`` matches :py:mod:`fnmatch` wildcard
+    ``pattern``, case-insensitively.
     """
-    Given a docstring, attempt to parse out all ``:param foo:`` and
-    ``:type foo:`` directives and their matching strings, collapsing
-    whitespace. Return a dict of keys 'params' and 'types', each being a
-    dict of name to string.
+    return fnmatch.fnmatchcase(name.lower(), pattern.lower())
 
-    :param docstring: docstring to parse
-    :type docstring: str
-    :rtype: dict
+
+def _paginate(infos, offset, limit):
     """
-    param_re = re.compile(
-        r'^\s*:param ([^:]+):((?:(?!:param|:type|:return|:rtype).)*)',
-        re.S | re.M
-    )
-    type_re = re.compile(
-        r'^\s*:type ([^:]+):((?:(?!:param|:type|:return|:rtype).)*)',
-        re.S | re.M
+    Return an iterator over the ``limit`` items of ``infos`` (or all of
+    them, if None) starting at index ``offset``.
+    """
+    return itertools.islice(
+        infos, offset, None if limit is None else offset + limit
     )
-    whitespace_re = re.compile(r'\s+')
 
-    res = {'params': {}, 'types': {}}
 
-    for itm in param_re.finditer(docstring):
-        res['params'][itm.group(1).strip()] = whitespace_re.sub(
-            ' ', itm.group(2).strip())
-    for itm in type_re.finditer(docstring):
-        res['types'][itm.group(1).strip()] = whitespace_re.sub(
-            ' ', itm.group(2).strip())
-    return res
+def iter_class_info(classes, pattern=None, predicate=None, offset=0,
+                    limit=None):
+    """
+    Structured equivalent of :py:func:`~.list_classes`; return an iterator
+    over the :py:class:`~rpymostat_common.introspection.ClassInfo` (class
+    name, ``_description`` and each ``__init__`` argument's type, default
+    and description) for each of ``classes``, optionally filtered and
+    paginated. Records are generated as the iterator is consumed, and
+    :py:class:`~.LazyPlugin` handles are only loaded if they match
+    ``pattern`` and fall before the end of the requested page.
+
+    :param classes: classes and/or :py:class:`~.LazyPlugin` handles, i.e.
+      as returned by :py:func:`~.load_classes`
+    :type classes: list
+    :param pattern: if specified, only include classes whose name matches
+      this case-insensitive :py:mod:`fnmatch` pattern, i.e. ``*sensor*``
+    :type pattern: str
+    :param predicate: if specified, only include classes for which this
+      callable returns True when passed their ``ClassInfo``
+    :type predicate: ``callable``
+    :param offset: number of matching records to skip
+    :type offset: int
+    :param limit: maximum number of records to return, or None for all
+    :type limit: int
+    :return: iterator over ``ClassInfo``
+    """
+    def infos():
+        for cls in classes:
+            if pattern is not None and not _name_matches(cls.__name__,
+                                                         pattern):
+                continue
+            if isinstance(cls, LazyPlugin):
+                cls = cls.load()
+            info = class_info(cls)
+            if predicate is None or predicate(info):
+                yield info
+
+    return _paginate(infos(), offset, limit)
+
+
+def iter_class_info_static(entrypoint_name, pattern=None, predicate=None,
+                           offset=0, limit=None):
+    """
+    Structured equivalent of :py:func:`~.list_classes_static`; like
+    :py:func:`~.iter_class_info`, but for every entrypoint matching the
+    given name, read from module source without importing anything. Entry
+    points whose source cannot be read give a ``ClassInfo`` with only the
+    class name.
+
+    :param entrypoint_name: name of the entrypoint to list
+    :type entrypoint_name: str
+    :param pattern: if specified, only include classes whose name matches
+      this case-insensitive :py:mod:`fnmatch` pattern
+    :type pattern: str
+    :param predicate: if specified, only include classes for which this
+      callable returns True when passed their ``ClassInfo``
+    :type predicate: ``callable``
+    :param offset: number of matching records to skip
+    :type offset: int
+    :param limit: maximum number of records to return, or None for all
+    :type limit: int
+    :return: iterator over ``ClassInfo``
+    """
+    from rpymostat_common.static_help import static_class_info
+
+    def infos():
+        for entry_point in iter_entry_points(entrypoint_name):
+            name = LazyPlugin(entry_point).__name__
+            if pattern is not None and not _name_matches(name, pattern):
+                continue
+            info = static_class_info(entry_point)
+            if info is None:
+                info = ClassInfo(name)
+            if predicate is None or predicate(info):
+                yield info
+
+    return _paginate(infos(), offset, limit)
+
+
+def class_info_json_lines(infos):
+    """
+    Serialize class help records (i.e. from :py:func:`~.iter_class_info`)
+    to `JSON lines <http://jsonlines.org/>`_, one record per line. Default
+    argument values that cannot be represented in JSON are given as their
+    ``repr()``.
+
+    :param infos: iterable of
+      :py:class:`~rpymostat_common.introspection.ClassInfo`
+    :type infos: iterable
+    :return: iterator over JSON strings, without trailing newlines
+    """
+    for info in infos:
+        yield json.dumps(info.as_dict(), sort_keys=True, default=repr)
+
+
+def _print_class_help(name, description, varnames):
+    """
+    Print help for one class, for :py:func:`~.list_classes`.
+
+    :param name: class name
+    :type name: str
+    :param description: class description, or None
+    :type description: str
+    :param varnames: dict of argument varname to help string, as returned by
+      :py:func:`~._get_varnames`
+    :type varnames: dict
+    """
+    if description is not None:
+        print('%s (%s)' % (name, description))
+    else:
+        print(name)
+    if len(varnames) == 0:
+        print("")
+        return
+    for vname in sorted(varnames.keys()):
+        print("    %s - %s" % (vname, varnames[vname]))
+    print("")
 
 
 def _get_varnames(klass):
     """
     Return a dict of variable names that klass's init method takes,
-    to string descriptions of them (if present).
+    to string descriptions of them (if present). Variable names of arguments
+    with default values are suffixed with ``=`` and the default.
+
+    This uses the cached
+    :py:func:`rpymostat_common.introspection.get_arguments`.
 
     :param klass: the class to get varnames for (from its __init__ method)
     :type klass: abc.ABCMeta
     :return: dict
     """
-    func = klass.__init__.im_func
-    res = {}
-    args = []
-    kwargs = {}
-    if func.func_defaults is not None and len(func.func_defaults) > 0:
-        if len(func.func_defaults) >= len(func.func_code.co_varnames)-1:
-            args = []
-            kwarg_names = func.func_code.co_varnames[1:]
-        else:
-            args = func.func_code.co_varnames[1:len(func.func_defaults)+1]
-            kwarg_names = func.func_code.co_varnames[
-                          len(func.func_defaults)+1:
-            ]
-        for x, _default in enumerate(func.func_defaults):
-            kwargs[kwarg_names[x]] = func.func_defaults[x]
-    else:
-        args = func.func_code.co_varnames[1:]
-    docstr = _parse_docstring(func.__doc__)
-    for argname in args:
-        s = ''
-        if argname in docstr['types']:
-            s = '(%s) ' % docstr['types'][argname]
-        if argname in docstr['params']:
-            s += docstr['params'][argname]
-        res[argname] = s
-    for argname, _default in kwargs.iteritems():
-        s = ''
-        if argname in docstr['types']:
-            s = '(%s) ' % docstr['types'][argname]
-        if argname in docstr['params']:
-            s += docstr['params'][argname]
-        res['%s=%s' % (argname, _default)] = s
-    return res
+    return dict((arg.varname, arg.help) for arg in get_arguments(klass))
@@ -0,0 +1,647 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import errno
+import fnmatch
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from collections import OrderedDict
+
+from rpymostat_common.entry_points import (
+    fingerprint, normalize_name, scan, scan_distribution, METADATA_SUFFIXES,
+    _metadata_dir
+)
+from rpymostat_common.loader import _load_group, _resolve_negative_cache
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                        use_errno=True)
+    _libc.inotify_init1
+    _libc.inotify_add_watch
+except (ImportError, OSError, AttributeError):
+    _libc = None
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event flags
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+#: inotify events that may indicate a distribution was installed or removed
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+# struct inotify_event header: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class PluginEvent(object):
+    """
+    A change to the plugins in a :py:class:`~.PluginRegistry`, as returned by
+    :py:meth:`~.PluginRegistry.refresh` and passed to listeners.
+    """
+
+    __slots__ = ['kind', 'group', 'name', 'entry_point', 'plugin']
+
+    #: a plugin was installed
+    ADDED = 'added'
+    #: a plugin was uninstalled, or no longer loads
+    REMOVED = 'removed'
+    #: a plugin's distribution was upgraded or its target changed, and the
+    #: plugin was re-imported
+    CHANGED = 'changed'
+
+    def __init__(self, kind, entry_point, plugin):
+        """
+        :param kind: one of :py:attr:`~.ADDED`, :py:attr:`~.REMOVED` or
+          :py:attr:`~.CHANGED`
+        :type kind: str
+        :param entry_point: the plugin's (new, unless removed) entry point
+        :type entry_point: rpymostat_common.entry_points.EntryPoint
+        :param plugin: the loaded plugin (usually a class); for removed
+          plugins, the previously-loaded one
+        """
+        self.kind = kind
+        self.group = entry_point.group
+        self.name = entry_point.name
+        self.entry_point = entry_point
+        self.plugin = plugin
+
+    def __repr__(self):
+        return '<PluginEvent %s %s:%s (%s)>' % (
+            self.kind, self.group, self.name, self.entry_point.value
+        )
+
+
+class PollingWatcher(object):
+    """
+    Fallback watcher for platforms without inotify, which simply reports a
+    possible change every ``interval`` seconds; the registry's
+    :py:func:`~rpymostat_common.entry_points.fingerprint` comparison then
+    determines what (if anything) changed.
+    """
+
+    def __init__(self, interval=5.0):
+        """
+        :param interval: seconds between checks
+        :type interval: float
+        """
+        self.interval = interval
+
+    def update(self, paths):
+        """
+        Set the paths to watch; a no-op for this watcher.
+
+        :param paths: directories to watch
+        :type paths: list
+        """
+        pass
+
+    def wait(self, stop):
+        """
+        Wait for a possible change.
+
+        :param stop: event which, when set, ends the wait early
+        :type stop: threading.Event
+        :return: whether something may have changed
+        :rtype: bool
+        """
+        stop.wait(self.interval)
+        return not stop.is_set()
+
+    def close(self):
+        """
+        Release the watcher's resources; a no-op for this watcher.
+        """
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Linux inotify(7) watcher (via :py:mod:`ctypes`) for site-packages
+    directories and the distribution metadata directories in them.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        """
+        :param poll_interval: maximum time in seconds to block in
+          :py:meth:`~.wait` before re-checking the stop event
+        :type poll_interval: float
+        """
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.poll_interval = poll_interval
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}
+
+    @staticmethod
+    def available():
+        """
+        :return: whether inotify can be used on this platform
+        :rtype: bool
+        """
+        return _libc is not None
+
+    def update(self, paths):
+        """
+        Set the paths to watch, adding watches for new paths and removing
+        those for paths no longer in the list.
+
+        :param paths: directories to watch
+        :type paths: list
+        """
+        paths = set(paths)
+        for path in list(self._watches):
+            if path not in paths:
+                # fails harmlessly if the kernel already dropped the watch
+                _libc.inotify_rm_watch(self.fd, self._watches.pop(path))
+        for path in paths:
+            if path in self._watches:
+                continue
+            wd = _libc.inotify_add_watch(
+                self.fd, path.encode(sys.getfilesystemencoding()), WATCH_MASK
+            )
+            if wd < 0:
+                logger.debug('Unable to watch %s: %s', path,
+                             os.strerror(ctypes.get_errno()))
+                continue
+            self._watches[path] = wd
+
+    def wait(self, stop):
+        """
+        Wait for a filesystem event on any watched path, and drain all
+        pending events.
+
+        :param stop: event which, when set, ends the wait early
+        :type stop: threading.Event
+        :return: whether any events were received
+        :rtype: bool
+        """
+        while not stop.is_set():
+            readable = select.select([self.fd], [], [], self.poll_interval)[0]
+            if readable:
+                return self._drain() > 0
+        return False
+
+    def _drain(self):
+        """
+        Read all pending events, returning the number read.
+        """
+        count = 0
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except OSError as ex:
+                if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return count
+                raise
+            offset = 0
+            while offset < len(buf):
+                length = _EVENT_HEADER.unpack_from(buf, offset)[3]
+                offset += _EVENT_HEADER.size + length
+                count += 1
+
+    def close(self):
+        """
+        Close the inotify file descriptor.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self._watches = {}
+
+
+def _plugin_key(entry_point):
+    """
+    Return the registry key for an entry point; a distribution upgrade keeps
+    the same key, so it is reported as a change rather than a removal and
+    addition.
+    """
+    return (entry_point.group, entry_point.name,
+            normalize_name(entry_point.dist_name))
+
+
+class PluginRegistry(object):
+    """
+    Live registry of the plugins in one or more entry point groups, built on
+    :py:func:`~rpymostat_common.loader.load_classes`, which tracks plugins
+    being installed, upgraded and removed without restarting the process.
+
+    Each :py:meth:`~.refresh` compares the per-distribution
+    :py:func:`~rpymostat_common.entry_points.fingerprint` with the previous
+    one, re-reads the entry points of only the distributions that changed,
+    and imports only entry points that are new or whose target or
+    distribution version changed; unchanged plugins are never re-imported.
+    :py:meth:`~.start` runs refreshes on a background thread whenever
+    inotify reports a change to ``sys.path`` directories or the metadata
+    directories in them (or periodically, where inotify is unavailable).
+
+    A changed plugin's module is removed from ``sys.modules`` before it is
+    re-imported, so the new version's code is used; other modules imported
+    by the plugin are not reloaded.
+    """
+
+    def __init__(self, groups, superclass=None, path=None,
+                 negative_cache=True):
+        """
+        :param groups: entry point group name or pattern, or list of them
+          (see :py:meth:`rpymostat_common.entry_points.EntryPointIndex.select`)
+        :type groups: ``str`` or ``list``
+        :param superclass: class / classinfo to restrict all groups to, or
+          dict of group name to class / classinfo
+        :type superclass: ``class``, ``classinfo`` or ``dict``
+        :param path: directories to look for distributions in; defaults to
+          ``sys.path`` at the time of each refresh
+        :type path: list
+        :param negative_cache: negative cache to use when loading; see
+          :py:func:`~rpymostat_common.loader.load_classes`
+        :type negative_cache: ``NegativeCache`` or bool
+        """
+        if not isinstance(groups, (list, tuple, set)):
+            groups = [groups]
+        self.groups = list(groups)
+        self.superclass = superclass
+        self.path = path
+        self.negative_cache = negative_cache
+        self._lock = threading.RLock()
+        self._listeners = []
+        # meta path -> fingerprint entry, as of the last refresh
+        self._dists = None
+        # meta path (or None for the full-scan fallback) -> entry points in
+        # matching groups
+        self._dist_eps = {}
+        # plugin key -> EntryPoint, for every matching entry point
+        self._entry_points = {}
+        # plugin key -> loaded object, for entry points which loaded and
+        # passed the superclass check
+        self._plugins = {}
+        # plugin key -> EntryPoint, for entry points which failed to load;
+        # retried once they expire from the negative cache
+        self._failed = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def add_listener(self, listener):
+        """
+        Register a callable to be called with each :py:class:`~.PluginEvent`
+        when the registry changes.
+
+        :param listener: callable taking one argument
+        :type listener: callable
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Unregister a listener added with :py:meth:`~.add_listener`.
+
+        :param listener: the listener to remove
+        :type listener: callable
+        """
+        self._listeners.remove(listener)
+
+    def plugins(self, group):
+        """
+        Return the currently-loaded plugins in a group.
+
+        :param group: entry point group name
+        :type group: str
+        :return: list of loaded plugins (usually classes)
+        :rtype: list
+        """
+        with self._lock:
+            return [
+                self._plugins[key] for key in sorted(self._plugins)
+                if key[0] == group
+            ]
+
+    def as_dict(self):
+        """
+        :return: dict of group name to list of currently-loaded plugins
+        :rtype: dict
+        """
+        with self._lock:
+            result = OrderedDict()
+            for key in sorted(self._plugins):
+                result.setdefault(key[0], []).append(self._plugins[key])
+            return result
+
+    def _wanted(self, group):
+        return any(fnmatch.fnmatchcase(group, p) for p in self.groups)
+
+    def _superclass_for(self, group):
+        if isinstance(self.superclass, dict):
+            return self.superclass.get(group, None)
+        return self.superclass
+
+    def refresh(self):
+        """
+        Bring the registry up to date with the installed distributions,
+        notifying listeners of any changes. The first call loads every
+        matching plugin.
+
+        :return: list of :py:class:`~.PluginEvent`
+        :rtype: list
+        """
+        with self._lock:
+            fp = fingerprint(self.path)
+            current = dict((d[0], d[1:]) for d in fp['dists'])
+            if self._dists is None:
+                changed = set(current)
+            else:
+                changed = set(
+                    p for p in set(current) | set(self._dists)
+                    if current.get(p) != self._dists.get(p)
+                )
+            self._dists = current
+            if not changed and not self._retry_due():
+                return []
+            if changed:
+                logger.debug('Distribution metadata changed: %s',
+                             sorted(changed))
+                self._rescan(changed, current)
+            events = self._apply()
+        for event in events:
+            logger.info('Plugin %s: %s', event.kind, event)
+            for listener in list(self._listeners):
+                listener(event)
+        return events
+
+    def _rescan(self, changed, current):
+        """
+        Update ``self._dist_eps`` for the changed distribution metadata
+        paths, only falling back to a full scan if one of them cannot be
+        scanned individually.
+        """
+        if all(_scannable(p) for p in changed if p in current):
+            for meta_path in changed:
+                self._dist_eps.pop(meta_path, None)
+                if meta_path in current:
+                    self._dist_eps[meta_path] = self._filter(
+                        scan_distribution(meta_path)
+                    )
+            return
+        logger.debug('Falling back to a full entry point scan')
+        self._dist_eps = {}
+        for meta_path in current:
+            if _scannable(meta_path):
+                self._dist_eps[meta_path] = self._filter(
+                    scan_distribution(meta_path)
+                )
+        seen = set(
+            _plugin_key(ep) for eps in self._dist_eps.values() for ep in eps
+        )
+        self._dist_eps[None] = [
+            ep for eps in scan().values() for ep in self._filter(eps)
+            if _plugin_key(ep) not in seen
+        ]
+
+    def _retry_due(self, key=None):
+        """
+        Return whether the failed entry point with the given key (or, if
+        None, any failed entry point) is due to be re-attempted, i.e. its
+        failure has expired from the negative cache. Without a negative
+        cache, failed entry points are only re-attempted when their
+        distribution changes.
+        """
+        negative_cache = _resolve_negative_cache(self.negative_cache)
+        if negative_cache is None:
+            return False
+        keys = list(self._failed) if key is None else [key]
+        return any(
+            k in self._failed and self._failed[k] not in negative_cache
+            for k in keys
+        )
+
+    def _filter(self, entry_points):
+        return [ep for ep in entry_points if self._wanted(ep.group)]
+
+    def _apply(self):
+        """
+        Diff the scanned entry points against the loaded plugins, import new
+        and changed ones, and return the resulting events.
+        """
+        desired = {}
+        path = self.path if self.path is not None else sys.path
+        # like both scanning backends, the first distribution on the path
+        # wins if there are duplicates
+        for meta_path in sorted(self._dist_eps,
+                                key=lambda p: _path_order(p, path)):
+            for ep in self._dist_eps[meta_path]:
+                desired.setdefault(_plugin_key(ep), ep)
+        events = []
+        for key in sorted(set(self._entry_points) - set(desired)):
+            old = self._entry_points.pop(key)
+            self._failed.pop(key, None)
+            if key in self._plugins:
+                events.append(PluginEvent(
+                    PluginEvent.REMOVED, old, self._plugins.pop(key)
+                ))
+        to_load = OrderedDict()
+        reload_modules = set()
+        for key in sorted(desired):
+            ep = desired[key]
+            old = self._entry_points.get(key)
+            if old is not None and (
+                old.value == ep.value and
+                old.dist_version == ep.dist_version and
+                not self._retry_due(key)
+            ):
+                continue
+            if old is not None:
+                reload_modules.add(ep.module_name)
+            self._entry_points[key] = ep
+            to_load.setdefault(ep.group, []).append(ep)
+        # re-import changed modules, unless a plugin that is not being
+        # reloaded still uses them
+        reloading = set(
+            _plugin_key(ep) for eps in to_load.values() for ep in eps
+        )
+        for key, plugin in self._plugins.items():
+            if key not in reloading:
+                reload_modules.discard(self._entry_points[key].module_name)
+                reload_modules.discard(getattr(plugin, '__module__', None))
+        for name in reload_modules:
+            sys.modules.pop(name, None)
+        for group, eps in to_load.items():
+            records = []
+            classes = _load_group(
+                group, eps, superclass=self._superclass_for(group),
+                report=records.append, negative_cache=self.negative_cache
+            )
+            accepted = set(
+                (r.name, r.dist_name) for r in records
+                if r.loaded and not r.rejected and not r.skipped
+            )
+            # entry points rejected without being imported (per their
+            # ``provides`` declarations) have not failed
+            failed = set(
+                (r.name, r.dist_name) for r in records
+                if not r.loaded and not r.rejected
+            )
+            classes = iter(classes)
+            for ep in eps:
+                key = _plugin_key(ep)
+                if (ep.name, ep.dist_name) in failed:
+                    self._failed[key] = ep
+                else:
+                    self._failed.pop(key, None)
+                previous = self._plugins.pop(key, None)
+                if (ep.name, ep.dist_name) in accepted:
+                    self._plugins[key] = next(classes)
+                    events.append(PluginEvent(
+                        PluginEvent.ADDED if previous is None
+                        else PluginEvent.CHANGED,
+                        ep, self._plugins[key]
+                    ))
+                elif previous is not None:
+                    events.append(PluginEvent(
+                        PluginEvent.REMOVED, ep, previous
+                    ))
+        return events
+
+    def _watch_paths(self):
+        """
+        Return the directories to watch: every directory on the path, and
+        every distribution metadata directory in them.
+        """
+        path = self.path if self.path is not None else sys.path
+        dirs = [p for p in (x or os.getcwd() for x in path)
+                if os.path.isdir(p)]
+        for meta_path in self._dists or {}:
+            meta_dir = _metadata_dir(meta_path)
+            if meta_dir is not None:
+                dirs.append(meta_dir)
+        return dirs
+
+    def start(self, interval=5.0, settle=0.5):
+        """
+        Load all plugins (if not already loaded) and start a daemon thread
+        which refreshes the registry whenever installed distributions
+        change.
+
+        :param interval: polling interval in seconds, if inotify is not
+          available
+        :type interval: float
+        :param settle: seconds to wait after a filesystem event before
+          refreshing, so that an in-progress install can finish
+        :type settle: float
+        """
+        if self._thread is not None:
+            return
+        self.refresh()
+        if InotifyWatcher.available():
+            self._watcher = InotifyWatcher()
+        else:
+            self._watcher = PollingWatcher(interval)
+        self._watcher.update(self._watch_paths())
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(settle,), name='PluginRegistry'
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, settle):
+        while self._watcher.wait(self._stop):
+            if self._stop.wait(settle):
+                break
+            try:
+                self.refresh()
+                self._watcher.update(self._watch_paths())
+            except Exception:
+                logger.error('Exception refreshing plugin registry',
+                             exc_info=1)
+
+    def stop(self):
+        """
+        Stop the background thread started by :py:meth:`~.start`.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._watcher.close()
+        self._watcher = None
+
+
+def _path_order(meta_path, path):
+    """
+    Sort key putting distribution metadata paths in the order of the
+    ``path`` entries that contain them (then by name), with the full-scan
+    fallback (None) and paths outside ``path`` last.
+    """
+    if meta_path is None:
+        return (len(path) + 1, '')
+    parent = os.path.dirname(meta_path)
+    for idx, entry in enumerate(x or os.getcwd() for x in path):
+        if parent == entry or meta_path.startswith(entry + os.sep):
+            return (idx, meta_path)
+    return (len(path), meta_path)
+
+
+def _scannable(meta_path):
+    """
+    Return whether the distribution at ``meta_path`` can be scanned with
+    :py:func:`~rpymostat_common.entry_points.scan_distribution`.
+    """
+    return (
+        meta_path.endswith(METADATA_SUFFIXES) and
+        _metadata_dir(meta_path) is not None
+    )
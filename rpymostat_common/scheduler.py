@@ -0,0 +1,415 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import logging
+import sys
+import threading
+import time
+
+from rpymostat_common.loader import load_classes
+
+logger = logging.getLogger(__name__)
+
+# clock used for latency measurement; prefer a monotonic clock where
+# available
+_now = getattr(time, 'monotonic', time.time)
+
+
+class DependencyError(Exception):
+    """
+    Raised by :py:func:`~.initialize` when plugin dependencies are cyclic.
+    """
+    pass
+
+
+class PluginInitRecord(object):
+    """
+    Result of initializing (instantiating) a single plugin class, as part of
+    an :py:class:`~.InitReport`.
+    """
+
+    __slots__ = [
+        'plugin_class', 'name', 'index', 'depends', 'depends_names',
+        'instance', 'exception', 'skipped', 'start', 'end'
+    ]
+
+    def __init__(self, plugin_class, depends, index=None, depends_names=None):
+        """
+        :param plugin_class: the plugin class
+        :type plugin_class: type
+        :param depends: indexes (in the classes passed to
+          :py:func:`~.initialize`) of the plugins this one waited for
+        :type depends: list
+        :param index: index of this plugin in the classes passed to
+          :py:func:`~.initialize`
+        :type index: int
+        :param depends_names: class names of the plugins this one waited
+          for, parallel to ``depends``
+        :type depends_names: list
+        """
+        #: the plugin class
+        self.plugin_class = plugin_class
+        #: the plugin class name; not necessarily unique
+        self.name = plugin_class.__name__
+        #: index of this plugin in the classes passed to initialize()
+        self.index = index
+        #: indexes of the plugin classes this one depended on
+        self.depends = depends
+        #: class names of the plugin classes this one depended on, for
+        #: output
+        if depends_names is None:
+            depends_names = []
+        self.depends_names = depends_names
+        #: the plugin instance, if initialization succeeded
+        self.instance = None
+        #: name of the exception class raised during initialization, or
+        #: ``'MissingDependency'``; None on success
+        self.exception = None
+        #: whether the plugin was not initialized because a dependency
+        #: failed or was missing
+        self.skipped = False
+        #: time initialization started and ended, in seconds since
+        #: :py:func:`~.initialize` was called
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        """
+        :return: initialization latency in seconds, or None if not run
+        :rtype: float
+        """
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    @property
+    def ok(self):
+        """
+        :return: whether the plugin was initialized successfully
+        :rtype: bool
+        """
+        return self.exception is None and not self.skipped
+
+    def as_dict(self):
+        """
+        :return: this record as a JSON-serializable dict
+        :rtype: dict
+        """
+        return {
+            'name': self.name,
+            'index': self.index,
+            'depends': list(self.depends_names),
+            'ok': self.ok,
+            'exception': self.exception,
+            'skipped': self.skipped,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+        }
+
+    def __repr__(self):
+        return '<PluginInitRecord %s ok=%s duration=%s>' % (
+            self.name, self.ok, self.duration
+        )
+
+
+class InitReport(object):
+    """
+    Report of a :py:func:`~.initialize` run.
+    """
+
+    def __init__(self, records, duration):
+        """
+        :param records: init records, in the order the classes were given
+        :type records: list
+        :param duration: total wall time, in seconds
+        :type duration: float
+        """
+        #: list of :py:class:`~.PluginInitRecord`, in input order
+        self.records = records
+        #: total wall time of the run, in seconds
+        self.duration = duration
+        #: indexes of the records on the critical path
+        self.critical_path_indexes, self.critical_path_duration = \
+            _critical_path(records)
+        #: class names of the plugins on the critical path
+        self.critical_path = [
+            records[i].name for i in self.critical_path_indexes
+        ]
+
+    @property
+    def instances(self):
+        """
+        :return: instances of the successfully-initialized plugins, in input
+          order
+        :rtype: list
+        """
+        return [r.instance for r in self.records if r.ok]
+
+    def as_dict(self):
+        """
+        :return: this report as a JSON-serializable dict
+        :rtype: dict
+        """
+        return {
+            'duration': self.duration,
+            'critical_path': self.critical_path,
+            'critical_path_duration': self.critical_path_duration,
+            'plugins': [r.as_dict() for r in self.records],
+        }
+
+
+def _critical_path(records):
+    """
+    Return the chain of dependent plugins with the largest total init
+    latency, as a list of indexes into ``records``, and that total. This is
+    the lower bound on the run's wall time no matter how many workers are
+    used. Records are keyed by index, as class names need not be unique.
+    """
+    cost = {}
+    prev = {}
+
+    def path_cost(idx):
+        if idx not in cost:
+            best = None
+            best_cost = 0
+            for dep in records[idx].depends:
+                c = path_cost(dep)
+                if best is None or c > best_cost:
+                    best, best_cost = dep, c
+            prev[idx] = best
+            cost[idx] = (records[idx].duration or 0) + best_cost
+        return cost[idx]
+
+    end = None
+    for idx in range(len(records)):
+        c = path_cost(idx)
+        if end is None or c > cost[end]:
+            end = idx
+    path = []
+    while end is not None:
+        path.insert(0, end)
+        end = prev[end]
+    return path, (cost[path[-1]] if path else 0)
+
+
+def _provided_names(klass):
+    """
+    Return the names a plugin class provides: its class name, plus any in
+    its ``_provides`` attribute.
+    """
+    return [klass.__name__] + list(getattr(klass, '_provides', None) or [])
+
+
+def _dependency_graph(classes):
+    """
+    Return a list, parallel to ``classes``, of the sets of indexes of the
+    classes each one depends on, and a parallel list of missing dependency
+    names.
+
+    :raises: DependencyError if the dependencies contain a cycle
+    """
+    providers = {}
+    for idx, klass in enumerate(classes):
+        for name in _provided_names(klass):
+            providers.setdefault(name, []).append(idx)
+    deps = []
+    missing = []
+    for idx, klass in enumerate(classes):
+        d = set()
+        m = []
+        for name in getattr(klass, '_depends', None) or []:
+            if name not in providers:
+                m.append(name)
+            d.update(i for i in providers.get(name, []) if i != idx)
+        deps.append(d)
+        missing.append(m)
+    # detect cycles with Kahn's algorithm
+    indegree = [len(d) for d in deps]
+    dependents = [[] for _ in classes]
+    for idx, d in enumerate(deps):
+        for i in d:
+            dependents[i].append(idx)
+    ready = [i for i, n in enumerate(indegree) if n == 0]
+    seen = 0
+    while ready:
+        i = ready.pop()
+        seen += 1
+        for j in dependents[i]:
+            indegree[j] -= 1
+            if indegree[j] == 0:
+                ready.append(j)
+    if seen != len(classes):
+        raise DependencyError(
+            'Plugin dependencies contain a cycle among: %s' % ', '.join(
+                sorted(classes[i].__name__ for i, n in enumerate(indegree)
+                       if n > 0)
+            )
+        )
+    return deps, missing
+
+
+def initialize(classes, factory=None, max_workers=4):
+    """
+    Instantiate plugin classes (i.e. as returned by
+    :py:func:`rpymostat_common.loader.load_classes`) in dependency order,
+    running independent plugins concurrently on up to ``max_workers``
+    threads, so that slow hardware initialization can overlap.
+
+    Each class provides its own class name plus any names in its
+    ``_provides`` class attribute (a list of strings), and is initialized
+    only after every class providing a name in its ``_depends`` class
+    attribute. A plugin whose dependency fails, or depends on a name that
+    nothing provides, is skipped.
+
+    :param classes: plugin classes to instantiate
+    :type classes: list
+    :param factory: callable to create each instance, called as
+      ``factory(klass, dependencies)`` where ``dependencies`` is a dict of
+      each name in ``klass._depends`` to the list of instances providing
+      it; defaults to calling ``klass()``
+    :type factory: callable
+    :param max_workers: maximum number of plugins to initialize at once
+    :type max_workers: int
+    :return: report of the run, including per-plugin latency and the
+      critical path
+    :rtype: InitReport
+    :raises: DependencyError if the dependencies contain a cycle
+    """
+    classes = list(classes)
+    deps, missing = _dependency_graph(classes)
+    records = []
+    for idx, klass in enumerate(classes):
+        depends = sorted(deps[idx])
+        records.append(PluginInitRecord(
+            klass, depends, index=idx,
+            depends_names=[classes[i].__name__ for i in depends]
+        ))
+    started = _now()
+    cond = threading.Condition()
+    pending = set(range(len(classes)))
+    running = set()
+    done = set()
+
+    def dependencies(idx):
+        result = {}
+        for name in getattr(classes[idx], '_depends', None) or []:
+            result[name] = [
+                records[i].instance for i in sorted(deps[idx])
+                if name in _provided_names(classes[i])
+            ]
+        return result
+
+    def worker(idx):
+        record = records[idx]
+        record.start = _now() - started
+        try:
+            if factory is None:
+                record.instance = classes[idx]()
+            else:
+                record.instance = factory(classes[idx], dependencies(idx))
+        except:
+            logger.error('Exception initializing plugin %s', record.name,
+                         exc_info=1)
+            record.exception = sys.exc_info()[0].__name__
+        record.end = _now() - started
+        logger.debug('Initialized plugin %s in %s seconds', record.name,
+                     record.duration)
+        with cond:
+            running.discard(idx)
+            done.add(idx)
+            cond.notify()
+
+    with cond:
+        while pending or running:
+            progressed = False
+            for idx in sorted(pending):
+                if len(running) >= max_workers:
+                    break
+                if not deps[idx] <= done:
+                    continue
+                pending.discard(idx)
+                progressed = True
+                failed = [i for i in deps[idx] if not records[i].ok]
+                if missing[idx] or failed:
+                    logger.warning(
+                        'Not initializing plugin %s; dependencies failed or '
+                        'missing: %s', records[idx].name,
+                        sorted(missing[idx] +
+                               [records[i].name for i in failed])
+                    )
+                    records[idx].skipped = True
+                    if missing[idx]:
+                        records[idx].exception = 'MissingDependency'
+                    done.add(idx)
+                    continue
+                running.add(idx)
+                t = threading.Thread(target=worker, args=(idx,))
+                t.daemon = True
+                t.start()
+            if not progressed:
+                cond.wait()
+    report = InitReport(records, _now() - started)
+    logger.debug('Initialized %d plugins in %s seconds; critical path %s '
+                 '(%s seconds)', len(report.instances), report.duration,
+                 report.critical_path, report.critical_path_duration)
+    return report
+
+
+def load_and_initialize(entrypoint_name, superclass=None, factory=None,
+                        max_workers=4, **kwargs):
+    """
+    Load the plugin classes in an entry point group with
+    :py:func:`rpymostat_common.loader.load_classes`, and then
+    :py:func:`~.initialize` them.
+
+    :param entrypoint_name: name of the entrypoint to load
+    :type entrypoint_name: str
+    :param superclass: if specified, only initialize subclasses of this
+      class / classinfo
+    :type superclass: ``class or classinfo``
+    :param factory: instance factory; see :py:func:`~.initialize`
+    :type factory: callable
+    :param max_workers: maximum number of plugins to initialize at once
+    :type max_workers: int
+    :param kwargs: other keyword arguments for
+      :py:func:`~rpymostat_common.loader.load_classes`
+    :rtype: InitReport
+    """
+    classes = load_classes(entrypoint_name, superclass=superclass, **kwargs)
+    return initialize(classes, factory=factory, max_workers=max_workers)
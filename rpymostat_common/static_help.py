@@ -0,0 +1,426 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import ast
+import hashlib
+import logging
+import os
+import sys
+
+from rpymostat_common.cache import cache_dir, read_json, write_json
+from rpymostat_common.introspection import (
+    ArgumentInfo, ClassInfo, parse_docstring
+)
+
+logger = logging.getLogger(__name__)
+
+#: Version of the cached :py:class:`~.ClassInfo` format; bump this when the
+#: format or the way it is derived from source changes.
+CACHE_FORMAT_VERSION = 1
+
+# maximum depth of base classes to follow when looking for an inherited
+# __init__ method or _description attribute
+_MAX_BASE_DEPTH = 10
+
+# in-memory cache of cache key to ClassInfo
+_memory_cache = {}
+
+
+def find_module_source(module_name, path=None):
+    """
+    Find the source file for ``module_name`` by searching the directories on
+    ``path``, without importing it or any of its parent packages. Only
+    modules and packages that exist as ``.py`` files in a directory are
+    found; zipped and extension modules are not.
+
+    :param module_name: dotted name of the module to find
+    :type module_name: str
+    :param path: list of directories to search; defaults to ``sys.path``
+    :type path: list
+    :return: path to the module's source file, or None if not found
+    :rtype: str
+    """
+    if path is None:
+        path = sys.path
+    parts = module_name.split('.')
+    for item in path:
+        base = os.path.join(item or os.getcwd(), *parts)
+        for candidate in [
+            base + '.py', os.path.join(base, '__init__.py')
+        ]:
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def _hash_file(path):
+    """
+    Return the SHA1 hex digest of the file at ``path``, along with its
+    contents.
+    """
+    with open(path, 'rb') as fh:
+        source = fh.read()
+    return hashlib.sha1(source).hexdigest(), source
+
+
+class _SourceModule(object):
+    """
+    A parsed module source file, with lookups of the classes and imported
+    names it defines at the top level.
+    """
+
+    def __init__(self, module_name, path, source):
+        self.module_name = module_name
+        self.path = path
+        self.tree = ast.parse(source, path)
+        self.is_package = os.path.basename(path) == '__init__.py'
+        self.classes = {}
+        # name to (module name, attribute name or None)
+        self.imports = {}
+        for node in self.tree.body:
+            if isinstance(node, ast.ClassDef):
+                self.classes[node.name] = node
+            elif isinstance(node, ast.ImportFrom):
+                mod = self._resolve_relative(node.module, node.level)
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = (
+                        mod, alias.name
+                    )
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname is not None:
+                        self.imports[alias.asname] = (alias.name, None)
+                    else:
+                        top = alias.name.split('.')[0]
+                        self.imports[top] = (top, None)
+
+    def _resolve_relative(self, module, level):
+        if not level:
+            return module
+        parts = self.module_name.split('.')
+        if not self.is_package:
+            parts = parts[:-1]
+        if level > 1:
+            parts = parts[:-(level - 1)]
+        if module:
+            parts.append(module)
+        return '.'.join(parts)
+
+
+class _StaticInspector(object):
+    """
+    Reads :py:class:`~.ClassInfo` for a class from its module's source,
+    following base classes defined in the same module or imported into it
+    via ``from ... import ...`` or ``import ...``. Records the hash of every
+    source file it reads, for cache validation.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.modules = {}
+        # source file path to SHA1 hex digest
+        self.hashes = {}
+
+    def module(self, module_name):
+        if module_name not in self.modules:
+            self.modules[module_name] = None
+            src_path = find_module_source(module_name, self.path)
+            if src_path is not None:
+                digest, source = _hash_file(src_path)
+                self.hashes[src_path] = digest
+                self.modules[module_name] = _SourceModule(
+                    module_name, src_path, source
+                )
+        return self.modules[module_name]
+
+    def find_class(self, module_name, attrs):
+        """
+        Return the (_SourceModule, ast.ClassDef) for the class at ``attrs``
+        in ``module_name``, or (None, None) if it cannot be found.
+        """
+        mod = self.module(module_name)
+        if mod is None or len(attrs) == 0:
+            return None, None
+        if attrs[0] not in mod.classes and attrs[0] in mod.imports:
+            target_mod, name = mod.imports[attrs[0]]
+            if name is None:
+                return self.find_class(target_mod, attrs[1:])
+            return self.find_class(target_mod, (name, ) + tuple(attrs[1:]))
+        if attrs[0] not in mod.classes:
+            # i.e. "from package import module"
+            submodule = '%s.%s' % (module_name, attrs[0])
+            if find_module_source(submodule, self.path) is not None:
+                return self.find_class(submodule, attrs[1:])
+        node = mod.classes.get(attrs[0])
+        for attr in attrs[1:]:
+            if node is None:
+                break
+            node = dict(
+                (n.name, n) for n in node.body if isinstance(n, ast.ClassDef)
+            ).get(attr)
+        return mod, node
+
+    def _base_classes(self, mod, node):
+        for base in node.bases:
+            attrs = _dotted_name(base)
+            if attrs is None:
+                continue
+            yield self.find_class(mod.module_name, attrs)
+
+    def find_member(self, mod, node, func, depth=0):
+        """
+        Search ``node`` and (depth-first) its bases for a member, by calling
+        ``func(node)`` on each until it returns something other than None.
+        """
+        res = func(node)
+        if res is not None or depth >= _MAX_BASE_DEPTH:
+            return res
+        for base_mod, base_node in self._base_classes(mod, node):
+            if base_node is None:
+                continue
+            res = self.find_member(base_mod, base_node, func, depth + 1)
+            if res is not None:
+                return res
+        return None
+
+    def class_info(self, module_name, attrs):
+        """
+        Return the :py:class:`~.ClassInfo` for the class at ``attrs`` in
+        ``module_name``, or None if it cannot be found.
+        """
+        mod, node = self.find_class(module_name, attrs)
+        if node is None:
+            return None
+        description = self.find_member(mod, node, _class_description)
+        init = self.find_member(mod, node, _class_init)
+        arguments = ()
+        if init is not None:
+            arguments = _init_arguments(init)
+        return ClassInfo(node.name, description=description,
+                         arguments=arguments)
+
+
+def _dotted_name(node):
+    """
+    Return the tuple of names in a ``Name`` or dotted ``Attribute`` AST
+    node, or None for any other node.
+    """
+    if isinstance(node, ast.Name):
+        return (node.id, )
+    if isinstance(node, ast.Attribute):
+        prefix = _dotted_name(node.value)
+        if prefix is not None:
+            return prefix + (node.attr, )
+    return None
+
+
+def _string_value(node):
+    """
+    Return the value of a string literal AST node, or None.
+    """
+    try:
+        value = ast.literal_eval(node)
+    except (ValueError, TypeError):
+        return None
+    if isinstance(value, (type(''), type(u''))):
+        return value
+    return None
+
+
+def _class_description(node):
+    """
+    Return the literal ``_description`` string assigned in the body of the
+    ``node`` ClassDef, if any.
+    """
+    for stmt in node.body:
+        if not isinstance(stmt, ast.Assign):
+            continue
+        for target in stmt.targets:
+            if isinstance(target, ast.Name) and target.id == '_description':
+                return _string_value(stmt.value)
+    return None
+
+
+def _class_init(node):
+    """
+    Return the ``__init__`` FunctionDef in the body of the ``node``
+    ClassDef, if any.
+    """
+    for stmt in node.body:
+        if isinstance(stmt, ast.FunctionDef) and stmt.name == '__init__':
+            return stmt
+    return None
+
+
+def _default_string(node):
+    """
+    Return the string form of a default value AST node: the ``str()`` of its
+    value if it is a literal, or otherwise its source expression.
+    """
+    try:
+        return '%s' % (ast.literal_eval(node), )
+    except (ValueError, TypeError):
+        pass
+    unparse = getattr(ast, 'unparse', None)
+    if unparse is not None:
+        return unparse(node)
+    name = _dotted_name(node)
+    if name is not None:
+        return '.'.join(name)
+    return '...'
+
+
+def _init_arguments(func):
+    """
+    Return a list of :py:class:`~.ArgumentInfo` for the arguments of the
+    ``func`` (``__init__``) FunctionDef node, excluding ``self`` and any
+    ``*args`` or ``**kwargs``. Default values are given in their string
+    form (see :py:func:`~._default_string`).
+    """
+    args = func.args
+    positional = list(getattr(args, 'posonlyargs', [])) + list(args.args)
+    defaults = [None] * (len(positional) - len(args.defaults)) + list(
+        args.defaults)
+    params = list(zip(positional, defaults))[1:]
+    params.extend(zip(
+        getattr(args, 'kwonlyargs', []), getattr(args, 'kw_defaults', [])
+    ))
+    docstr = parse_docstring(ast.get_docstring(func, clean=False) or '')
+    res = []
+    for arg, default in params:
+        # ast.arg on py3, ast.Name on py2
+        name = getattr(arg, 'arg', None) or arg.id
+        res.append(ArgumentInfo(
+            name, has_default=(default is not None),
+            default=(
+                None if default is None else _default_string(default)
+            ),
+            type=docstr['types'].get(name),
+            description=docstr['params'].get(name)
+        ))
+    return res
+
+
+def _cache_path(key):
+    return os.path.join(cache_dir(), 'static_help', '%s.json' % key)
+
+
+def _cached(key):
+    """
+    Return the :py:class:`~.ClassInfo` cached under ``key`` in memory or on
+    disk, if present and none of the other source files it was derived from
+    have changed.
+    """
+    if key in _memory_cache:
+        return _memory_cache[key]
+    data = read_json(_cache_path(key))
+    if not isinstance(data, dict):
+        return None
+    if data.get('version') != CACHE_FORMAT_VERSION:
+        return None
+    for path, digest in data['dependencies'].items():
+        try:
+            if _hash_file(path)[0] != digest:
+                return None
+        except (IOError, OSError):
+            return None
+    info = ClassInfo.from_dict(data['info'])
+    _memory_cache[key] = info
+    return info
+
+
+def static_class_info(entry_point, path=None):
+    """
+    Return the :py:class:`~.ClassInfo` for the class an entry point refers
+    to, by parsing module source with :py:mod:`ast` rather than importing
+    it. Results are cached in memory and on disk, keyed by the SHA1 hash of
+    the module source file (and validated against the hashes of any other
+    files that base classes were read from).
+
+    Only literal values are understood; ``_description`` must be assigned a
+    string literal, and default argument values that are not literals are
+    given as their source expression. Default values are always strings.
+
+    :param entry_point: the entry point to read help information for
+    :type entry_point: rpymostat_common.entry_points.EntryPoint
+    :param path: list of directories to search for source; defaults to
+      ``sys.path``
+    :type path: list
+    :return: class info, or None if the class source could not be found or
+      parsed
+    :rtype: rpymostat_common.introspection.ClassInfo
+    """
+    src_path = find_module_source(entry_point.module_name, path)
+    if src_path is None:
+        logger.debug('Could not find source for entry point %s (module %s)',
+                     entry_point.name, entry_point.module_name)
+        return None
+    key = '%s-%s' % (
+        _hash_file(src_path)[0],
+        hashlib.sha1(entry_point.value.encode('utf-8')).hexdigest()
+    )
+    info = _cached(key)
+    if info is not None:
+        return info
+    inspector = _StaticInspector(path)
+    try:
+        info = inspector.class_info(entry_point.module_name,
+                                    entry_point.attrs)
+    except (SyntaxError, ValueError, TypeError):
+        logger.debug('Could not parse source for entry point %s',
+                     entry_point.name, exc_info=1)
+        return None
+    if info is None:
+        logger.debug('Could not find class for entry point %s in %s',
+                     entry_point.name, src_path)
+        return None
+    _memory_cache[key] = info
+    write_json(_cache_path(key), {
+        'version': CACHE_FORMAT_VERSION,
+        'dependencies': dict(
+            (p, d) for p, d in inspector.hashes.items() if p != src_path
+        ),
+        'info': info.as_dict()
+    })
+    return info
+
+
+def clear_cache():
+    """
+    Clear the in-memory cache of :py:func:`~.static_class_info` results.
+    """
+    _memory_cache.clear()
@@ -0,0 +1,201 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import argparse
+import logging
+import sys
+
+from rpymostat_common.entry_points import (
+    EntryPoint, EntryPointIndex, STATIC_REGISTRY_MODULE
+)
+from rpymostat_common.loader import _load_group
+
+logger = logging.getLogger(__name__)
+
+_HEADER = '''"""
+Static plugin registry for rpymostat, generated by
+rpymostat_common.static_registry. Do not edit; regenerate with:
+
+    python -m rpymostat_common.static_registry %s
+"""
+
+'''
+
+
+def resolve(groups, superclass=None):
+    """
+    Scan installed distributions for the entry points in ``groups`` (never
+    using an existing static registry), and load them the same way
+    :py:func:`rpymostat_common.loader.load_groups` does.
+
+    :param groups: entry point group name or pattern, or list of them
+    :type groups: ``str`` or ``list``
+    :param superclass: class / classinfo to restrict all groups to, or dict
+      of group name to class / classinfo
+    :type superclass: ``class``, ``classinfo`` or ``dict``
+    :return: dict of group name to list of ``(EntryPoint, object)`` pairs for
+      the entry points which loaded (and passed the ``superclass`` check)
+    :rtype: dict
+    """
+    selected = EntryPointIndex(persist=False).select(groups)
+    result = {}
+    for group, entry_points in selected.items():
+        if isinstance(superclass, dict):
+            group_superclass = superclass.get(group, None)
+        else:
+            group_superclass = superclass
+        records = []
+        classes = _load_group(
+            group, entry_points, superclass=group_superclass,
+            report=records.append, negative_cache=False
+        )
+        accepted = [
+            (r.name, r.dist_name) for r in records
+            if r.loaded and not r.rejected
+        ]
+        loaded = iter(classes)
+        result[group] = [
+            (ep, next(loaded)) for ep in entry_points
+            if (ep.name, ep.dist_name) in accepted
+        ]
+    return result
+
+
+def generate(groups, superclass=None, command_args=''):
+    """
+    Return the source of a static plugin registry module for ``groups``.
+    The module is plain data and imports nothing, so importing it at
+    runtime does not import any plugins. It defines ``ENTRY_POINTS``, a dict
+    of group name to list of ``(name, value, group, dist_name,
+    dist_version)`` tuples for the resolved entry points, and
+    ``HIDDENIMPORTS``, a sorted list of the modules they live in, for
+    freezing tools which cannot see plugin imports; i.e. a PyInstaller hook
+    can do ``from rpymostat_static_registry import HIDDENIMPORTS as
+    hiddenimports``.
+
+    :param groups: entry point group name or pattern, or list of them
+    :type groups: ``str`` or ``list``
+    :param superclass: class / classinfo to restrict all groups to, or dict
+      of group name to class / classinfo
+    :type superclass: ``class``, ``classinfo`` or ``dict``
+    :param command_args: arguments to show in the "regenerate with" comment
+    :type command_args: str
+    :return: Python source code
+    :rtype: str
+    """
+    resolved = resolve(groups, superclass=superclass)
+    modules = set()
+    entry_points = []
+    for group in sorted(resolved):
+        entry_points.append('    %r: [\n' % group)
+        for ep, _ in resolved[group]:
+            modules.add(ep.module_name)
+            entry_points.append('        (%r, %r, %r, %r, %r),\n' % (
+                ep.name, ep.value, ep.group, ep.dist_name, ep.dist_version
+            ))
+        entry_points.append('    ],\n')
+    return ''.join(
+        [_HEADER % command_args] +
+        ['#: entry points by group, as (name, value, group, dist_name, '
+         'dist_version)\nENTRY_POINTS = {\n'] + entry_points +
+        ['}\n\n#: modules containing the entry points, for freezing '
+         'tools\nHIDDENIMPORTS = [\n'] +
+        ['    %r,\n' % m for m in sorted(modules)] + [']\n']
+    )
+
+
+def _import_object(spec):
+    """
+    Import and return the object named by ``module.name:attr.path``.
+    """
+    return EntryPoint('superclass', spec, None).load()
+
+
+def parse_args(argv):
+    """
+    Parse command line arguments.
+
+    :param argv: command line arguments, excluding the program name
+    :type argv: list
+    :rtype: argparse.Namespace
+    """
+    p = argparse.ArgumentParser(
+        prog='python -m rpymostat_common.static_registry',
+        description='Generate a static plugin registry module, which '
+                    'rpymostat_common.loader uses instead of scanning '
+                    'installed distributions for entry points.'
+    )
+    p.add_argument('-o', '--output', dest='output', action='store',
+                   default='%s.py' % STATIC_REGISTRY_MODULE,
+                   help='path to write the registry module to '
+                        '(default: %%(default)s); it must be importable as '
+                        '%s, or as the module named by the '
+                        'RPYMOSTAT_STATIC_REGISTRY environment variable'
+                        '' % STATIC_REGISTRY_MODULE)
+    p.add_argument('-s', '--superclass', dest='superclass', action='store',
+                   default=None,
+                   help='only include plugins which are subclasses of this '
+                        'class, given as module.name:ClassName')
+    p.add_argument('groups', nargs='+', metavar='GROUP',
+                   help='entry point group name or wildcard pattern, '
+                        'i.e. "rpymostat.*"')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command line entry point; generate a static plugin registry module.
+
+    :param argv: command line arguments, excluding the program name;
+      defaults to ``sys.argv[1:]``
+    :type argv: list
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parse_args(argv)
+    superclass = None
+    if args.superclass is not None:
+        superclass = _import_object(args.superclass)
+    source = generate(args.groups, superclass=superclass,
+                      command_args=' '.join(argv))
+    with open(args.output, 'w') as fh:
+        fh.write(source)
+    print('Wrote static plugin registry to %s' % args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+import threading
+
+import pytest
+
+from rpymostat_common.entry_points import EntryPoint
+from rpymostat_common.loader import NegativeCache
+
+asyncio = pytest.importorskip('asyncio')
+
+from rpymostat_common.aio import (  # noqa
+    AsyncPluginLoader, load_classes_async
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.aio'
+
+
+class BaseClass(object):
+    pass
+
+
+class EP1(BaseClass):
+    pass
+
+
+class EP2(object):
+    pass
+
+
+class EP3(BaseClass):
+    pass
+
+
+class TestAsyncPluginLoader(object):
+
+    def setup_method(self):
+        self.loop = asyncio.new_event_loop()
+        self.eps = [
+            EntryPoint('ep%d' % i, 'foo:EP%d' % i, 'grp', 'd', '1')
+            for i in range(1, 5)
+        ]
+        self.objs = {'ep1': EP1, 'ep2': EP2, 'ep3': EP3}
+        self.release = threading.Event()
+        self.cache = NegativeCache()
+
+    def teardown_method(self):
+        self.release.set()
+        self.loop.close()
+
+    def se_load(self, ep):
+        if ep.name == 'ep1':
+            # finish after ep3, to show completion order
+            self.release.wait(5)
+        if ep.name == 'ep3':
+            self.release.set()
+        if ep.name == 'ep4':
+            raise ImportError()
+        return self.objs[ep.name]
+
+    def iterate(self, loader):
+        res = []
+        while True:
+            try:
+                res.append(self.loop.run_until_complete(loader.__anext__()))
+            except StopAsyncIteration:
+                return res
+
+    def test_iterate(self):
+        records = []
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                mock_iep.return_value = self.eps
+                m_l.side_effect = self.se_load
+                loader = AsyncPluginLoader(
+                    'grp', superclass=BaseClass, report=records.append,
+                    negative_cache=self.cache, loop=self.loop
+                )
+                assert loader.__aiter__() is loader
+                res = self.iterate(loader)
+                final = self.loop.run_until_complete(loader.result())
+        assert res == [EP3, EP1]
+        assert final == [EP1, EP3]
+        assert mock_iep.mock_calls == [call('grp')]
+        assert sorted((r.name, r.loaded, r.rejected) for r in records) == [
+            ('ep1', True, False),
+            ('ep2', True, True),
+            ('ep3', True, False),
+            ('ep4', False, False),
+        ]
+        assert [f['name'] for f in self.cache.failures()] == ['ep4']
+
+    def test_load_classes_async(self):
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                mock_iep.return_value = self.eps
+                m_l.side_effect = self.se_load
+                res = self.loop.run_until_complete(load_classes_async(
+                    'grp', names=['ep2', 'ep3'], negative_cache=False,
+                    loop=self.loop
+                ))
+        assert res == [EP2, EP3]
+
+    def test_empty(self):
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            mock_iep.return_value = []
+            loader = AsyncPluginLoader('grp', loop=self.loop)
+            assert self.iterate(loader) == []
+            assert self.loop.run_until_complete(loader.result()) == []
+
+    def test_cancel(self):
+        started = threading.Event()
+
+        def se_load(ep):
+            started.set()
+            self.release.wait(5)
+            return EP1
+
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                mock_iep.return_value = self.eps
+                m_l.side_effect = se_load
+                loader = AsyncPluginLoader('grp', loop=self.loop,
+                                           negative_cache=False)
+                waiter = loader.__anext__()
+                self.loop.run_until_complete(
+                    self.loop.run_in_executor(None, started.wait, 5)
+                )
+                waiter.cancel()
+                self.loop.run_until_complete(asyncio.sleep(0))
+                self.release.set()
+                with pytest.raises(StopAsyncIteration):
+                    self.loop.run_until_complete(loader.__anext__())
+        assert loader.result().cancelled()
+        assert loader._futures == []
+
+    def test_prepare_error(self):
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            mock_iep.side_effect = RuntimeError('foo')
+            loader = AsyncPluginLoader('grp', loop=self.loop)
+            with pytest.raises(RuntimeError):
+                self.loop.run_until_complete(loader.__anext__())
+            with pytest.raises(RuntimeError):
+                self.loop.run_until_complete(loader.result())
@@ -0,0 +1,332 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from rpymostat_common.benchmarks import (
+    backend_import_times, main, make_docstring, parse_docstring_times,
+    _legacy_parse_docstring, make_distributions, loader_times, parse_args,
+    id_method_times
+)
+from rpymostat_common.entry_points import scan_distribution
+from rpymostat_common.introspection import parse_docstring
+from rpymostat_common.unique_ids import SystemID
+from rpymostat_common.version import VERSION
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT, ANY  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT, ANY  # noqa
+
+pbm = 'rpymostat_common.benchmarks'
+
+
+class TestBackendImportTimes(object):
+
+    def test_backend_import_times(self):
+        outputs = [
+            {'import_time': 0.5, 'scan_time': 0.1, 'max_rss_kb': 10,
+             'entry_points': 3},
+            {'import_time': 0.2, 'scan_time': 0.1, 'max_rss_kb': 11,
+             'entry_points': 3},
+            {'import_time': 0.1, 'scan_time': 0.3, 'max_rss_kb': 12,
+             'entry_points': 3},
+        ]
+
+        def se_co(args):
+            if args[-1] == 'bad':
+                raise subprocess.CalledProcessError(1, args)
+            return json.dumps(outputs.pop(0)).encode('utf-8')
+
+        with patch('%s.subprocess.check_output' % pbm) as mock_co:
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                mock_co.side_effect = se_co
+                res = backend_import_times(
+                    backends=['foo', 'bad'], python='/bin/py'
+                )
+        assert res == {
+            'foo': {'import_time': 0.2, 'scan_time': 0.1, 'max_rss_kb': 11,
+                    'entry_points': 3},
+            'bad': None
+        }
+        assert mock_co.mock_calls == [
+            call(['/bin/py', '-c', ANY, 'foo']),
+            call(['/bin/py', '-c', ANY, 'foo']),
+            call(['/bin/py', '-c', ANY, 'foo']),
+            call(['/bin/py', '-c', ANY, 'bad']),
+        ]
+        assert mock_logger.mock_calls == [
+            call.warning('Benchmark of %s backend failed', 'bad', exc_info=1)
+        ]
+
+    def test_backend_import_times_defaults(self):
+        with patch('%s.subprocess.check_output' % pbm) as mock_co:
+            mock_co.return_value = b'{"import_time": 1, "scan_time": 2}'
+            res = backend_import_times(repeat=1)
+        assert sorted(res.keys()) == ['importlib.metadata', 'pkg_resources']
+        assert mock_co.mock_calls == [
+            call([sys.executable, '-c', ANY, 'importlib.metadata']),
+            call([sys.executable, '-c', ANY, 'pkg_resources']),
+        ]
+
+
+class TestParseDocstringTimes(object):
+
+    def test_make_docstring(self):
+        res = make_docstring(3, description_lines=2)
+        parsed = parse_docstring(res)
+        assert sorted(parsed['params'].keys()) == ['arg0', 'arg1', 'arg2']
+        assert parsed['params']['arg1'] == (
+            'description of argument 1 continued description line 0, with '
+            'some more words to make it longer'
+        )
+        assert parsed['types'] == {'arg0': 'str', 'arg1': 'str',
+                                   'arg2': 'str'}
+        assert _legacy_parse_docstring(res) == parsed
+
+    def test_parse_docstring_times(self):
+        with patch('%s.timeit.repeat' % pbm) as mock_repeat:
+            mock_repeat.side_effect = [
+                [0.4, 0.2], [0.8, 0.6], [0.04, 0.02], [0.08, 0.06]
+            ]
+            res = parse_docstring_times(sizes=(10, 100), repeat=2)
+        assert mock_repeat.mock_calls == [
+            call(ANY, repeat=2, number=100),
+            call(ANY, repeat=2, number=100),
+            call(ANY, repeat=2, number=10),
+            call(ANY, repeat=2, number=10),
+        ]
+        assert res == [
+            {'params': 10, 'length': len(make_docstring(10)),
+             'tokenizer': 0.002, 'legacy_regex': 0.006},
+            {'params': 100, 'length': len(make_docstring(100)),
+             'tokenizer': 0.002, 'legacy_regex': 0.006},
+        ]
+
+
+class TestIDMethodTimes(object):
+
+    def test_id_method_times(self):
+        with patch.object(SystemID, 'id_methods', ['machine_id', 'foo']):
+            with patch.object(
+                SystemID, 'machine_id', autospec=True
+            ) as mock_mid:
+                with patch.object(SystemID, 'foo', create=True,
+                                  new=lambda self: 1 / 0):
+                    with patch('%s.timeit.default_timer' % pbm) as mock_t:
+                        with patch('rpymostat_common.cpuinfo.invalidate',
+                                   autospec=True) as mock_inv:
+                            mock_mid.return_value = 'machine_id_1'
+                            mock_t.side_effect = [
+                                0, 5, 10, 11, 20, 23, 30, 31
+                            ]
+                            res = id_method_times(repeat=2)
+        assert res == {
+            'machine_id': {'first': 5, 'best': 1, 'found': True},
+            'foo': {'first': 3, 'best': 1, 'found': False},
+        }
+        assert len(mock_mid.mock_calls) == 2
+        assert mock_inv.mock_calls == [call()] * 4
+
+
+class TestMakeDistributions(object):
+
+    def test_make_distributions(self, tmpdir):
+        res = make_distributions(
+            str(tmpdir), 25, groups=2, per_dist=10, slow=0.1, failing=0.2,
+            nonmatching=0.2
+        )
+        assert res == {'slow': 2, 'failing': 5, 'nonmatching': 5, 'ok': 13}
+        assert sorted(os.listdir(str(tmpdir))) == [
+            'rpymostat_bench_base.py', 'rpymostat_bench_d0',
+            'rpymostat_bench_d0-1.0.dist-info', 'rpymostat_bench_d1',
+            'rpymostat_bench_d1-1.0.dist-info', 'rpymostat_bench_d2',
+            'rpymostat_bench_d2-1.0.dist-info',
+        ]
+        dist = scan_distribution(
+            str(tmpdir.join('rpymostat_bench_d2-1.0.dist-info'))
+        )
+        assert [[ep.group] + ep.as_list() for ep in dist] == [
+            ['rpymostat.bench.g0', 'p20', 'rpymostat_bench_d2.p20:Plugin20',
+             'rpymostat_bench_d2', '1.0'],
+            ['rpymostat.bench.g0', 'p22', 'rpymostat_bench_d2.p22:Plugin22',
+             'rpymostat_bench_d2', '1.0'],
+            ['rpymostat.bench.g0', 'p24', 'rpymostat_bench_d2.p24:Plugin24',
+             'rpymostat_bench_d2', '1.0'],
+            ['rpymostat.bench.g1', 'p21', 'rpymostat_bench_d2.p21:Plugin21',
+             'rpymostat_bench_d2', '1.0'],
+            ['rpymostat.bench.g1', 'p23', 'rpymostat_bench_d2.p23:Plugin23',
+             'rpymostat_bench_d2', '1.0'],
+        ]
+        kinds = {'ok': 0, 'slow': 0, 'failing': 0, 'nonmatching': 0}
+        for i in range(25):
+            src = tmpdir.join(
+                'rpymostat_bench_d%d' % (i // 10), 'p%d.py' % i
+            ).read()
+            compile(src, 'p%d.py' % i, 'exec')
+            if 'time.sleep(0.01)' in src:
+                kinds['slow'] += 1
+            elif 'raise ImportError' in src:
+                kinds['failing'] += 1
+            elif 'Plugin%d(object)' % i in src:
+                kinds['nonmatching'] += 1
+            else:
+                kinds['ok'] += 1
+        assert kinds == res
+
+    def test_make_distributions_seed(self, tmpdir):
+        a = tmpdir.mkdir('a')
+        b = tmpdir.mkdir('b')
+        make_distributions(str(a), 20, seed=1, failing=0.5)
+        make_distributions(str(b), 20, seed=1, failing=0.5)
+        for i in range(20):
+            path = os.path.join('rpymostat_bench_d0', 'p%d.py' % i)
+            assert a.join(path).read() == b.join(path).read()
+
+
+class TestLoaderTimes(object):
+
+    def test_loader_times(self):
+        paths = []
+
+        def se_co(args, env=None):
+            path = env['PYTHONPATH'].split(os.pathsep)[0]
+            paths.append(path)
+            assert os.path.exists(
+                os.path.join(path, 'rpymostat_bench_base.py')
+            )
+            assert env['RPYMOSTAT_ENTRY_POINT_INDEX'] == ''
+            assert env['RPYMOSTAT_STATIC_REGISTRY'] == ''
+            if len(paths) == 3:
+                raise subprocess.CalledProcessError(1, args)
+            return json.dumps(
+                {'load_classes_time': 3 - len(paths), 'loaded': len(paths)}
+            ).encode('utf-8')
+
+        with patch('%s.subprocess.check_output' % pbm) as mock_co:
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                mock_co.side_effect = se_co
+                res = loader_times(
+                    sizes=(10, 20), repeat=2, python='/bin/py', failing=0
+                )
+        assert res == [
+            {'entry_points': 10, 'load_classes_time': 1, 'loaded': 2,
+             'kinds': {'ok': 9, 'slow': 0, 'failing': 0, 'nonmatching': 1}},
+            {'entry_points': 20,
+             'kinds': {'ok': 18, 'slow': 0, 'failing': 0, 'nonmatching': 2}},
+        ]
+        assert mock_co.mock_calls == [
+            call(['/bin/py', '-c', ANY, 'rpymostat.bench.'], env=ANY)
+        ] * 3
+        assert mock_logger.mock_calls == [
+            call.warning('Loader benchmark of %d entry points failed', 20,
+                         exc_info=1)
+        ]
+        assert paths[0] == paths[1]
+        for path in paths:
+            assert not os.path.exists(path)
+
+
+class TestMain(object):
+
+    def test_parse_args(self):
+        res = parse_args([])
+        assert res.output is None
+        assert res.sizes == [10, 100, 1000, 10000]
+        assert res.repeat == 3
+        res = parse_args(['-o', 'foo.json', '-s', '1', '2', '-r', '5'])
+        assert res.output == 'foo.json'
+        assert res.sizes == [1, 2]
+        assert res.repeat == 5
+
+    def test_main(self, capsys):
+        with patch.multiple(
+            pbm,
+            backend_import_times=DEFAULT,
+            parse_docstring_times=DEFAULT,
+            loader_times=DEFAULT,
+            id_method_times=DEFAULT
+        ) as mocks:
+            mocks['id_method_times'].return_value = {'qux': 3}
+            mocks['backend_import_times'].return_value = {'foo': None}
+            mocks['parse_docstring_times'].return_value = [{'bar': 1}]
+            mocks['loader_times'].return_value = [{'baz': 2}]
+            main(['-s', '10', '-r', '1'])
+        out, err = capsys.readouterr()
+        res = json.loads(out)
+        assert res['version'] == VERSION
+        assert sorted(res.keys()) == [
+            'backend_import_times', 'id_method_times', 'implementation',
+            'loader_times', 'parse_docstring_times', 'python', 'version'
+        ]
+        assert res['id_method_times'] == {'qux': 3}
+        assert res['backend_import_times'] == {'foo': None}
+        assert res['parse_docstring_times'] == [{'bar': 1}]
+        assert res['loader_times'] == [{'baz': 2}]
+        assert mocks['backend_import_times'].mock_calls == [call(repeat=1)]
+        assert mocks['parse_docstring_times'].mock_calls == [call(repeat=1)]
+        assert mocks['loader_times'].mock_calls == [
+            call(sizes=[10], repeat=1)
+        ]
+
+    def test_main_output(self, tmpdir, capsys):
+        path = str(tmpdir.join('out.json'))
+        with patch.multiple(
+            pbm,
+            backend_import_times=DEFAULT,
+            parse_docstring_times=DEFAULT,
+            loader_times=DEFAULT,
+            id_method_times=DEFAULT
+        ) as mocks:
+            mocks['id_method_times'].return_value = {}
+            mocks['backend_import_times'].return_value = {}
+            mocks['parse_docstring_times'].return_value = []
+            mocks['loader_times'].return_value = []
+            main(['-o', path])
+        out, err = capsys.readouterr()
+        assert out == ''
+        with open(path) as fh:
+            res = json.load(fh)
+        assert res['loader_times'] == []
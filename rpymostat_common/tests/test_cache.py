@@ -0,0 +1,168 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import json
+import os
+import sys
+
+from rpymostat_common.cache import (
+    cache_dir, read_json, write_json, state_dir
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.cache'
+
+
+class TestCacheDir(object):
+
+    def test_env_override(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_CACHE_DIR': '/foo/bar',
+                                       'XDG_CACHE_HOME': '/baz'}):
+            assert cache_dir() == '/foo/bar'
+
+    def test_xdg(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_CACHE_DIR': '',
+                                       'XDG_CACHE_HOME': '/baz'}):
+            assert cache_dir() == '/baz/rpymostat'
+
+    def test_default(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_CACHE_DIR': '',
+                                       'XDG_CACHE_HOME': ''}):
+            with patch('%s.os.path.expanduser' % pbm) as mock_eu:
+                mock_eu.return_value = '/home/me'
+                res = cache_dir()
+        assert res == '/home/me/.cache/rpymostat'
+        assert mock_eu.mock_calls == [call('~')]
+
+
+class TestStateDir(object):
+
+    def test_env_override(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_STATE_DIR': '/foo/bar',
+                                       'XDG_STATE_HOME': '/baz'}):
+            assert state_dir() == '/foo/bar'
+
+    def test_xdg(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_STATE_DIR': '',
+                                       'XDG_STATE_HOME': '/baz'}):
+            assert state_dir() == '/baz/rpymostat'
+
+    def test_default(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_STATE_DIR': '',
+                                       'XDG_STATE_HOME': ''}):
+            with patch('%s.os.path.expanduser' % pbm) as mock_eu:
+                mock_eu.return_value = '/home/me'
+                res = state_dir()
+        assert res == '/home/me/.local/state/rpymostat'
+        assert mock_eu.mock_calls == [call('~')]
+
+
+class TestJSON(object):
+
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join('sub', 'dir', 'foo.json'))
+        assert write_json(path, {'foo': [1, 2]}) is True
+        assert read_json(path) == {'foo': [1, 2]}
+        assert os.listdir(str(tmpdir.join('sub', 'dir'))) == ['foo.json']
+
+    def test_read_missing(self, tmpdir):
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            res = read_json(str(tmpdir.join('foo.json')))
+        assert res is None
+        assert len(mock_logger.mock_calls) == 1
+
+    def test_read_invalid(self, tmpdir):
+        path = tmpdir.join('foo.json')
+        path.write('{not json')
+        assert read_json(str(path)) is None
+
+    def test_write_unwritable(self, tmpdir):
+        with patch('%s.tempfile.mkstemp' % pbm) as mock_mkstemp:
+            mock_mkstemp.side_effect = OSError('read-only')
+            res = write_json(str(tmpdir.join('foo.json')), {})
+        assert res is False
+
+    def test_write_unserializable(self, tmpdir):
+        path = tmpdir.join('foo.json')
+        path.write(json.dumps({'old': True}))
+        res = write_json(str(path), {'foo': object()})
+        assert res is False
+        assert read_json(str(path)) == {'old': True}
+        assert os.listdir(str(tmpdir)) == ['foo.json']
+
+    def test_write_durable(self, tmpdir):
+        path = str(tmpdir.join('foo.json'))
+        with patch('%s.os.fsync' % pbm, autospec=True,
+                   side_effect=os.fsync) as mock_fsync:
+            assert write_json(path, {'foo': 1}, durable=True) is True
+        # the temporary file, then the directory
+        assert len(mock_fsync.mock_calls) == 2
+        assert read_json(path) == {'foo': 1}
+        assert os.listdir(str(tmpdir)) == ['foo.json']
+
+    def test_write_durable_no_dir_fsync(self, tmpdir):
+        path = str(tmpdir.join('foo.json'))
+        real_open = os.open
+
+        def se_open(p, *args):
+            if p == str(tmpdir):
+                raise OSError('is a directory')
+            return real_open(p, *args)
+
+        with patch('%s.os.open' % pbm, side_effect=se_open):
+            assert write_json(path, {'foo': 1}, durable=True) is True
+        assert read_json(path) == {'foo': 1}
+
+    def test_write_exclusive(self, tmpdir):
+        path = str(tmpdir.join('foo.json'))
+        assert write_json(path, {'foo': 1}, exclusive=True) is True
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            assert write_json(path, {'foo': 2}, exclusive=True) is False
+        assert mock_logger.mock_calls == [
+            call.debug('Not writing JSON file %s; it already exists', path)
+        ]
+        assert read_json(path) == {'foo': 1}
+        assert os.listdir(str(tmpdir)) == ['foo.json']
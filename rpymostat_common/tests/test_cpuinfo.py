@@ -0,0 +1,171 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+from textwrap import dedent
+
+from rpymostat_common import cpuinfo
+from rpymostat_common.cpuinfo import (
+    CpuInfo, parse_cpuinfo, read_cpuinfo, get_cpuinfo, invalidate
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.cpuinfo'
+
+RPI3 = dedent("""
+processor       : 0
+model name      : ARMv7 Processor rev 4 (v7l)
+BogoMIPS        : 38.40
+Features        : half thumb fastmult vfp edsp neon vfpv3 tls vfpv4
+CPU revision    : 4
+
+processor       : 1
+model name      : ARMv7 Processor rev 4 (v7l)
+BogoMIPS        : 38.40
+Features        : half thumb fastmult vfp edsp neon vfpv3 tls vfpv4
+CPU revision    : 4
+
+Hardware        : BCM2709
+Revision        : a02082
+Serial          : 00000000ae463475
+Model           : Raspberry Pi 3 Model B Rev 1.2
+""")
+
+X86 = dedent("""
+processor       : 0
+vendor_id       : GenuineIntel
+model name      : Intel(R) Core(TM) i7-3770 CPU @ 3.40GHz
+flags           : fpu vme de pse
+bugs            :
+power management:
+
+processor       : 1
+vendor_id       : GenuineIntel
+model name      : Intel(R) Core(TM) i7-3770 CPU @ 3.40GHz
+flags           : fpu vme de pse
+bugs            :
+power management:
+
+""")
+
+
+class TestParseCpuinfo(object):
+
+    def test_rpi(self):
+        res = parse_cpuinfo(RPI3.splitlines(True))
+        assert len(res.processors) == 2
+        assert res.processors[1] == {
+            'processor': '1',
+            'model name': 'ARMv7 Processor rev 4 (v7l)',
+            'bogomips': '38.40',
+            'features': 'half thumb fastmult vfp edsp neon vfpv3 tls vfpv4',
+            'cpu revision': '4',
+        }
+        assert res.fields == {
+            'hardware': 'BCM2709',
+            'revision': 'a02082',
+            'serial': '00000000ae463475',
+            'model': 'Raspberry Pi 3 Model B Rev 1.2',
+        }
+        assert res.hardware == 'BCM2709'
+        assert res.revision == 'a02082'
+        assert res.serial == '00000000ae463475'
+        assert res.model == 'Raspberry Pi 3 Model B Rev 1.2'
+        assert res.get('Model Name') == 'ARMv7 Processor rev 4 (v7l)'
+
+    def test_x86(self):
+        res = parse_cpuinfo(X86.splitlines())
+        assert [p['processor'] for p in res.processors] == ['0', '1']
+        assert res.processors[0]['bugs'] == ''
+        assert res.processors[0]['power management'] == ''
+        assert res.fields == {}
+        assert res.hardware is None
+        assert res.get('foo', 'bar') == 'bar'
+        assert res.get('vendor_id') == 'GenuineIntel'
+
+    def test_no_processor_blocks(self):
+        res = parse_cpuinfo([
+            'Hardware : BCM2708\n', 'Hardware : other\n', 'garbage\n'
+        ])
+        assert res.processors == ()
+        assert res.fields == {'hardware': 'BCM2708'}
+
+    def test_eq(self):
+        a = parse_cpuinfo(RPI3.splitlines())
+        b = parse_cpuinfo(RPI3.splitlines())
+        c = parse_cpuinfo(X86.splitlines())
+        assert a == b
+        assert a != c
+        assert a != 'foo'
+        assert repr(CpuInfo()).startswith('<CpuInfo ')
+
+
+class TestReadCpuinfo(object):
+
+    def setup_method(self):
+        invalidate()
+
+    def teardown_method(self):
+        invalidate()
+
+    def test_read_cpuinfo(self, tmpdir):
+        path = str(tmpdir.join('cpuinfo'))
+        with open(path, 'w') as fh:
+            fh.write(RPI3)
+        assert read_cpuinfo(path) == parse_cpuinfo(RPI3.splitlines())
+
+    def test_get_cpuinfo_cached(self):
+        with patch('%s.read_cpuinfo' % pbm, autospec=True) as mock_read:
+            mock_read.return_value = CpuInfo()
+            assert get_cpuinfo() is mock_read.return_value
+            assert get_cpuinfo() is mock_read.return_value
+            assert get_cpuinfo('/foo') is mock_read.return_value
+            invalidate()
+            assert cpuinfo._cache == {}
+            get_cpuinfo()
+        assert mock_read.mock_calls == [
+            call('/proc/cpuinfo'), call('/foo'), call('/proc/cpuinfo')
+        ]
@@ -0,0 +1,526 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import os
+import sys
+
+import pytest
+
+from rpymostat_common.cache import read_json, write_json
+from rpymostat_common import entry_points
+from rpymostat_common.entry_points import (
+    _index_filename,
+    EntryPoint, EntryPointIndex, fingerprint, get_index, iter_entry_points,
+    INDEX_FORMAT_VERSION, get_backend, scan, select_entry_points,
+    scan_distribution, normalize_name, normalize_tag
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.entry_points'
+
+
+class TestEntryPoint(object):
+
+    def test_parts(self):
+        ep = EntryPoint('foo', 'a.b.c:Foo.Bar [x, y]', 'my.group',
+                        'mydist', '1.2.3')
+        assert ep.module_name == 'a.b.c'
+        assert ep.attrs == ('Foo', 'Bar')
+        assert ep.extras == ('x', 'y')
+        assert ep.as_list() == ['foo', 'a.b.c:Foo.Bar [x, y]', 'mydist',
+                                '1.2.3']
+
+    def test_parts_module_only(self):
+        ep = EntryPoint('foo', 'a.b', 'my.group')
+        assert ep.module_name == 'a.b'
+        assert ep.attrs == ()
+        assert ep.extras == ()
+
+    def test_parts_invalid(self):
+        ep = EntryPoint('foo', 'a b c', 'my.group')
+        with pytest.raises(ValueError):
+            ep.module_name
+
+    def test_provides(self):
+        ep = EntryPoint(
+            'foo', 'a:B [ssl, provides.my_pkg.base.Sensor,Provides.relay]',
+            'my.group'
+        )
+        assert ep.provides == ('my_pkg.base.sensor', 'relay')
+        assert EntryPoint('foo', 'a:B [ssl]', 'my.group').provides == ()
+
+    def test_normalize_tag(self):
+        assert normalize_tag('My_Pkg.Base:Sensor') == 'my_pkg.base_sensor'
+
+    def test_load(self):
+        ep = EntryPoint('foo', 'os.path:join', 'my.group')
+        assert ep.load() is os.path.join
+
+    def test_load_module(self):
+        ep = EntryPoint('foo', 'os.path', 'my.group')
+        assert ep.load() is os.path
+
+    def test_eq(self):
+        ep1 = EntryPoint('foo', 'a:B', 'grp', 'd', '1')
+        ep2 = EntryPoint('foo', 'a:B', 'grp', 'd', '1')
+        ep3 = EntryPoint('foo', 'a:B', 'grp', 'd', '2')
+        assert ep1 == ep2
+        assert not ep1 != ep2
+        assert ep1 != ep3
+        assert ep1 != 'foo'
+        assert hash(ep1) == hash(ep2)
+
+    def test_repr(self):
+        ep = EntryPoint('foo', 'a:B', 'grp', 'd', '1')
+        assert repr(ep) == '<EntryPoint foo = a:B (group=grp, dist=d 1)>'
+
+
+class TestScanPkgResources(object):
+
+    def test_scan(self):
+
+        def mock_ep(name, module_name, attrs, extras):
+            m = Mock(module_name=module_name, attrs=attrs, extras=extras)
+            m.name = name
+            return m
+
+        dist1 = Mock(project_name='d1', version='1.0')
+        dist1.get_entry_map.return_value = {
+            'grp.b': {'e1': mock_ep('e1', 'foo', ('Bar',), ())},
+            'grp.a': {'e2': mock_ep('e2', 'foo.baz', (), ('x', 'y'))},
+        }
+        dist2 = Mock(project_name='d2', version='2.0')
+        dist2.get_entry_map.return_value = {
+            'grp.a': {'e3': mock_ep('e3', 'quux', ('A', 'B'), ())},
+        }
+        with patch('pkg_resources.working_set', [dist1, dist2]):
+            res = entry_points._scan_pkg_resources()
+        assert res == {
+            'grp.a': [
+                EntryPoint('e2', 'foo.baz [x,y]', 'grp.a', 'd1', '1.0'),
+                EntryPoint('e3', 'quux:A.B', 'grp.a', 'd2', '2.0'),
+            ],
+            'grp.b': [
+                EntryPoint('e1', 'foo:Bar', 'grp.b', 'd1', '1.0'),
+            ]
+        }
+
+
+class TestScanImportlibMetadata(object):
+
+    def test_scan(self):
+
+        def mock_ep(name, value, group):
+            m = Mock(value=value, group=group)
+            m.name = name
+            return m
+
+        dist1 = Mock(metadata={'Name': 'd1'}, version='1.0')
+        dist1.entry_points = [
+            mock_ep('e1', 'foo:Bar', 'grp.b'),
+            mock_ep('e2', 'foo.baz [x,y]', 'grp.a'),
+        ]
+        dist2 = Mock(metadata={'Name': 'd2'}, version='2.0')
+        dist2.entry_points = [mock_ep('e3', 'quux:A.B', 'grp.a')]
+        # shadowed by dist1, which is earlier on sys.path
+        dist3 = Mock(metadata={'Name': 'D1'}, version='0.1')
+        dist3.entry_points = [mock_ep('e4', 'old:Bar', 'grp.b')]
+        with patch('%s._metadata_module' % pbm) as mock_mm:
+            mock_mm.return_value.distributions.return_value = [
+                dist1, dist2, dist3
+            ]
+            res = entry_points._scan_importlib_metadata()
+        assert res == {
+            'grp.a': [
+                EntryPoint('e2', 'foo.baz [x,y]', 'grp.a', 'd1', '1.0'),
+                EntryPoint('e3', 'quux:A.B', 'grp.a', 'd2', '2.0'),
+            ],
+            'grp.b': [
+                EntryPoint('e1', 'foo:Bar', 'grp.b', 'd1', '1.0'),
+            ]
+        }
+
+    def test_metadata_module(self):
+        res = entry_points._metadata_module()
+        if res is not None:
+            assert hasattr(res, 'distributions')
+
+    def test_metadata_module_none(self):
+        with patch.dict('sys.modules', {
+            'importlib.metadata': None, 'importlib_metadata': None
+        }):
+            assert entry_points._metadata_module() is None
+
+
+class TestScanDistribution(object):
+
+    def test_dist_info(self, tmpdir):
+        meta = tmpdir.mkdir('My_Dist-1.0.dist-info')
+        meta.join('METADATA').write(
+            'Metadata-Version: 2.1\nName: My.Dist\nVersion: 1.0.post1\n'
+            '\nName: not a header\n'
+        )
+        meta.join('entry_points.txt').write(
+            '# comment\nignored = before:Section\n[grp.a]\n'
+            'e1 = foo.bar:Baz [extra]\n; comment\nnot an entry point\n\n'
+            '[ grp.b ]\ne2=quux\n'
+        )
+        assert scan_distribution(str(meta)) == [
+            EntryPoint('e1', 'foo.bar:Baz [extra]', 'grp.a', 'My.Dist',
+                       '1.0.post1'),
+            EntryPoint('e2', 'quux', 'grp.b', 'My.Dist', '1.0.post1'),
+        ]
+
+    def test_egg_dir_no_metadata(self, tmpdir):
+        egg = tmpdir.mkdir('foo-2.0-py2.7.egg')
+        egg.mkdir('EGG-INFO').join('entry_points.txt').write(
+            '[grp]\ne1 = foo:Bar\n'
+        )
+        assert scan_distribution(str(egg)) == [
+            EntryPoint('e1', 'foo:Bar', 'grp', 'foo', '2.0')
+        ]
+
+    def test_no_entry_points(self, tmpdir):
+        meta = tmpdir.mkdir('foo-1.0.egg-info')
+        meta.join('PKG-INFO').write('Name: foo\nVersion: 1.0\n')
+        assert scan_distribution(str(meta)) == []
+
+    def test_not_directory(self, tmpdir):
+        link = tmpdir.join('foo.egg-link')
+        link.write('/foo\n')
+        assert scan_distribution(str(link)) is None
+
+    def test_normalize_name(self):
+        assert normalize_name('My_Dist.foo--Bar') == 'my-dist-foo-bar'
+        assert normalize_name(None) == ''
+
+
+class TestBackend(object):
+
+    def test_get_backend_importlib(self):
+        with patch.dict('os.environ', {}, clear=True):
+            with patch('%s._metadata_module' % pbm) as mock_mm:
+                mock_mm.return_value = Mock()
+                assert get_backend() == 'importlib.metadata'
+
+    def test_get_backend_pkg_resources(self):
+        with patch.dict('os.environ', {}, clear=True):
+            with patch('%s._metadata_module' % pbm) as mock_mm:
+                mock_mm.return_value = None
+                assert get_backend() == 'pkg_resources'
+
+    def test_get_backend_env(self):
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_ENTRY_POINT_BACKEND': 'pkg_resources'}):
+            with patch('%s._metadata_module' % pbm) as mock_mm:
+                mock_mm.return_value = Mock()
+                assert get_backend() == 'pkg_resources'
+
+    def test_scan(self):
+        mock_be = Mock(return_value={'foo': []})
+        with patch.dict('%s.BACKENDS' % pbm, {'mybackend': mock_be}):
+            with patch('%s.get_backend' % pbm) as mock_gb:
+                mock_gb.return_value = 'mybackend'
+                assert scan() == {'foo': []}
+                assert scan('mybackend') == {'foo': []}
+        assert mock_gb.mock_calls == [call()]
+        assert mock_be.mock_calls == [call(), call()]
+
+    def test_backends_agree(self):
+        pytest.importorskip('pkg_resources')
+        if entry_points._metadata_module() is None:
+            pytest.skip('importlib.metadata not available')
+        a = scan('pkg_resources')
+        b = scan('importlib.metadata')
+        assert sorted(a.keys()) == sorted(b.keys())
+        for group in a:
+            assert sorted(x.name for x in a[group]) == sorted(
+                x.name for x in b[group])
+
+
+class TestFingerprint(object):
+
+    def test_fingerprint(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        site.mkdir('foo-1.0.dist-info').join('entry_points.txt').write('')
+        site.mkdir('bar.egg-info')
+        site.mkdir('somepkg')
+        site.join('baz.egg-link').write('')
+        missing = str(tmpdir.join('missing.zip'))
+        res = fingerprint([str(site), missing])
+        assert res['python'] == sys.version
+        assert res['path'] == [str(site), missing]
+        dists = res['dists']
+        assert [x[0] for x in dists] == [
+            os.path.join(str(site), 'bar.egg-info'),
+            os.path.join(str(site), 'baz.egg-link'),
+            os.path.join(str(site), 'foo-1.0.dist-info'),
+            missing
+        ]
+        assert dists[0][2] is None
+        assert dists[1][2] is None
+        assert dists[2][2] is not None
+        assert dists[3] == [missing, None]
+
+    def test_fingerprint_changes(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        before = fingerprint([str(site)])
+        assert fingerprint([str(site)]) == before
+        site.mkdir('foo-1.0.dist-info')
+        assert fingerprint([str(site)]) != before
+
+    def test_fingerprint_default_path(self):
+        with patch('%s.sys.path' % pbm, []):
+            res = fingerprint()
+        assert res['path'] == []
+        assert res['dists'] == []
+
+
+class TestIndexFilename(object):
+
+    def test_index_filename(self):
+        with patch('%s.sys' % pbm) as mock_sys:
+            mock_sys.executable = '/usr/bin/python3'
+            mock_sys.path = ['/a', '/b']
+            res1 = _index_filename()
+            assert _index_filename() == res1
+            mock_sys.executable = '/venv/bin/python3'
+            res2 = _index_filename()
+            mock_sys.path = ['/a', '/c']
+            res3 = _index_filename()
+            mock_sys.executable = None
+            res4 = _index_filename()
+        assert len(set([res1, res2, res3, res4])) == 4
+        for res in [res1, res2, res3, res4]:
+            assert len(res) == len('entry_points-12345678.json')
+            assert res.startswith('entry_points-')
+
+
+class TestEntryPointIndex(object):
+
+    def setup_method(self):
+        self.groups = {
+            'grp.a': [EntryPoint('e1', 'foo:Bar', 'grp.a', 'd1', '1.0')],
+            'grp.b': [EntryPoint('e2', 'baz:Quux', 'grp.b', 'd2', '2.0')],
+        }
+        self.fp = {'python': 'x', 'path': [], 'dists': [['a', 1.5, None]]}
+
+    def test_default_path(self):
+        with patch('%s.cache_dir' % pbm) as mock_cd:
+            with patch('%s._index_filename' % pbm) as mock_fn:
+                mock_cd.return_value = '/cache'
+                mock_fn.return_value = 'entry_points-1234.json'
+                cls = EntryPointIndex()
+        assert cls.path == '/cache/entry_points-1234.json'
+        assert cls.persist is True
+        assert cls.backend is None
+
+    def test_rebuild_backend(self, tmpdir):
+        with patch('%s.scan' % pbm) as mock_scan:
+            mock_scan.return_value = self.groups
+            cls = EntryPointIndex(persist=False, backend='pkg_resources')
+            assert cls.groups() == self.groups
+        assert mock_scan.mock_calls == [call('pkg_resources')]
+
+    def test_rebuild_and_load(self, tmpdir):
+        path = str(tmpdir.join('idx.json'))
+        with patch.multiple(
+            pbm,
+            fingerprint=DEFAULT,
+            scan=DEFAULT,
+        ) as mocks:
+            mocks['fingerprint'].return_value = self.fp
+            mocks['scan'].return_value = self.groups
+            cls = EntryPointIndex(path=path)
+            assert cls.groups() == self.groups
+            assert cls.entry_points('grp.a') == self.groups['grp.a']
+            assert cls.entry_points('grp.c') == []
+            # second index instance loads from disk without scanning
+            cls2 = EntryPointIndex(path=path)
+            assert cls2.groups() == self.groups
+        assert mocks['scan'].mock_calls == [call(None)]
+        assert read_json(path)['version'] == INDEX_FORMAT_VERSION
+
+    def test_stale(self, tmpdir):
+        path = str(tmpdir.join('idx.json'))
+        write_json(path, {
+            'version': INDEX_FORMAT_VERSION,
+            'fingerprint': {'python': 'y', 'path': [], 'dists': []},
+            'groups': {'grp.c': [['e3', 'x:Y', 'd3', '3.0']]}
+        })
+        with patch.multiple(
+            pbm,
+            fingerprint=DEFAULT,
+            scan=DEFAULT,
+        ) as mocks:
+            mocks['fingerprint'].return_value = self.fp
+            mocks['scan'].return_value = self.groups
+            cls = EntryPointIndex(path=path)
+            assert cls.groups() == self.groups
+        assert mocks['scan'].mock_calls == [call(None)]
+        assert read_json(path)['fingerprint'] == self.fp
+
+    def test_old_format(self, tmpdir):
+        path = str(tmpdir.join('idx.json'))
+        write_json(path, {'version': 0, 'fingerprint': self.fp, 'groups': {}})
+        with patch.multiple(
+            pbm,
+            fingerprint=DEFAULT,
+            scan=DEFAULT,
+        ) as mocks:
+            mocks['fingerprint'].return_value = self.fp
+            mocks['scan'].return_value = self.groups
+            cls = EntryPointIndex(path=path)
+            assert cls.groups() == self.groups
+        assert mocks['scan'].mock_calls == [call(None)]
+
+    def test_not_persisted(self, tmpdir):
+        path = str(tmpdir.join('idx.json'))
+        with patch.multiple(
+            pbm,
+            fingerprint=DEFAULT,
+            scan=DEFAULT,
+        ) as mocks:
+            mocks['fingerprint'].return_value = self.fp
+            mocks['scan'].return_value = self.groups
+            cls = EntryPointIndex(path=path, persist=False)
+            assert cls.groups() == self.groups
+            assert cls.groups() == self.groups
+            cls.invalidate()
+            assert cls.groups() == self.groups
+        assert mocks['scan'].mock_calls == [call(None), call(None)]
+        assert not os.path.exists(path)
+
+    def test_select(self):
+        self.groups['other'] = [EntryPoint('e3', 'x:Y', 'other', 'd3', '3')]
+        with patch('%s.scan' % pbm) as mock_scan:
+            mock_scan.return_value = self.groups
+            cls = EntryPointIndex(persist=False)
+            res = cls.select(['grp.missing', 'grp.*', 'grp.a', 'nope.*'])
+            assert cls.select('grp.b') == {'grp.b': self.groups['grp.b']}
+        assert list(res.keys()) == ['grp.missing', 'grp.a', 'grp.b']
+        assert res['grp.missing'] == []
+        assert res['grp.a'] == self.groups['grp.a']
+        assert res['grp.b'] == self.groups['grp.b']
+        assert mock_scan.mock_calls == [call(None)]
+
+
+class TestModuleFunctions(object):
+
+    def setup_method(self):
+        entry_points._index = None
+
+    def teardown_method(self):
+        entry_points._index = None
+
+    def test_get_index(self):
+        with patch.dict('os.environ', {}, clear=True):
+            with patch('%s.cache_dir' % pbm) as mock_cd:
+                mock_cd.return_value = '/cache'
+                res = get_index()
+        assert res.path == os.path.join('/cache', _index_filename())
+        assert res.persist is True
+        assert get_index() is res
+
+    def test_get_index_env(self):
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_ENTRY_POINT_INDEX': '/foo.json'}):
+            res = get_index()
+        assert res.path == '/foo.json'
+        assert res.persist is True
+
+    def test_static_registry_missing(self):
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_STATIC_REGISTRY': 'rpymostat_no_such'}):
+            with patch('%s.logger' % pbm) as mock_logger:
+                res = get_index()
+        assert type(res) is EntryPointIndex
+        assert mock_logger.mock_calls[0] == call.debug(
+            'No static plugin registry module %s', 'rpymostat_no_such'
+        )
+
+    def test_static_registry_broken(self, tmpdir):
+        tmpdir.join('rpymostat_broken_reg.py').write('import no_such_mod\n')
+        sys.path.insert(0, str(tmpdir))
+        try:
+            with patch.dict('os.environ', {
+                'RPYMOSTAT_STATIC_REGISTRY': 'rpymostat_broken_reg'
+            }):
+                with patch('%s.logger' % pbm) as mock_logger:
+                    res = get_index()
+        finally:
+            sys.path.remove(str(tmpdir))
+            sys.modules.pop('rpymostat_broken_reg', None)
+        assert type(res) is EntryPointIndex
+        assert mock_logger.warning.call_count == 1
+
+    def test_static_registry_disabled(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_STATIC_REGISTRY': ''}):
+            with patch('%s.importlib' % pbm) as mock_il:
+                res = get_index()
+        assert type(res) is EntryPointIndex
+        assert mock_il.mock_calls == []
+
+    def test_get_index_env_disabled(self):
+        with patch.dict('os.environ', {'RPYMOSTAT_ENTRY_POINT_INDEX': ''}):
+            res = get_index()
+        assert res.persist is False
+
+    def test_iter_entry_points(self):
+        eps = [Mock(), Mock()]
+        with patch('%s.get_index' % pbm) as mock_gi:
+            mock_gi.return_value.entry_points.return_value = eps
+            res = iter_entry_points('my.group')
+            assert list(res) == eps
+        assert mock_gi.mock_calls == [
+            call(), call().entry_points('my.group')
+        ]
+
+    def test_select_entry_points(self):
+        with patch('%s.get_index' % pbm) as mock_gi:
+            res = select_entry_points(['my.*'])
+        assert mock_gi.mock_calls == [call(), call().select(['my.*'])]
+        assert res is mock_gi.return_value.select.return_value
@@ -0,0 +1,194 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from rpymostat_common.entry_points import EntryPoint
+from rpymostat_common.forkserver import PluginForkServer
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.forkserver'
+
+
+class Plugin(object):
+    pass
+
+
+def worker(plugins, write_fd, prefix, suffix=''):
+    os.write(write_fd, ('%s%s:%s:%s%s' % (
+        prefix, sorted(plugins), plugins['my.group'][0].__name__,
+        os.getppid(), suffix
+    )).encode('utf-8'))
+    return 3
+
+
+def worker_none(plugins):
+    return None
+
+
+def se_raise(plugins):
+    raise RuntimeError('foo')
+
+
+def se_exit(plugins):
+    sys.exit(4)
+
+
+def se_exit_none(plugins):
+    sys.exit()
+
+
+def se_exit_str(plugins):
+    sys.exit('bye')
+
+
+def se_kill(plugins):
+    os.kill(os.getpid(), 9)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork()')
+class TestPluginForkServer(object):
+
+    def setup_method(self):
+        self.cls = None
+
+    def teardown_method(self):
+        if self.cls is not None:
+            self.cls.stop()
+
+    def test_spawn(self):
+        read_fd, write_fd = os.pipe()
+        cls = PluginForkServer('my.*', superclass=Plugin, negative_cache=False)
+        self.cls = cls
+        with patch('%s.load_groups' % pbm) as mock_lg:
+            mock_lg.return_value = {'my.group': [Plugin]}
+            cls.preload()
+            # threads started after preload() are not in the server process
+            t = threading.Thread(target=time.sleep, args=(0.5,))
+            t.start()
+            pid = cls.spawn(worker, args=(write_fd, '>'),
+                            kwargs={'suffix': '<'})
+            assert cls.workers == {pid: 'worker'}
+            assert cls.join() == {pid: 3}
+            # plugins are only loaded once
+            pid2 = cls.spawn(worker_none, name='other')
+            assert cls.join(pid2) == {pid2: 0}
+            t.join()
+        os.close(write_fd)
+        out = os.read(read_fd, 1024).decode('utf-8')
+        os.close(read_fd)
+        assert out == ">['my.group']:Plugin:%s<" % cls.server_pid
+        assert cls.server_pid != os.getpid()
+        assert mock_lg.mock_calls == [
+            call('my.*', superclass=Plugin, negative_cache=False)
+        ]
+        assert cls.workers == {}
+        assert cls.join() == {}
+
+    def test_worker_exceptions(self, capfd):
+        cls = PluginForkServer('my.group')
+        self.cls = cls
+        cls.plugins = {'my.group': []}
+        with patch('%s.logger' % pbm):
+            pid1 = cls.spawn(se_raise)
+            pid2 = cls.spawn(se_exit)
+            pid3 = cls.spawn(se_kill)
+            pid4 = cls.spawn(se_exit_none)
+            pid5 = cls.spawn(se_exit_str)
+            assert cls.join() == {
+                pid1: 1, pid2: 4, pid3: -9, pid4: 0, pid5: 1
+            }
+        assert 'bye' in capfd.readouterr()[1]
+
+    def test_request_errors(self):
+        cls = PluginForkServer('my.group')
+        self.cls = cls
+        cls.plugins = {'my.group': []}
+        cls.preload()
+        with pytest.raises(RuntimeError):
+            cls.join(1)
+        # the server keeps serving after an error
+        pid = cls.spawn(worker_none)
+        assert cls.join() == {pid: 0}
+
+    def test_stop(self):
+        cls = PluginForkServer('my.group')
+        cls.plugins = {'my.group': []}
+        cls.stop()
+        cls.preload()
+        server_pid = cls.server_pid
+        cls.stop()
+        assert cls.server_pid is None
+        with pytest.raises(OSError):
+            os.waitpid(server_pid, os.WNOHANG)
+
+    def test_preload_real(self):
+        ep = EntryPoint('p', 'rpymostat_common.tests.test_forkserver:Plugin',
+                        'my.group', 'd', '1.0')
+        cls = PluginForkServer(['my.group'])
+        with patch('rpymostat_common.loader.select_entry_points') as mock_sel:
+            mock_sel.return_value = {'my.group': [ep]}
+            assert cls.preload() == {'my.group': [Plugin]}
+            assert cls.preload() == {'my.group': [Plugin]}
+        assert len(mock_sel.mock_calls) == 1
+
+
+class TestPluginForkServerErrors(object):
+
+    def test_lazy(self):
+        with pytest.raises(ValueError):
+            PluginForkServer('my.group', lazy=True)
+
+    def test_no_fork(self):
+        with patch('%s.os' % pbm) as mock_os:
+            del mock_os.fork
+            with pytest.raises(NotImplementedError):
+                PluginForkServer('my.group')
@@ -0,0 +1,367 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+
+from rpymostat_common import introspection
+from rpymostat_common.introspection import (
+    parse_docstring, ArgumentInfo, IntrospectionCache, get_arguments,
+    invalidate, _signature_args, _iter_fields, ClassInfo, class_info
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.introspection'
+
+
+class ExampleClass(object):
+
+    def __init__(self, argOne, argTwo, kwarg1=None, kwarg2=1234, *args,
+                 **kwargs):
+        """
+        Some text here
+
+        :param argOne: arg one info
+        :type argOne: str
+        :param argTwo: arg two info is a
+          long
+          line
+        :type kwarg1: str
+        :param kwarg1: kwarg1 info
+        :type kwarg2: int
+        """
+        foo = 'bar'  # noqa
+
+
+class NoInit(object):
+    pass
+
+
+class TestParseDocstring(object):
+
+    def test_parse_docstring(self):
+        docstring = """
+        Some text here
+        About the init function
+
+        Foo
+
+        Bar.
+
+        :param argOne: arg one info
+        :type argOne: str
+        :param argTwo: arg two info is a
+          long
+          line
+        :type argTwo: int
+        :param kwarg1: kwarg1 info
+        :type kwarg1: str
+        :param kwarg2: kwarg2 info
+        :return: foo
+        """
+        res = parse_docstring(docstring)
+        assert res == {
+            'params': {
+                'argOne': 'arg one info',
+                'argTwo': 'arg two info is a long line',
+                'kwarg1': 'kwarg1 info',
+                'kwarg2': 'kwarg2 info'
+            },
+            'types': {
+                'argOne': 'str',
+                'argTwo': 'int',
+                'kwarg1': 'str'
+            }
+        }
+
+    def test_parse_docstring_consecutive_indented(self):
+        # the previous regex-based parser skipped every other field here
+        docstring = """
+        :param a: a info
+        :param b: b info
+        :param c: c info
+        """
+        assert parse_docstring(docstring) == {
+            'params': {'a': 'a info', 'b': 'b info', 'c': 'c info'},
+            'types': {}
+        }
+
+    def test_parse_docstring_raises(self):
+        docstring = """
+        :param a: a info
+        :raises: RuntimeError if foo
+        :param b: b info
+        :raises ValueError: if bar
+        """
+        assert parse_docstring(docstring) == {
+            'params': {'a': 'a info', 'b': 'b info'},
+            'types': {}
+        }
+
+    def test_parse_docstring_empty(self):
+        assert parse_docstring('') == {'params': {}, 'types': {}}
+        assert parse_docstring('foo bar') == {'params': {}, 'types': {}}
+
+    def test_iter_fields(self):
+        docstring = """
+        Foo :param notafield: here
+
+        :param a: a info, see :rtype foo
+          and more
+        :type a:  int
+        :param  missing colon
+        :returns: something
+          useful
+        :rtype: str
+        :raises: RuntimeError
+        :raise KeyError: sometimes
+        :returning: not a field
+        :param b: b info
+        """
+        assert list(_iter_fields(docstring)) == [
+            ('param', 'a', 'a info, see'),
+            ('type', 'a', 'int'),
+            ('return', None, 'something useful'),
+            ('rtype', None, 'str'),
+            ('raise', None, 'RuntimeError'),
+            ('raise', 'KeyError', 'sometimes'),
+            ('param', 'b', 'b info'),
+        ]
+
+
+class TestArgumentInfo(object):
+
+    def test_defaults(self):
+        cls = ArgumentInfo('foo')
+        assert cls.as_dict() == {
+            'name': 'foo',
+            'has_default': False,
+            'default': None,
+            'type': None,
+            'description': None
+        }
+        assert cls.varname == 'foo'
+        assert cls.help == ''
+
+    def test_varname_help(self):
+        cls = ArgumentInfo('foo', has_default=True, default=12, type='int',
+                           description='foo arg')
+        assert cls.varname == 'foo=12'
+        assert cls.help == '(int) foo arg'
+
+    def test_help_type_only(self):
+        cls = ArgumentInfo('foo', type='int')
+        assert cls.help == '(int) '
+
+    def test_help_description_only(self):
+        cls = ArgumentInfo('foo', description='desc')
+        assert cls.help == 'desc'
+
+    def test_eq(self):
+        assert ArgumentInfo('foo', type='a') == ArgumentInfo('foo', type='a')
+        assert ArgumentInfo('foo', type='a') != ArgumentInfo('foo', type='b')
+        assert ArgumentInfo('foo') != 'foo'
+        assert repr(ArgumentInfo('foo')).startswith('<ArgumentInfo {')
+
+
+class TestClassInfo(object):
+
+    def test_class_info(self):
+        cls = ClassInfo('Foo', description='foo desc', arguments=[
+            ArgumentInfo('a', type='int', description='a info'),
+            ArgumentInfo('b', has_default=True, default=2)
+        ])
+        assert cls.arguments == (
+            ArgumentInfo('a', type='int', description='a info'),
+            ArgumentInfo('b', has_default=True, default=2)
+        )
+        assert cls.varnames() == {'a': '(int) a info', 'b=2': ''}
+        d = cls.as_dict()
+        assert d['name'] == 'Foo'
+        assert d['description'] == 'foo desc'
+        assert d['arguments'][1] == {
+            'name': 'b', 'has_default': True, 'default': 2, 'type': None,
+            'description': None
+        }
+        assert ClassInfo.from_dict(d) == cls
+        assert cls != ClassInfo('Foo')
+        assert cls != 'Foo'
+        assert repr(ClassInfo('Foo')).startswith('<ClassInfo {')
+
+    def test_live_class_info(self):
+        with patch('%s.get_arguments' % pbm) as mock_ga:
+            mock_ga.return_value = (ArgumentInfo('foo'), )
+            res = class_info(ExampleClass)
+            res2 = class_info(NoInit)
+        assert res == ClassInfo('ExampleClass', arguments=[
+            ArgumentInfo('foo')
+        ])
+        ExampleClass._description = 'desc'
+        try:
+            with patch('%s.get_arguments' % pbm) as mock_ga:
+                mock_ga.return_value = ()
+                res = class_info(ExampleClass)
+        finally:
+            del ExampleClass._description
+        assert res == ClassInfo('ExampleClass', description='desc')
+        assert res2.name == 'NoInit'
+
+
+class TestSignatureArgs(object):
+
+    def test_args(self):
+        assert _signature_args(ExampleClass.__init__) == [
+            ('argOne', False, None),
+            ('argTwo', False, None),
+            ('kwarg1', True, None),
+            ('kwarg2', True, 1234),
+        ]
+
+    def test_no_init(self):
+        assert _signature_args(NoInit.__init__) == []
+
+    def test_kwargs_only(self):
+
+        class Foo(object):
+
+            def __init__(self, foo=1, bar='two'):
+                pass
+
+        assert _signature_args(Foo.__init__) == [
+            ('foo', True, 1),
+            ('bar', True, 'two'),
+        ]
+
+
+class TestIntrospectionCache(object):
+
+    def test_arguments(self):
+        cls = IntrospectionCache()
+        res = cls.arguments(ExampleClass)
+        assert res == (
+            ArgumentInfo('argOne', type='str', description='arg one info'),
+            ArgumentInfo('argTwo',
+                         description='arg two info is a long line'),
+            ArgumentInfo('kwarg1', has_default=True, type='str',
+                         description='kwarg1 info'),
+            ArgumentInfo('kwarg2', has_default=True, default=1234,
+                         type='int'),
+        )
+        assert cls.arguments(NoInit) == ()
+
+    def test_cached(self):
+        cls = IntrospectionCache()
+        with patch('%s._init_arguments' % pbm) as mock_ia:
+            mock_ia.return_value = [ArgumentInfo('foo')]
+            res1 = cls.arguments(ExampleClass)
+            res2 = cls.arguments(ExampleClass)
+        assert res1 == (ArgumentInfo('foo'), )
+        assert res2 is res1
+        assert mock_ia.mock_calls == [call(ExampleClass)]
+        assert cls.hits == 1
+        assert cls.misses == 1
+        assert len(cls) == 1
+
+    def test_lru_eviction(self):
+        classes = [type('Cls%d' % x, (object, ), {}) for x in range(4)]
+        cls = IntrospectionCache(maxsize=2)
+        with patch('%s._init_arguments' % pbm) as mock_ia:
+            mock_ia.return_value = []
+            cls.arguments(classes[0])
+            cls.arguments(classes[1])
+            # classes[0] is now most recently used
+            cls.arguments(classes[0])
+            # evicts classes[1]
+            cls.arguments(classes[2])
+            assert len(cls) == 2
+            cls.arguments(classes[0])
+            cls.arguments(classes[1])
+        assert mock_ia.mock_calls == [
+            call(classes[0]),
+            call(classes[1]),
+            call(classes[2]),
+            call(classes[1]),
+        ]
+
+    def test_invalidate(self):
+        cls = IntrospectionCache()
+        with patch('%s._init_arguments' % pbm) as mock_ia:
+            mock_ia.return_value = []
+            cls.arguments(ExampleClass)
+            cls.arguments(NoInit)
+            cls.invalidate(ExampleClass)
+            cls.invalidate(ExampleClass)
+            assert len(cls) == 1
+            cls.arguments(ExampleClass)
+            cls.invalidate()
+            assert len(cls) == 0
+            cls.arguments(NoInit)
+        assert mock_ia.mock_calls == [
+            call(ExampleClass),
+            call(NoInit),
+            call(ExampleClass),
+            call(NoInit),
+        ]
+
+
+class TestModuleFunctions(object):
+
+    def test_get_arguments(self):
+        with patch('%s.cache' % pbm) as mock_cache:
+            mock_cache.arguments.return_value = ()
+            assert get_arguments(ExampleClass) == ()
+        assert mock_cache.mock_calls == [call.arguments(ExampleClass)]
+
+    def test_invalidate(self):
+        with patch('%s.cache' % pbm) as mock_cache:
+            invalidate(ExampleClass)
+            invalidate()
+        assert mock_cache.mock_calls == [
+            call.invalidate(ExampleClass),
+            call.invalidate(None)
+        ]
+
+    def test_default_cache(self):
+        assert isinstance(introspection.cache, IntrospectionCache)
@@ -0,0 +1,196 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+import threading
+
+from rpymostat_common.entry_points import EntryPoint
+from rpymostat_common.introspection import ClassInfo
+from rpymostat_common.isolation import (
+    PluginCheck, check_entry_points, _check_worker
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.isolation'
+pbt = 'rpymostat_common.tests.test_isolation'
+
+
+class BasePlugin(object):
+    pass
+
+
+class GoodPlugin(BasePlugin):
+    """
+    A plugin.
+    """
+
+    _description = 'Good plugin'
+
+    def __init__(self, interval=5):
+        """
+        :param interval: polling interval
+        :type interval: int
+        """
+        pass
+
+
+class OtherPlugin(object):
+    pass
+
+
+class UnpicklablePlugin(BasePlugin):
+
+    _description = threading.Lock()
+
+    def __init__(self, cb=lambda x: x, lock=threading.Lock(), interval=5):
+        pass
+
+
+class TestCheckEntryPoints(object):
+
+    def setup_method(self):
+        self.modules = []
+
+    def teardown_method(self):
+        for mod in self.modules:
+            sys.modules.pop(mod, None)
+
+    def write_module(self, tmpdir, name, src):
+        tmpdir.join('%s.py' % name).write(src)
+        self.modules.append(name)
+        return EntryPoint(name, '%s:Plugin' % name, 'grp', 'd', '1.0')
+
+    def test_check(self, tmpdir):
+        crash = self.write_module(
+            tmpdir, 'isoplug_crash', 'import os\nos._exit(3)\n'
+        )
+        broken = self.write_module(
+            tmpdir, 'isoplug_broken', 'raise ValueError()\n'
+        )
+        hang = self.write_module(
+            tmpdir, 'isoplug_hang', 'import time\ntime.sleep(30)\n'
+        )
+        eps = [
+            EntryPoint('good', '%s:GoodPlugin' % pbt, 'grp', 'd', '1.0'),
+            EntryPoint('other', '%s:OtherPlugin' % pbt, 'grp', 'd', '1.0'),
+            broken,
+            crash,
+            hang,
+        ]
+        sys.path.insert(0, str(tmpdir))
+        try:
+            res = check_entry_points(eps, superclass=BasePlugin, processes=2,
+                                     timeout=1)
+        finally:
+            sys.path.remove(str(tmpdir))
+        assert [c.entry_point for c in res] == eps
+        assert [c.passed for c in res] == [True, False, False, False, False]
+        assert [c.reason for c in res] == [
+            None, 'incompatible', 'ValueError', 'exitcode 3', 'timeout'
+        ]
+        assert res[0].description == 'Good plugin'
+        assert res[0].class_info == ClassInfo(
+            'GoodPlugin', description='Good plugin',
+            arguments=res[0].class_info.arguments
+        )
+        assert res[0].class_info.varnames() == {
+            'interval=5': '(int) polling interval'
+        }
+        assert res[1].loaded is True
+        assert res[1].compatible is False
+        assert res[3].crashed is True
+        assert res[4].timed_out is True
+        assert res[4].duration >= 1
+        # nothing was imported in this process
+        assert 'isoplug_crash' not in sys.modules
+        assert 'isoplug_hang' not in sys.modules
+
+    def test_no_superclass(self):
+        ep = EntryPoint('other', '%s:OtherPlugin' % pbt, 'grp', 'd', '1.0')
+        res = check_entry_points([ep])
+        assert res[0].passed is True
+        assert res[0].description is None
+
+
+    def test_unpicklable_metadata(self):
+        ep = EntryPoint('u', '%s:UnpicklablePlugin' % pbt, 'grp', 'd', '1.0')
+        res = check_entry_points([ep], superclass=BasePlugin)
+        assert res[0].passed is True
+        assert res[0].crashed is False
+        assert res[0].description == repr(UnpicklablePlugin._description)
+        args = dict((a.name, a) for a in res[0].class_info.arguments)
+        assert args['cb'].default.startswith('<function')
+        assert 'lock' in args['lock'].default
+        assert args['interval'].default == 5
+
+    def test_send_failure(self):
+        conn = Mock()
+        conn.send.side_effect = [RuntimeError('foo'), None]
+        ep = EntryPoint('good', '%s:GoodPlugin' % pbt, 'grp', 'd', '1.0')
+        with patch('%s.logger' % pbm):
+            _check_worker(ep, BasePlugin, conn)
+        assert conn.send.mock_calls[1] == call({
+            'loaded': True, 'compatible': True, 'description': None,
+            'class_info': None, 'exception': None
+        })
+        assert conn.close.mock_calls == [call()]
+
+
+class TestPluginCheck(object):
+
+    def test_as_dict(self):
+        ep = EntryPoint('good', 'foo:Bar', 'grp', 'd', '1.0')
+        cls = PluginCheck(ep)
+        cls.loaded = True
+        cls.compatible = True
+        cls.class_info = ClassInfo('Bar')
+        d = cls.as_dict()
+        assert d['entry_point'] == ['good', 'foo:Bar', 'd', '1.0']
+        assert d['name'] == 'good'
+        assert d['group'] == 'grp'
+        assert d['class_info'] == ClassInfo('Bar').as_dict()
+        assert d['exitcode'] is None
+        assert 'passed=True' in repr(cls)
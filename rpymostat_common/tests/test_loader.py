@@ -35,12 +35,23 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ##################################################################################
 """
 
+import copy
+import json
 import sys
-import pkg_resources
+import threading
 
+import pytest
+
+from rpymostat_common.entry_points import EntryPoint
 from rpymostat_common.loader import (
-    load_classes, _get_varnames, _parse_docstring, list_classes
+    load_classes, _get_varnames, list_classes, LazyPlugin, PluginLoadRecord,
+    list_classes_static, NegativeCache, default_negative_cache, load_groups,
+    unload_modules, UnloadReport, iter_class_info, iter_class_info_static,
+    class_info_json_lines
 )
+from rpymostat_common.introspection import ArgumentInfo, ClassInfo
+from rpymostat_common.isolation import PluginCheck
+from rpymostat_common import introspection
 
 # https://code.google.com/p/mock/issues/detail?id=249
 # py>=3.4 should use unittest.mock not the mock package on pypi
@@ -48,11 +59,16 @@ if (
         sys.version_info[0] < 3 or
         sys.version_info[0] == 3 and sys.version_info[1] < 4
 ):
-    from mock import patch, call, Mock, DEFAULT, mock_open, MagicMock  # noqa
+    from mock import (  # noqa
+        patch, call, Mock, DEFAULT, mock_open, MagicMock, ANY
+    )
 else:
-    from unittest.mock import patch, call, Mock, DEFAULT, mock_open, MagicMock  # noqa
+    from unittest.mock import (  # noqa
+        patch, call, Mock, DEFAULT, mock_open, MagicMock, ANY
+    )
 
 pbm = 'rpymostat_common.loader'
+pbi = 'rpymostat_common.introspection'
 
 
 class BaseClass(object):
@@ -92,8 +108,147 @@ class TestClass(BaseClass):
         return {}
 
 
+class TestLazyPlugin(object):
+
+    def setup_method(self):
+        self.ep = EntryPoint('myep', 'rpymostat_common.tests.test_loader:'
+                             'TestClass', 'my.group', 'mydist', '1.0')
+
+    def test_init(self):
+        cls = LazyPlugin(self.ep)
+        assert cls.entry_point == self.ep
+        assert cls.superclass is None
+        assert cls.name == 'myep'
+        assert cls.target == ('rpymostat_common.tests.test_loader:'
+                              'TestClass')
+        assert cls.__name__ == 'TestClass'
+        assert cls.loaded is False
+        assert repr(cls) == (
+            '<LazyPlugin myep = rpymostat_common.tests.test_loader:TestClass '
+            '(not loaded)>'
+        )
+
+    def test_name_module(self):
+        cls = LazyPlugin(EntryPoint('foo', 'foo.bar', 'grp'))
+        assert cls.__name__ == 'foo.bar'
+
+    def test_load(self):
+        mock_ep = Mock(spec_set=EntryPoint)
+        mock_ep.load.return_value = TestClass
+        cls = LazyPlugin(mock_ep, superclass=BaseClass)
+        assert mock_ep.load.mock_calls == []
+        assert cls.load() is TestClass
+        assert cls.load() is TestClass
+        assert cls.loaded is True
+        assert mock_ep.load.mock_calls == [call()]
+
+    def test_load_wrong_superclass(self):
+
+        class Other(object):
+            pass
+
+        mock_ep = Mock(spec_set=EntryPoint)
+        mock_ep.load.return_value = Other
+        cls = LazyPlugin(mock_ep, superclass=BaseClass)
+        with pytest.raises(TypeError):
+            cls.load()
+        assert cls.loaded is False
+
+    def test_getattr(self):
+        cls = LazyPlugin(self.ep, superclass=BaseClass)
+        assert cls._description == 'foo desc'
+        assert cls.loaded is True
+
+    def test_call(self):
+        cls = LazyPlugin(self.ep)
+        res = cls('a', 'b', kwarg2=5)
+        assert isinstance(res, TestClass)
+        assert cls.loaded is True
+
+    def test_copy(self):
+        cls = LazyPlugin(self.ep)
+        res = copy.copy(cls)
+        assert res.entry_point == self.ep
+        assert res.loaded is False
+
+
+class TestNegativeCache(object):
+
+    def setup_method(self):
+        self.ep = EntryPoint('ep1', 'foo:EP1', 'my.group', 'd1', '1.0')
+        self.cls = NegativeCache(ttl=10)
+
+    def test_add_skip(self):
+        assert self.cls.should_skip(self.ep) is False
+        with patch('%s._now' % pbm) as mock_now:
+            mock_now.return_value = 100
+            self.cls.add(self.ep, 'ImportError')
+            mock_now.return_value = 105
+            assert self.cls.should_skip(self.ep) is True
+            assert self.cls.should_skip(self.ep) is True
+            assert len(self.cls) == 1
+            assert self.cls.failures() == [{
+                'group': 'my.group',
+                'name': 'ep1',
+                'target': 'foo:EP1',
+                'dist_name': 'd1',
+                'dist_version': '1.0',
+                'reason': 'ImportError',
+                'age': 5,
+                'skipped': 2
+            }]
+            assert self.cls.skipped() == self.cls.failures()
+
+    def test_ttl_expired(self):
+        with patch('%s._now' % pbm) as mock_now:
+            mock_now.return_value = 100
+            self.cls.add(self.ep, 'ImportError')
+            mock_now.return_value = 110
+            assert self.cls.should_skip(self.ep) is False
+            assert len(self.cls) == 0
+
+    def test_contains(self):
+        assert self.ep not in self.cls
+        with patch('%s._now' % pbm) as mock_now:
+            mock_now.return_value = 100
+            self.cls.add(self.ep, 'ImportError')
+            mock_now.return_value = 105
+            assert self.ep in self.cls
+            assert self.cls.failures()[0]['skipped'] == 0
+            mock_now.return_value = 110
+            assert self.ep not in self.cls
+
+    def test_no_ttl(self):
+        cls = NegativeCache(ttl=None)
+        with patch('%s._now' % pbm) as mock_now:
+            mock_now.return_value = 100
+            cls.add(self.ep, 'ImportError')
+            mock_now.return_value = 100000
+            assert cls.should_skip(self.ep) is True
+
+    def test_version_changed(self):
+        self.cls.add(self.ep, 'ImportError')
+        upgraded = EntryPoint('ep1', 'foo:EP1', 'my.group', 'd1', '1.1')
+        assert self.cls.should_skip(upgraded) is False
+        assert self.cls.skipped() == []
+
+    def test_discard_clear(self):
+        other = EntryPoint('ep2', 'foo:EP2', 'my.group', 'd1', '1.0')
+        self.cls.add(self.ep)
+        self.cls.add(other)
+        self.cls.discard(self.ep)
+        assert self.cls.should_skip(self.ep) is False
+        assert self.cls.should_skip(other) is True
+        self.cls.clear()
+        assert len(self.cls) == 0
+
+
 class TestLoader(object):
 
+    def setup_method(self):
+        introspection.invalidate()
+        default_negative_cache.clear()
+
     def test_load_classes(self):
 
         def se_exc(*args, **kwargs):
@@ -102,32 +257,32 @@ class TestLoader(object):
         class EP1(object):
             name = 'EP1'
 
-        mock_ep1 = Mock(spec_set=pkg_resources.EntryPoint)
+        mock_ep1 = Mock(spec_set=EntryPoint)
         type(mock_ep1).name = 'ep1'
         mock_ep1.load.return_value = EP1
 
         class EP2(object):
             name = 'EP2'
 
-        mock_ep2 = Mock(spec_set=pkg_resources.EntryPoint)
+        mock_ep2 = Mock(spec_set=EntryPoint)
         type(mock_ep2).name = 'ep1'
         mock_ep2.load.return_value = EP2
 
         class EP3(object):
             name = 'EP3'
 
-        mock_ep3 = Mock(spec_set=pkg_resources.EntryPoint)
+        mock_ep3 = Mock(spec_set=EntryPoint)
         type(mock_ep3).name = 'ep3'
         mock_ep3.load.return_value = EP3
 
-        mock_ep4 = Mock(spec_set=pkg_resources.EntryPoint)
+        mock_ep4 = Mock(spec_set=EntryPoint)
         type(mock_ep4).name = 'ep4'
         mock_ep4.load.side_effect = se_exc
 
         entry_points = [mock_ep1, mock_ep2, mock_ep3, mock_ep4]
 
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
-            with patch('%s.pkg_resources.iter_entry_points' % pbm,
+            with patch('%s.iter_entry_points' % pbm,
                        autospec=True) as mock_iep:
                 mock_iep.return_value = entry_points
                 res = load_classes('my.entrypoint')
@@ -157,28 +312,31 @@ class TestLoader(object):
         class EP1(MySuperClass):
             name = 'EP1'
 
-        mock_ep1 = Mock(spec_set=pkg_resources.EntryPoint)
+        mock_ep1 = Mock(spec_set=EntryPoint)
+        mock_ep1.provides = ()
         type(mock_ep1).name = 'ep1'
         mock_ep1.load.return_value = EP1
 
         class EP2(object):
             name = 'EP2'
 
-        mock_ep2 = Mock(spec_set=pkg_resources.EntryPoint)
+        mock_ep2 = Mock(spec_set=EntryPoint)
+        mock_ep2.provides = ()
         type(mock_ep2).name = 'ep1'
         mock_ep2.load.return_value = EP2
 
         class EP3(MySuperClass):
             name = 'EP3'
 
-        mock_ep3 = Mock(spec_set=pkg_resources.EntryPoint)
+        mock_ep3 = Mock(spec_set=EntryPoint)
+        mock_ep3.provides = ()
         type(mock_ep3).name = 'ep3'
         mock_ep3.load.return_value = EP3
 
         entry_points = [mock_ep1, mock_ep2, mock_ep3]
 
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
-            with patch('%s.pkg_resources.iter_entry_points' % pbm,
+            with patch('%s.iter_entry_points' % pbm,
                        autospec=True) as mock_iep:
                 mock_iep.return_value = entry_points
                 res = load_classes('my.entrypoint', superclass=MySuperClass)
@@ -196,6 +354,603 @@ class TestLoader(object):
                        2, 'my.entrypoint', ['EP1', 'EP3'])
         ]
 
+    def test_load_classes_lazy(self):
+        mock_ep1 = Mock(spec_set=EntryPoint)
+        mock_ep1.provides = ()
+        type(mock_ep1).name = 'ep1'
+        mock_ep2 = Mock(spec_set=EntryPoint)
+        mock_ep2.provides = ()
+        type(mock_ep2).name = 'ep2'
+
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            with patch('%s.iter_entry_points' % pbm,
+                       autospec=True) as mock_iep:
+                mock_iep.return_value = [mock_ep1, mock_ep2]
+                res = load_classes('my.entrypoint', superclass=BaseClass,
+                                   lazy=True)
+        assert len(res) == 2
+        assert isinstance(res[0], LazyPlugin)
+        assert res[0].entry_point == mock_ep1
+        assert res[0].superclass == BaseClass
+        assert res[1].entry_point == mock_ep2
+        assert mock_ep1.load.mock_calls == []
+        assert mock_ep2.load.mock_calls == []
+        assert mock_logger.mock_calls == [
+            call.debug('Loading classes for entrypoint: %s', 'my.entrypoint'),
+            call.debug("%s lazy plugin handles for entrypoint %s: %s",
+                       2, 'my.entrypoint', ['ep1', 'ep2'])
+        ]
+
+    def test_load_classes_threaded(self):
+
+        class MySuperClass(object):
+            pass
+
+        release = threading.Event()
+
+        def se_slow():
+            release.wait(5)
+            return EP1
+
+        def se_exc():
+            raise RuntimeError()
+
+        class EP1(MySuperClass):
+            pass
+
+        class EP2(MySuperClass):
+            pass
+
+        class EP3(object):
+            pass
+
+        mock_slow = Mock(spec_set=EntryPoint)
+        mock_slow.provides = ()
+        type(mock_slow).name = 'slow'
+        mock_slow.load.side_effect = se_slow
+
+        mock_ep2 = Mock(spec_set=EntryPoint)
+        mock_ep2.provides = ()
+        type(mock_ep2).name = 'ep2'
+        mock_ep2.load.return_value = EP2
+
+        mock_ep3 = Mock(spec_set=EntryPoint)
+        mock_ep3.provides = ()
+        type(mock_ep3).name = 'ep3'
+        mock_ep3.load.return_value = EP3
+
+        mock_exc = Mock(spec_set=EntryPoint)
+        mock_exc.provides = ()
+        type(mock_exc).name = 'exc'
+        mock_exc.load.side_effect = se_exc
+
+        mock_ep5 = Mock(spec_set=EntryPoint)
+        mock_ep5.provides = ()
+        type(mock_ep5).name = 'ep5'
+        mock_ep5.load.return_value = EP1
+
+        entry_points = [mock_slow, mock_ep2, mock_ep3, mock_exc, mock_ep5]
+
+        try:
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                with patch('%s.iter_entry_points' % pbm,
+                           autospec=True) as mock_iep:
+                    mock_iep.return_value = entry_points
+                    res = load_classes('my.entrypoint',
+                                       superclass=MySuperClass,
+                                       max_workers=2, timeout=0.2)
+        finally:
+            release.set()
+        assert res == [EP2, EP1]
+        for m in entry_points:
+            assert m.load.mock_calls == [call()]
+        calls = mock_logger.mock_calls
+        assert calls[0] == call.debug(
+            'Loading classes for entrypoint: %s', 'my.entrypoint'
+        )
+        assert sorted(
+            c[1][1] for c in calls
+            if c[1][0] == 'Trying to load class from entry point: %s'
+        ) == ['ep2', 'ep3', 'ep5', 'exc', 'slow']
+        assert [c for c in calls if 'Trying' not in c[1][0]] == [
+            call.debug('Loading classes for entrypoint: %s', 'my.entrypoint'),
+            call.debug('Timed out after %s seconds loading entry point %s',
+                       0.2, 'slow'),
+            call.debug('Exception raised when loading entry point %s',
+                       'exc', exc_info=ANY),
+            call.debug("%s classes loaded successfully for entrypoint %s: %s",
+                       2, 'my.entrypoint', ['EP2', 'EP1'])
+        ]
+        exc_info = calls[-2][2]['exc_info']
+        assert exc_info[0] == RuntimeError
+
+    def test_load_classes_threaded_no_timeout(self):
+
+        class EP1(object):
+            pass
+
+        class EP2(object):
+            pass
+
+        mock_ep1 = Mock(spec_set=EntryPoint)
+        type(mock_ep1).name = 'ep1'
+        mock_ep1.load.return_value = EP1
+
+        mock_ep2 = Mock(spec_set=EntryPoint)
+        type(mock_ep2).name = 'ep2'
+        mock_ep2.load.return_value = EP2
+
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            mock_iep.return_value = [mock_ep1, mock_ep2]
+            res = load_classes('my.entrypoint', max_workers=4)
+        assert res == [EP1, EP2]
+
+    def test_load_classes_timeout_only(self):
+
+        class EP1(object):
+            pass
+
+        mock_ep1 = Mock(spec_set=EntryPoint)
+        type(mock_ep1).name = 'ep1'
+        mock_ep1.load.return_value = EP1
+
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch('%s._load_threaded' % pbm) as mock_lt:
+                mock_iep.return_value = [mock_ep1]
+                mock_lt.return_value = [
+                    (mock_ep1, EP1, Mock(spec_set=PluginLoadRecord,
+                                         loaded=True))
+                ]
+                res = load_classes('my.entrypoint', timeout=2)
+        assert res == [EP1]
+        assert mock_lt.mock_calls == [call([mock_ep1], 1, 2)]
+
+    def test_load_classes_report(self):
+
+        class MySuperClass(object):
+            pass
+
+        class EP1(MySuperClass):
+            pass
+
+        class EP2(object):
+            pass
+
+        eps = [
+            EntryPoint('ep1', 'foo:EP1', 'my.group', 'd1', '1.0'),
+            EntryPoint('ep2', 'foo:EP2', 'my.group', 'd1', '1.0'),
+            EntryPoint('ep3', 'foo:EP3', 'my.group', 'd2', '2.0'),
+            EntryPoint('ep4', 'foo:func', 'my.group', 'd2', '2.0'),
+        ]
+        objs = {'ep1': EP1, 'ep2': EP2, 'ep4': 'notaclass'}
+
+        def se_load(ep):
+            if ep.name == 'ep3':
+                raise ImportError()
+            return objs[ep.name]
+
+        records = []
+        with patch('%s.logger' % pbm, autospec=True):
+            with patch('%s.iter_entry_points' % pbm,
+                       autospec=True) as mock_iep:
+                with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                    mock_iep.return_value = eps
+                    m_l.side_effect = se_load
+                    res = load_classes('my.group', superclass=MySuperClass,
+                                       report=records.append)
+        assert res == [EP1]
+        assert len(records) == 4
+        for r in records:
+            assert isinstance(r, PluginLoadRecord)
+            assert r.group == 'my.group'
+            assert r.duration >= 0
+            assert r.timed_out is False
+        assert [r.name for r in records] == ['ep1', 'ep2', 'ep3', 'ep4']
+        assert [r.loaded for r in records] == [True, True, False, True]
+        assert [r.rejected for r in records] == [False, True, False, True]
+        assert [r.exception for r in records] == [
+            None, None, 'ImportError', 'TypeError'
+        ]
+        d = records[2].as_dict()
+        assert d['target'] == 'foo:EP3'
+        assert d['dist_name'] == 'd2'
+        assert d['dist_version'] == '2.0'
+        assert 'PluginLoadRecord' in repr(records[2])
+        if sys.version_info >= (3, 4):
+            assert all(isinstance(r.memory_delta, int) for r in records)
+
+    def test_load_classes_negative_cache(self):
+        eps = [
+            EntryPoint('ep1', 'foo:EP1', 'my.group', 'd1', '1.0'),
+            EntryPoint('ep2', 'foo:EP2', 'my.group', 'd2', '2.0'),
+        ]
+
+        def se_load(ep):
+            if ep.name == 'ep2':
+                raise ImportError()
+            return BaseClass
+
+        cache = NegativeCache()
+        records = []
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            with patch('%s.iter_entry_points' % pbm,
+                       autospec=True) as mock_iep:
+                with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                    mock_iep.return_value = eps
+                    m_l.side_effect = se_load
+                    res1 = load_classes('my.group', negative_cache=cache)
+                    res2 = load_classes('my.group', negative_cache=cache,
+                                        report=records.append)
+        assert res1 == [BaseClass]
+        assert res2 == [BaseClass]
+        assert m_l.mock_calls == [
+            call(eps[0]), call(eps[1]), call(eps[0])
+        ]
+        assert call.debug(
+            'Skipping entry point %s; it recently failed to load', 'ep2'
+        ) in mock_logger.mock_calls
+        assert [r.name for r in records] == ['ep2', 'ep1']
+        assert [r.skipped for r in records] == [True, False]
+        assert records[0].loaded is False
+        assert [f['name'] for f in cache.skipped()] == ['ep2']
+        assert cache.skipped()[0]['reason'] == 'ImportError'
+        assert len(default_negative_cache) == 0
+
+    def test_load_classes_negative_cache_disabled(self):
+        ep = EntryPoint('ep1', 'foo:EP1', 'my.group', 'd1', '1.0')
+        with patch('%s.logger' % pbm, autospec=True):
+            with patch('%s.iter_entry_points' % pbm,
+                       autospec=True) as mock_iep:
+                with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                    mock_iep.return_value = [ep]
+                    m_l.side_effect = ImportError()
+                    load_classes('my.group', negative_cache=False)
+                    load_classes('my.group', negative_cache=False)
+        assert m_l.mock_calls == [call(ep), call(ep)]
+        assert len(default_negative_cache) == 0
+
+    def test_load_classes_negative_cache_timeout(self):
+        release = threading.Event()
+
+        def se_slow():
+            release.wait(5)
+            return BaseClass
+
+        mock_slow = Mock(spec_set=EntryPoint)
+        type(mock_slow).name = 'slow'
+        mock_slow.load.side_effect = se_slow
+        try:
+            with patch('%s.iter_entry_points' % pbm,
+                       autospec=True) as mock_iep:
+                mock_iep.return_value = [mock_slow]
+                load_classes('my.entrypoint', timeout=0.1)
+                res = load_classes('my.entrypoint', timeout=0.1)
+        finally:
+            release.set()
+        assert res == []
+        assert mock_slow.load.call_count == 1
+        assert default_negative_cache.failures()[0]['reason'] == 'timeout'
+
+    def test_load_classes_prefilter(self):
+
+        class TaggedBase(object):
+            _plugin_tag = 'Sensor'
+
+        class Tagged(TaggedBase):
+            pass
+
+        base = '%s.BaseClass' % __name__
+        eps = [
+            EntryPoint('ep1', 'foo:EP1 [provides.%s]' % base, 'grp', 'd', '1'),
+            EntryPoint('ep2', 'foo:EP2 [provides.other.Base]', 'grp', 'd', '1'),
+            EntryPoint('ep3', 'foo:EP3 [ssl]', 'grp', 'd', '1'),
+            EntryPoint('ep4', 'foo:EP4 [provides.sensor]', 'grp', 'd', '1'),
+        ]
+        objs = {'ep1': TestClass, 'ep3': TestClass, 'ep4': Tagged}
+        records = []
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                mock_iep.return_value = eps
+                m_l.side_effect = lambda ep: objs[ep.name]
+                res = load_classes('grp', superclass=BaseClass,
+                                   report=records.append)
+                res2 = load_classes('grp', superclass=(int, (TaggedBase,)))
+        assert res == [TestClass, TestClass]
+        assert res2 == [Tagged]
+        assert m_l.mock_calls == [
+            call(eps[0]), call(eps[2]), call(eps[2]), call(eps[3])
+        ]
+        assert [(r.name, r.rejected, r.loaded) for r in records] == [
+            ('ep2', True, False),
+            ('ep4', True, False),
+            ('ep1', False, True),
+            ('ep3', False, True),
+        ]
+
+    def test_load_classes_names(self):
+        eps = [
+            EntryPoint('ep1', 'foo:EP1', 'my.group', 'd1', '1.0'),
+            EntryPoint('ep2', 'foo:EP2', 'my.group', 'd1', '1.0'),
+        ]
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                mock_iep.return_value = eps
+                m_l.return_value = BaseClass
+                res = load_classes('my.group', names=['ep2', 'ep3'])
+        assert res == [BaseClass]
+        assert m_l.mock_calls == [call(eps[1])]
+
+    def test_load_classes_isolated(self):
+        eps = [
+            EntryPoint('ep1', 'foo:EP1', 'my.group', 'd1', '1.0'),
+            EntryPoint('ep2', 'foo:EP2', 'my.group', 'd1', '1.0'),
+            EntryPoint('ep3', 'foo:EP3', 'my.group', 'd1', '1.0'),
+            EntryPoint('ep4', 'foo:EP4', 'my.group', 'd1', '1.0'),
+        ]
+        checks = [PluginCheck(ep) for ep in eps[:3]]
+        checks[0].loaded = checks[0].compatible = True
+        checks[1].loaded = True
+        checks[2].exitcode = -11
+        cache = NegativeCache()
+        cache.add(eps[3], 'ImportError')
+        records = []
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch('rpymostat_common.isolation.check_entry_points',
+                       autospec=True) as mock_check:
+                with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                    mock_iep.return_value = eps
+                    mock_check.return_value = checks
+                    m_l.return_value = TestClass
+                    res = load_classes(
+                        'my.group', superclass=BaseClass, isolated=True,
+                        max_workers=2, timeout=3, report=records.append,
+                        negative_cache=cache
+                    )
+        assert res == [TestClass]
+        assert mock_check.mock_calls == [
+            call(eps[:3], superclass=BaseClass, processes=2, timeout=3)
+        ]
+        assert m_l.mock_calls == [call(eps[0])]
+        assert [(r.name, r.skipped, r.rejected, r.loaded) for r in records] \
+            == [
+                ('ep4', True, False, False),
+                ('ep2', False, True, False),
+                ('ep3', False, False, False),
+                ('ep1', False, False, True),
+            ]
+        assert [(f['name'], f['reason']) for f in cache.failures()] == [
+            ('ep3', 'exitcode -11'), ('ep4', 'ImportError')
+        ]
+
+    def test_load_groups(self):
+
+        class OtherClass(object):
+            pass
+
+        eps = {
+            'my.a': [
+                EntryPoint('a1', 'foo:A1', 'my.a', 'd1', '1.0'),
+                EntryPoint('a2', 'foo:A2', 'my.a', 'd1', '1.0'),
+            ],
+            'my.b': [EntryPoint('b1', 'foo:B1', 'my.b', 'd1', '1.0')],
+        }
+        objs = {'a1': TestClass, 'a2': OtherClass, 'b1': OtherClass}
+
+        def se_load(ep):
+            return objs[ep.name]
+
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch('%s.select_entry_points' % pbm,
+                       autospec=True) as mock_sel:
+                with patch.object(EntryPoint, 'load', autospec=True) as m_l:
+                    mock_sel.return_value = eps
+                    m_l.side_effect = se_load
+                    res1 = load_groups(['my.*'], superclass=BaseClass)
+                    res2 = load_groups(['my.*'],
+                                       superclass={'my.a': BaseClass})
+                    res3 = load_groups(['my.*'], lazy=True)
+        assert res1 == {'my.a': [TestClass], 'my.b': []}
+        assert res2 == {'my.a': [TestClass], 'my.b': [OtherClass]}
+        assert [h.name for h in res3['my.a']] == ['a1', 'a2']
+        assert mock_sel.mock_calls == [call(['my.*'])] * 3
+        assert mock_iep.mock_calls == []
+
+    def test_load_classes_unload_rejected(self, tmpdir):
+        pkg = tmpdir.mkdir('rpyunload_pkg')
+        pkg.join('__init__.py').write('')
+        pkg.join('helper.py').write('X = 1\n')
+        pkg.join('shared.py').write('Y = 2\n')
+        pkg.join('rejected.py').write(
+            'from __future__ import absolute_import\n'
+            'from rpyunload_pkg import helper, shared\n'
+            'class Other(object):\n'
+            '    pass\n'
+        )
+        pkg.join('accepted.py').write(
+            'from __future__ import absolute_import\n'
+            'from rpyunload_pkg import shared\n'
+            'from rpymostat_common.tests.test_loader import BaseClass\n'
+            'class Plugin(BaseClass):\n'
+            '    pass\n'
+        )
+        eps = [
+            EntryPoint('r', 'rpyunload_pkg.rejected:Other', 'my.group',
+                       'd1', '1.0'),
+            EntryPoint('m', 'rpyunload_pkg.missing:Foo', 'my.group',
+                       'd1', '1.0'),
+            EntryPoint('a', 'rpyunload_pkg.accepted:Plugin', 'my.group',
+                       'd1', '1.0'),
+        ]
+        results = []
+        records = []
+        sys.path.insert(0, str(tmpdir))
+        try:
+            with patch('%s.iter_entry_points' % pbm,
+                       autospec=True) as mock_iep:
+                mock_iep.return_value = eps
+                res = load_classes(
+                    'my.group', superclass=BaseClass, report=records.append,
+                    unload_rejected=results.append, negative_cache=False
+                )
+            assert [c.__name__ for c in res] == ['Plugin']
+            assert records[0].modules == [
+                'rpyunload_pkg', 'rpyunload_pkg.helper',
+                'rpyunload_pkg.rejected', 'rpyunload_pkg.shared'
+            ]
+            assert records[1].modules == []
+            assert records[2].modules == ['rpyunload_pkg.accepted']
+            assert len(results) == 1
+            assert results[0].removed == [
+                'rpyunload_pkg.helper', 'rpyunload_pkg.rejected'
+            ]
+            assert results[0].retained == [
+                'rpyunload_pkg', 'rpyunload_pkg.shared'
+            ]
+            assert 'rpyunload_pkg.rejected' not in sys.modules
+            assert 'rpyunload_pkg.helper' not in sys.modules
+            pkg_mod = sys.modules['rpyunload_pkg']
+            assert not hasattr(pkg_mod, 'rejected')
+            assert pkg_mod.shared is sys.modules['rpyunload_pkg.shared']
+            assert pkg_mod.accepted.shared is pkg_mod.shared
+        finally:
+            sys.path.remove(str(tmpdir))
+            for name in list(sys.modules):
+                if name.startswith('rpyunload_pkg'):
+                    del sys.modules[name]
+
+    def test_load_classes_unload_rejected_threaded(self):
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            mock_iep.return_value = []
+            with pytest.raises(ValueError):
+                load_classes('my.group', unload_rejected=True, max_workers=2)
+
+    def test_unload_modules_object_refs(self):
+        names = ['rpyunload_a', 'rpyunload_b', 'rpyunload_c', 'rpyunload_d']
+        for name in names:
+            sys.modules[name] = type(sys)(name)
+        # rpyunload_a defines Thing, which kept rpyunload_k imported with
+        # ``from rpyunload_a import Thing``; Thing's base is defined in
+        # rpyunload_b, and rpyunload_c is only imported by rpyunload_a
+        sys.modules['rpyunload_b'].Base = type(
+            'Base', (object,), {'__module__': 'rpyunload_b'}
+        )
+        sys.modules['rpyunload_a'].Thing = type(
+            'Thing', (sys.modules['rpyunload_b'].Base,),
+            {'__module__': 'rpyunload_a'}
+        )
+        sys.modules['rpyunload_a'].c = sys.modules['rpyunload_c']
+        sys.modules['rpyunload_k'] = type(sys)('rpyunload_k')
+        sys.modules['rpyunload_k'].Thing = sys.modules['rpyunload_a'].Thing
+        try:
+            res = unload_modules(names)
+            assert res.removed == ['rpyunload_d']
+            assert res.retained == ['rpyunload_a', 'rpyunload_b',
+                                    'rpyunload_c']
+            assert 'rpyunload_d' not in sys.modules
+            assert sys.modules['rpyunload_k'].Thing is \
+                sys.modules['rpyunload_a'].Thing
+        finally:
+            for name in names + ['rpyunload_k']:
+                sys.modules.pop(name, None)
+
+    def test_unload_modules_object_refs_unknown(self):
+
+        class Weird(object):
+
+            @property
+            def __module__(self):
+                raise RuntimeError('foo')
+
+        sys.modules['rpyunload_a'] = type(sys)('rpyunload_a')
+        sys.modules['rpyunload_k'] = type(sys)('rpyunload_k')
+        sys.modules['rpyunload_k'].weird = Weird()
+        try:
+            res = unload_modules(['rpyunload_a'])
+            assert res.removed == []
+            assert res.retained == ['rpyunload_a']
+            assert 'rpyunload_a' in sys.modules
+        finally:
+            for name in ['rpyunload_a', 'rpyunload_k']:
+                sys.modules.pop(name, None)
+
+    def test_unload_modules_no_getrefcount(self):
+        mod = type(sys)('rpyunload_fake')
+        sys.modules['rpyunload_fake'] = mod
+        try:
+            with patch('%s.sys' % pbm) as mock_sys:
+                mock_sys.modules = sys.modules
+                del mock_sys.getrefcount
+                res = unload_modules(['rpyunload_fake'])
+            assert res.removed == []
+            assert res.retained == ['rpyunload_fake']
+            assert sys.modules['rpyunload_fake'] is mod
+        finally:
+            del sys.modules['rpyunload_fake']
+
+    def test_unload_report(self):
+        r = UnloadReport(['a'], ['b'], 1000, 600)
+        assert r.reclaimed_rss == 400
+        assert r.as_dict() == {
+            'removed': ['a'], 'retained': ['b'], 'rss_before': 1000,
+            'rss_after': 600, 'reclaimed_rss': 400
+        }
+        assert UnloadReport([], [], None, 600).reclaimed_rss is None
+
+    def test_load_classes_report_tracemalloc(self):
+        pytest.importorskip('tracemalloc')
+        mock_ep1 = Mock(spec_set=EntryPoint)
+        type(mock_ep1).name = 'ep1'
+        mock_ep1.load.return_value = BaseClass
+        mock_report = Mock()
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch('%s.tracemalloc' % pbm) as mock_tm:
+                mock_iep.return_value = [mock_ep1]
+                mock_tm.is_tracing.return_value = False
+                mock_tm.get_traced_memory.side_effect = [(10, 20), (110, 120)]
+                res = load_classes('my.entrypoint', report=mock_report)
+        assert res == [BaseClass]
+        assert mock_tm.mock_calls == [
+            call.is_tracing(),
+            call.start(),
+            call.get_traced_memory(),
+            call.get_traced_memory(),
+            call.stop()
+        ]
+        assert len(mock_report.mock_calls) == 1
+        assert mock_report.mock_calls[0][1][0].memory_delta == 100
+
+    def test_load_classes_report_threaded(self):
+
+        release = threading.Event()
+
+        def se_slow():
+            release.wait(5)
+            return BaseClass
+
+        mock_slow = Mock(spec_set=EntryPoint)
+        type(mock_slow).name = 'slow'
+        mock_slow.load.side_effect = se_slow
+        mock_ep2 = Mock(spec_set=EntryPoint)
+        type(mock_ep2).name = 'ep2'
+        mock_ep2.load.return_value = TestClass
+
+        records = []
+        try:
+            with patch('%s.iter_entry_points' % pbm,
+                       autospec=True) as mock_iep:
+                mock_iep.return_value = [mock_slow, mock_ep2]
+                res = load_classes('my.entrypoint', max_workers=2,
+                                   timeout=0.1, report=records.append)
+        finally:
+            release.set()
+        assert res == [TestClass]
+        assert [r.name for r in records] == ['slow', 'ep2']
+        assert records[0].timed_out is True
+        assert records[0].loaded is False
+        assert records[0].duration == 0.1
+        assert records[1].loaded is True
+        assert records[1].memory_delta is None
+
     def test_get_varnames(self):
         docstr = {
             'params': {
@@ -228,7 +983,7 @@ class TestLoader(object):
         :param kwarg2: kwarg2 info
         :return: foo
         """
-        with patch('%s._parse_docstring' % pbm) as mock_pd:
+        with patch('%s.parse_docstring' % pbi) as mock_pd:
             mock_pd.return_value = docstr
             res = _get_varnames(TestClass)
         assert mock_pd.mock_calls == [call(ds)]
@@ -256,7 +1011,7 @@ class TestLoader(object):
                 'foo': 'str',
             }
         }
-        with patch('%s._parse_docstring' % pbm) as mock_pd:
+        with patch('%s.parse_docstring' % pbi) as mock_pd:
             mock_pd.return_value = docstr
             res = _get_varnames(Foo)
         assert mock_pd.mock_calls == [call('mystr')]
@@ -281,7 +1036,7 @@ class TestLoader(object):
                 'arg1': 'str'
             }
         }
-        with patch('%s._parse_docstring' % pbm) as mock_pd:
+        with patch('%s.parse_docstring' % pbi) as mock_pd:
             mock_pd.return_value = docstr
             res = _get_varnames(Foo)
         assert mock_pd.mock_calls == [call("foo")]
@@ -290,41 +1045,6 @@ class TestLoader(object):
             'arg2': '',
         }
 
-    def test_parse_docstring(self):
-        docstring = """
-        Some text here
-        About the init function
-
-        Foo
-
-        Bar.
-
-        :param argOne: arg one info
-        :type argOne: str
-        :param argTwo: arg two info is a
-          long
-          line
-        :type argTwo: int
-        :param kwarg1: kwarg1 info
-        :type kwarg1: str
-        :param kwarg2: kwarg2 info
-        :return: foo
-        """
-        res = _parse_docstring(docstring)
-        assert res == {
-            'params': {
-                'argOne': 'arg one info',
-                'argTwo': 'arg two info is a long line',
-                'kwarg1': 'kwarg1 info',
-                'kwarg2': 'kwarg2 info'
-            },
-            'types': {
-                'argOne': 'str',
-                'argTwo': 'int',
-                'kwarg1': 'str'
-            }
-        }
-
     def test_list_classes(self, capsys):
         varnames_one = {
             'argOne': '(int) arg one info',
@@ -342,9 +1062,12 @@ class TestLoader(object):
                 return varnames_one
             return {}
 
+        mock_lazy = Mock(spec_set=LazyPlugin)
+        mock_lazy.load.return_value = m2
+
         with patch('%s._get_varnames' % pbm) as mock_gv:
             mock_gv.side_effect = se_gv
-            list_classes([m1, m2, m3])
+            list_classes([m1, mock_lazy, m3])
         assert mock_gv.mock_calls == [call(m1), call(m2), call(m3)]
         expected_out = "clsone (desc1)\n"
         expected_out += "    argOne - (int) arg one info\n"
@@ -356,3 +1079,144 @@ class TestLoader(object):
         out, err = capsys.readouterr()
         assert err == ''
         assert out == expected_out
+
+    def test_list_classes_static(self, capsys):
+        eps = [
+            EntryPoint('ep1', 'foo.bar:clsone', 'my.group'),
+            EntryPoint('ep2', 'foo.bar:cls2', 'my.group'),
+            EntryPoint('ep3', 'foo.baz:Outer.cls3', 'my.group'),
+        ]
+        infos = {
+            'ep1': ClassInfo('clsone', description='desc1', arguments=[
+                ArgumentInfo('argOne', type='int', description='arg one info'),
+                ArgumentInfo('argTwo', description='arg two info'),
+                ArgumentInfo('kwarg1', has_default=True, default='foo',
+                             type='str', description='kwarg1 info'),
+            ]),
+            'ep2': ClassInfo('cls2', description='desc2'),
+            'ep3': None
+        }
+
+        def se_sci(ep):
+            return infos[ep.name]
+
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch('rpymostat_common.static_help.static_class_info'
+                       ) as mock_sci:
+                mock_iep.return_value = eps
+                mock_sci.side_effect = se_sci
+                list_classes_static('my.group')
+        assert mock_iep.mock_calls == [call('my.group')]
+        assert mock_sci.mock_calls == [call(eps[0]), call(eps[1]),
+                                       call(eps[2])]
+        expected_out = "clsone (desc1)\n"
+        expected_out += "    argOne - (int) arg one info\n"
+        expected_out += "    argTwo - arg two info\n"
+        expected_out += "    kwarg1=foo - (str) kwarg1 info\n"
+        expected_out += "\n"
+        expected_out += "cls2 (desc2)\n\n"
+        expected_out += "cls3\n\n"
+        out, err = capsys.readouterr()
+        assert err == ''
+        assert out == expected_out
+
+
+class OtherClass(BaseClass):
+    """no init docstring"""
+
+    def __init__(self, obj=BaseClass):
+        pass
+
+
+class TestClassInfoRecords(object):
+
+    def setup_method(self):
+        introspection.invalidate()
+
+    def test_iter_class_info(self):
+        res = list(iter_class_info([TestClass, OtherClass]))
+        assert [i.name for i in res] == ['TestClass', 'OtherClass']
+        assert res[0].description == 'foo desc'
+        assert res[0].arguments[0] == ArgumentInfo(
+            'argOne', type='str', description='arg one info'
+        )
+        assert res[0].arguments[3] == ArgumentInfo(
+            'kwarg2', has_default=True, default=1234,
+            description='kwarg2 info'
+        )
+        assert res[1].description is None
+
+    def test_iter_class_info_filter_paginate(self):
+        lazy_ep = Mock(attrs=['OtherClass'])
+        lazy_ep.load.return_value = OtherClass
+        lazy = LazyPlugin(lazy_ep)
+        unloaded = Mock(attrs=['Unmatched'])
+        classes = [TestClass, LazyPlugin(unloaded), lazy, TestClass, OtherClass]
+        res = iter_class_info(classes, pattern='*CLASS')
+        assert [i.name for i in res] == [
+            'TestClass', 'OtherClass', 'TestClass', 'OtherClass'
+        ]
+        assert unloaded.mock_calls == []
+        res = iter_class_info(classes, pattern='*class', offset=1, limit=2)
+        assert [i.name for i in res] == ['OtherClass', 'TestClass']
+        res = iter_class_info(
+            classes, pattern='*class',
+            predicate=lambda i: i.description is not None, offset=1
+        )
+        assert [i.name for i in res] == ['TestClass']
+        # only as much as consumed is loaded
+        lazy_ep.reset_mock()
+        lazy._obj = None
+        res = iter_class_info(classes, pattern='*class', limit=1)
+        assert [i.name for i in res] == ['TestClass']
+        assert lazy_ep.mock_calls == []
+
+    def test_iter_class_info_static(self):
+        eps = [
+            EntryPoint('ep1', 'foo.bar:clsone', 'my.group'),
+            EntryPoint('ep2', 'foo.bar:cls2', 'my.group'),
+            EntryPoint('ep3', 'foo.baz:Outer.cls3', 'my.group'),
+        ]
+        infos = {
+            'ep1': ClassInfo('clsone', description='desc1'),
+            'ep2': ClassInfo('cls2', description='desc2'),
+            'ep3': None
+        }
+
+        def se_sci(ep):
+            return infos[ep.name]
+
+        with patch('%s.iter_entry_points' % pbm, autospec=True) as mock_iep:
+            with patch('rpymostat_common.static_help.static_class_info'
+                       ) as mock_sci:
+                mock_iep.return_value = eps
+                mock_sci.side_effect = se_sci
+                res = list(iter_class_info_static('my.group'))
+                assert res == [infos['ep1'], infos['ep2'], ClassInfo('cls3')]
+                mock_sci.reset_mock()
+                res = list(iter_class_info_static(
+                    'my.group', pattern='cls?', offset=1
+                ))
+                assert res == [ClassInfo('cls3')]
+                assert mock_sci.mock_calls == [call(eps[1]), call(eps[2])]
+
+    def test_class_info_json_lines(self):
+        infos = [
+            ClassInfo('OtherClass', arguments=[
+                ArgumentInfo('obj', has_default=True, default=BaseClass)
+            ]),
+            ClassInfo('cls2', description='desc2'),
+        ]
+        res = list(class_info_json_lines(infos))
+        assert len(res) == 2
+        assert '\n' not in res[0]
+        assert json.loads(res[0]) == {
+            'name': 'OtherClass', 'description': None, 'arguments': [{
+                'name': 'obj', 'has_default': True,
+                'default': repr(BaseClass), 'type': None,
+                'description': None
+            }]
+        }
+        assert json.loads(res[1]) == {
+            'name': 'cls2', 'description': 'desc2', 'arguments': []
+        }
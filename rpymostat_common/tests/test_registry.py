@@ -0,0 +1,371 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+import threading
+import time
+from textwrap import dedent
+
+import pytest
+
+from rpymostat_common.entry_points import EntryPoint
+from rpymostat_common.loader import NegativeCache
+from rpymostat_common.registry import (
+    PluginRegistry, PollingWatcher, InotifyWatcher
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.registry'
+
+
+class BasePlugin(object):
+    pass
+
+
+def write_dist(site, name, version, entry_points, module_src=None):
+    """
+    Write a fake installed distribution to ``site``, returning its metadata
+    directory.
+    """
+    meta = site.join('%s-%s.dist-info' % (name, version))
+    meta.ensure(dir=True)
+    meta.join('METADATA').write(
+        'Metadata-Version: 2.1\nName: %s\nVersion: %s\n\n' % (name, version)
+    )
+    meta.join('entry_points.txt').write(dedent(entry_points))
+    if module_src is not None:
+        site.join('%s.py' % name).write(dedent(module_src))
+    return meta
+
+
+class TestPluginRegistry(object):
+
+    def setup_method(self):
+        self.modules = ['regplug_a', 'regplug_b']
+        self.events = []
+        self.cache = NegativeCache()
+
+    def teardown_method(self):
+        for mod in self.modules:
+            sys.modules.pop(mod, None)
+
+    def make_registry(self, site):
+        sys.path.insert(0, str(site))
+        reg = PluginRegistry(
+            'rpymostat.test.*', superclass=BasePlugin, path=[str(site)],
+            negative_cache=self.cache
+        )
+        reg.add_listener(self.events.append)
+        return reg
+
+    def test_lifecycle(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        plugin_src = """
+            from rpymostat_common.tests.test_registry import BasePlugin
+
+            class Plugin(BasePlugin):
+                version = %d
+
+            class NotPlugin(object):
+                pass
+        """
+        write_dist(site, 'regplug_a', '1.0', """
+            [rpymostat.test.sensors]
+            a = regplug_a:Plugin
+            bad = regplug_a:NotPlugin
+
+            [other.group]
+            x = regplug_a:Plugin
+        """, plugin_src % 1)
+        try:
+            reg = self.make_registry(site)
+            with patch.object(EntryPoint, 'load', autospec=True,
+                              side_effect=EntryPoint.load) as mock_load:
+                res = reg.refresh()
+                assert [(e.kind, e.name) for e in res] == [('added', 'a')]
+                assert self.events == res
+                plugin_a = reg.plugins('rpymostat.test.sensors')[0]
+                assert plugin_a.version == 1
+                assert reg.refresh() == []
+                # install a second distribution
+                write_dist(site, 'regplug_b', '2.0', """
+                    [rpymostat.test.relays]
+                    b = regplug_b:Plugin
+                """, plugin_src % 2)
+                res = reg.refresh()
+                assert [(e.kind, e.group, e.name) for e in res] == [
+                    ('added', 'rpymostat.test.relays', 'b')
+                ]
+                # only the new plugin was imported
+                assert [c[1][0].name for c in mock_load.mock_calls] == [
+                    'a', 'bad', 'b'
+                ]
+                # upgrade the first distribution
+                site.join('regplug_a-1.0.dist-info').remove()
+                write_dist(site, 'regplug_a', '1.1', """
+                    [rpymostat.test.sensors]
+                    a = regplug_a:Plugin
+                    bad = regplug_a:NotPlugin
+                """, plugin_src % 333)
+                res = reg.refresh()
+                assert [(e.kind, e.name) for e in res] == [('changed', 'a')]
+                assert res[0].plugin.version == 333
+                assert res[0].entry_point.dist_version == '1.1'
+                assert reg.plugins('rpymostat.test.sensors') == [res[0].plugin]
+                assert reg.as_dict() == {
+                    'rpymostat.test.relays': [
+                        reg.plugins('rpymostat.test.relays')[0]
+                    ],
+                    'rpymostat.test.sensors': [res[0].plugin]
+                }
+                # uninstall the second distribution
+                site.join('regplug_b-2.0.dist-info').remove()
+                res = reg.refresh()
+                assert [(e.kind, e.name) for e in res] == [('removed', 'b')]
+                assert res[0].plugin.version == 2
+                assert reg.plugins('rpymostat.test.relays') == []
+        finally:
+            sys.path.remove(str(site))
+        assert 'PluginEvent' in repr(res[0])
+
+    def test_duplicate_dists_path_order(self, tmpdir):
+        plugin_src = """
+            from rpymostat_common.tests.test_registry import BasePlugin
+
+            class Plugin(BasePlugin):
+                version = %d
+        """
+        eps = """
+            [rpymostat.test.sensors]
+            a = regplug_a:Plugin
+        """
+        first = tmpdir.mkdir('zsite')
+        second = tmpdir.mkdir('asite')
+        write_dist(first, 'regplug_a', '2.0', eps, plugin_src % 2)
+        write_dist(second, 'regplug_a', '1.0', eps, plugin_src % 1)
+        sys.path.insert(0, str(first))
+        try:
+            reg = PluginRegistry(
+                'rpymostat.test.*', superclass=BasePlugin,
+                path=[str(first), str(second)], negative_cache=self.cache
+            )
+            res = reg.refresh()
+        finally:
+            sys.path.remove(str(first))
+        assert [(e.kind, e.entry_point.dist_version) for e in res] == [
+            ('added', '2.0')
+        ]
+        assert res[0].plugin.version == 2
+
+    def test_failed_retried_after_ttl(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        write_dist(site, 'regplug_a', '1.0', """
+            [rpymostat.test.sensors]
+            a = regplug_a:Plugin
+        """)
+        try:
+            reg = self.make_registry(site)
+            with patch.object(EntryPoint, 'load', autospec=True,
+                              side_effect=EntryPoint.load) as mock_load:
+                assert reg.refresh() == []
+                assert len(mock_load.mock_calls) == 1
+                # still negative-cached; not re-attempted
+                assert reg.refresh() == []
+                assert len(mock_load.mock_calls) == 1
+                site.join('regplug_a.py').write(dedent("""
+                    from rpymostat_common.tests.test_registry import \\
+                        BasePlugin
+
+                    class Plugin(BasePlugin):
+                        pass
+                """))
+                # failure expires from the negative cache
+                self.cache.clear()
+                res = reg.refresh()
+                assert [(e.kind, e.name) for e in res] == [('added', 'a')]
+                assert len(mock_load.mock_calls) == 2
+                assert reg.refresh() == []
+                assert len(mock_load.mock_calls) == 2
+        finally:
+            sys.path.remove(str(site))
+
+    def test_provides_rejected_not_retried(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        write_dist(site, 'regplug_a', '1.0', """
+            [rpymostat.test.sensors]
+            s = regplug_a:Plugin [provides.%s.BasePlugin]
+            r = regplug_a:Other [provides.some.Relay]
+        """ % __name__, """
+            from rpymostat_common.tests.test_registry import BasePlugin
+
+            class Plugin(BasePlugin):
+                pass
+
+            class Other(object):
+                pass
+        """)
+        try:
+            reg = self.make_registry(site)
+            res = reg.refresh()
+            assert [(e.kind, e.name) for e in res] == [('added', 's')]
+            mod = sys.modules['regplug_a']
+            assert res[0].plugin.__module__ == 'regplug_a'
+            assert reg._failed == {}
+            assert reg.refresh() == []
+            assert reg._apply() == []
+            assert sys.modules['regplug_a'] is mod
+        finally:
+            sys.path.remove(str(site))
+
+    def test_shared_module_kept(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        write_dist(site, 'regplug_a', '1.0', """
+            [rpymostat.test.sensors]
+            s = regplug_a:Plugin
+            f = regplug_a:Missing
+        """, """
+            from rpymostat_common.tests.test_registry import BasePlugin
+
+            class Plugin(BasePlugin):
+                pass
+        """)
+        try:
+            reg = self.make_registry(site)
+            with patch('rpymostat_common.loader.logger'):
+                res = reg.refresh()
+                assert [(e.kind, e.name) for e in res] == [('added', 's')]
+                mod = sys.modules['regplug_a']
+                # failure expires; retrying it keeps the shared module
+                self.cache.clear()
+                assert reg.refresh() == []
+            assert sys.modules['regplug_a'] is mod
+        finally:
+            sys.path.remove(str(site))
+
+    def test_full_scan_fallback(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        site.join('foo.egg-link').write('/nowhere\n')
+        ep = EntryPoint('p', 'rpymostat_common.tests.test_registry:BasePlugin',
+                        'rpymostat.test.x', 'foo', '1.0')
+        reg = PluginRegistry('rpymostat.test.x', path=[str(site)],
+                             negative_cache=False)
+        with patch('%s.scan' % pbm) as mock_scan:
+            mock_scan.return_value = {
+                'rpymostat.test.x': [ep], 'other': [ep]
+            }
+            res = reg.refresh()
+        assert [(e.kind, e.name) for e in res] == [('added', 'p')]
+        assert res[0].plugin is BasePlugin
+        assert mock_scan.mock_calls == [call()]
+
+    def test_listener(self):
+        reg = PluginRegistry(['a', 'b'])
+        listener = Mock()
+        reg.add_listener(listener)
+        reg.remove_listener(listener)
+        assert reg._listeners == []
+        assert reg.groups == ['a', 'b']
+
+    def test_start_stop_polling(self, tmpdir):
+        site = tmpdir.mkdir('site')
+        reg = self.make_registry(site)
+        try:
+            with patch('%s.InotifyWatcher.available' % pbm) as mock_avail:
+                mock_avail.return_value = False
+                reg.start(interval=0.05, settle=0)
+            assert isinstance(reg._watcher, PollingWatcher)
+            write_dist(site, 'regplug_a', '1.0', """
+                [rpymostat.test.sensors]
+                a = rpymostat_common.tests.test_registry:BasePlugin
+            """)
+            for _ in range(100):
+                if self.events:
+                    break
+                time.sleep(0.05)
+            reg.stop()
+        finally:
+            sys.path.remove(str(site))
+        assert [(e.kind, e.name) for e in self.events] == [('added', 'a')]
+        assert reg._thread is None
+
+
+class TestPollingWatcher(object):
+
+    def test_wait(self):
+        stop = threading.Event()
+        cls = PollingWatcher(interval=0.01)
+        cls.update(['/foo'])
+        assert cls.wait(stop) is True
+        stop.set()
+        assert cls.wait(stop) is False
+        cls.close()
+
+
+@pytest.mark.skipif(not InotifyWatcher.available(),
+                    reason='inotify not available')
+class TestInotifyWatcher(object):
+
+    def test_wait(self, tmpdir):
+        stop = threading.Event()
+        cls = InotifyWatcher(poll_interval=0.01)
+        try:
+            cls.update([str(tmpdir)])
+            tmpdir.mkdir('foo-1.0.dist-info')
+            assert cls.wait(stop) is True
+            cls.update([str(tmpdir.join('foo-1.0.dist-info'))])
+            assert list(cls._watches) == [
+                str(tmpdir.join('foo-1.0.dist-info'))
+            ]
+            stop.set()
+            assert cls.wait(stop) is False
+        finally:
+            cls.close()
+        assert cls.fd is None
+
+    def test_unavailable(self):
+        with patch('%s._libc' % pbm, None):
+            with pytest.raises(OSError):
+                InotifyWatcher()
@@ -0,0 +1,237 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+import threading
+import time
+
+import pytest
+
+from rpymostat_common.scheduler import (
+    initialize, load_and_initialize, DependencyError, PluginInitRecord
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.scheduler'
+
+
+class Bus(object):
+    _provides = ['i2c']
+
+    def __init__(self):
+        time.sleep(0.1)
+
+
+class Sensor1(object):
+    _depends = ['i2c']
+
+    def __init__(self):
+        time.sleep(0.1)
+
+
+class Sensor2(object):
+    _depends = ['i2c']
+
+    def __init__(self):
+        time.sleep(0.1)
+
+
+class Display(object):
+    _depends = ['Sensor1', 'Sensor2']
+
+
+class Relay(object):
+
+    def __init__(self):
+        time.sleep(0.05)
+
+
+class Broken(object):
+    _provides = ['gpio']
+
+    def __init__(self):
+        raise RuntimeError('no hardware')
+
+
+class NeedsGpio(object):
+    _depends = ['gpio']
+
+
+class NeedsNothing(object):
+    _depends = ['nonexistent']
+
+
+class TestInitialize(object):
+
+    def test_initialize(self):
+        with patch('%s.logger' % pbm):
+            res = initialize([Display, Sensor1, Sensor2, Relay, Bus],
+                             max_workers=4)
+        assert [type(i) for i in res.instances] == [
+            Display, Sensor1, Sensor2, Relay, Bus
+        ]
+        recs = dict((r.name, r) for r in res.records)
+        assert recs['Sensor1'].start >= recs['Bus'].end
+        assert recs['Sensor2'].start >= recs['Bus'].end
+        assert recs['Display'].start >= recs['Sensor1'].end
+        assert recs['Display'].start >= recs['Sensor2'].end
+        # the sensors and relay overlap
+        assert recs['Relay'].end < recs['Bus'].end
+        assert res.duration < 0.3
+        assert res.critical_path[0] == 'Bus'
+        assert res.critical_path[-1] == 'Display'
+        assert len(res.critical_path) == 3
+        assert res.critical_path_duration >= 0.2
+        d = res.as_dict()
+        assert d['critical_path'] == res.critical_path
+        assert d['plugins'][0]['depends'] == ['Sensor1', 'Sensor2']
+        assert d['plugins'][0]['ok'] is True
+
+    def test_single_worker(self):
+        order = []
+        lock = threading.Lock()
+
+        def factory(klass, dependencies):
+            with lock:
+                order.append(klass.__name__)
+            return (klass, dependencies)
+
+        res = initialize([Display, Sensor1, Sensor2, Bus], factory=factory,
+                         max_workers=1)
+        assert order == ['Bus', 'Sensor1', 'Sensor2', 'Display']
+        display = res.records[0].instance
+        assert display[1] == {
+            'Sensor1': [res.records[1].instance],
+            'Sensor2': [res.records[2].instance],
+        }
+        assert res.records[1].instance[1] == {
+            'i2c': [res.records[3].instance]
+        }
+
+    def test_failures(self):
+        with patch('%s.logger' % pbm) as mock_logger:
+            res = initialize([NeedsGpio, Broken, NeedsNothing, Relay])
+        assert [(r.name, r.ok, r.skipped, r.exception)
+                for r in res.records] == [
+            ('NeedsGpio', False, True, None),
+            ('Broken', False, False, 'RuntimeError'),
+            ('NeedsNothing', False, True, 'MissingDependency'),
+            ('Relay', True, False, None),
+        ]
+        assert res.records[0].duration is None
+        assert [type(i) for i in res.instances] == [Relay]
+        assert mock_logger.warning.call_count == 2
+        assert 'ok=False' in repr(res.records[0])
+
+    def test_duplicate_names(self):
+
+        def make(delay, provides):
+
+            class Dup(object):
+                _provides = provides
+
+                def __init__(self):
+                    time.sleep(delay)
+
+            return Dup
+
+        class Child(object):
+            _depends = ['slow']
+
+        fast = make(0, [])
+        slow = make(0.1, ['slow'])
+        res = initialize([fast, slow, Child])
+        assert [(r.index, r.depends) for r in res.records] == [
+            (0, []), (1, []), (2, [1])
+        ]
+        assert res.records[2].depends_names == ['Dup']
+        assert res.critical_path_indexes == [1, 2]
+        assert res.critical_path == ['Dup', 'Child']
+        assert res.critical_path_duration >= 0.1
+        assert res.as_dict()['plugins'][2]['depends'] == ['Dup']
+
+    def test_cycle(self):
+
+        class A(object):
+            _depends = ['B']
+
+        class B(object):
+            _depends = ['A']
+
+        with pytest.raises(DependencyError) as excinfo:
+            initialize([A, B, Relay])
+        assert 'A, B' in str(excinfo.value)
+
+    def test_empty(self):
+        res = initialize([])
+        assert res.records == []
+        assert res.critical_path == []
+        assert res.critical_path_duration == 0
+
+    def test_load_and_initialize(self):
+        with patch('%s.load_classes' % pbm) as mock_lc:
+            with patch('%s.initialize' % pbm) as mock_init:
+                mock_lc.return_value = [Relay]
+                res = load_and_initialize('my.group', superclass=object,
+                                          max_workers=2, lazy=False)
+        assert mock_lc.mock_calls == [
+            call('my.group', superclass=object, lazy=False)
+        ]
+        assert mock_init.mock_calls == [
+            call([Relay], factory=None, max_workers=2)
+        ]
+        assert res is mock_init.return_value
+
+
+class TestPluginInitRecord(object):
+
+    def test_defaults(self):
+        r = PluginInitRecord(Relay, [])
+        assert r.ok is True
+        assert r.duration is None
+        assert r.as_dict()['name'] == 'Relay'
+        assert r.depends_names == []
+        assert r.index is None
@@ -0,0 +1,349 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import os
+import sys
+from textwrap import dedent
+
+import pytest
+
+from rpymostat_common import static_help
+from rpymostat_common.entry_points import EntryPoint
+from rpymostat_common.introspection import ArgumentInfo, ClassInfo, class_info
+from rpymostat_common.static_help import (
+    find_module_source, static_class_info, clear_cache, CACHE_FORMAT_VERSION
+)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.static_help'
+
+BASE_SRC = dedent('''
+    class BaseSensor(object):
+
+        _description = 'base description'
+
+        def __init__(self, host, port=8080, *args, **kwargs):
+            """
+            :param host: host to connect to
+            :type host: str
+            :param port: port to connect to
+            :type port: int
+            """
+            pass
+''')
+
+PLUGIN_SRC = dedent('''
+    import os
+    from .base import BaseSensor
+    from . import base as basemod
+
+    DEFAULT_PATH = '/dev/foo'
+
+
+    class Inherits(BaseSensor):
+        pass
+
+
+    class InheritsDotted(basemod.BaseSensor):
+        _description = 'dotted'
+
+
+    class MySensor(BaseSensor):
+
+        _description = 'my sensor'
+
+        def __init__(self, bus, addr=0x40, path=DEFAULT_PATH, ratio=(1, 2),
+                     flag=None):
+            """
+            Some text.
+
+            :param bus: I2C bus number
+            :type bus: int
+            :param addr: I2C address
+            :param path: device path
+            :type path: str
+            """
+            super(MySensor, self).__init__('localhost')
+            os.open(path, os.O_RDONLY)
+
+        class Inner(object):
+            def __init__(self, a):
+                pass
+
+
+    class NoInit(object):
+        pass
+''')
+
+
+class TestFindModuleSource(object):
+
+    def test_find(self, tmpdir):
+        pkg = tmpdir.mkdir('mypkg')
+        pkg.join('__init__.py').write('')
+        pkg.join('mod.py').write('')
+        sub = pkg.mkdir('sub')
+        sub.join('__init__.py').write('')
+        path = ['/nonexistent', str(tmpdir)]
+        assert find_module_source('mypkg', path) == str(
+            pkg.join('__init__.py'))
+        assert find_module_source('mypkg.mod', path) == str(pkg.join('mod.py'))
+        assert find_module_source('mypkg.sub', path) == str(
+            sub.join('__init__.py'))
+        assert find_module_source('mypkg.missing', path) is None
+        assert find_module_source('otherpkg', path) is None
+
+    def test_find_cwd(self, tmpdir):
+        tmpdir.join('foo.py').write('')
+        with patch('%s.os.getcwd' % pbm) as mock_getcwd:
+            mock_getcwd.return_value = str(tmpdir)
+            res = find_module_source('foo', [''])
+        assert res == str(tmpdir.join('foo.py'))
+
+    def test_find_default_path(self, tmpdir):
+        tmpdir.join('foo.py').write('')
+        with patch('%s.sys.path' % pbm, [str(tmpdir)]):
+            res = find_module_source('foo')
+        assert res == str(tmpdir.join('foo.py'))
+
+
+class TestStaticClassInfo(object):
+
+    def setup_method(self):
+        clear_cache()
+
+    def teardown_method(self):
+        clear_cache()
+
+    def make_plugin(self, tmpdir):
+        pkg = tmpdir.mkdir('site').mkdir('myplugin')
+        pkg.join('__init__.py').write('')
+        pkg.join('base.py').write(BASE_SRC)
+        pkg.join('plugin.py').write(PLUGIN_SRC)
+        return [str(tmpdir.join('site'))]
+
+    def ep(self, target):
+        return EntryPoint('foo', 'myplugin.plugin:%s' % target, 'my.group')
+
+    def test_class_info(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_CACHE_DIR': str(tmpdir.join('cache'))}):
+            res = static_class_info(self.ep('MySensor'), path=path)
+        assert res == ClassInfo('MySensor', description='my sensor', arguments=[
+            ArgumentInfo('bus', type='int', description='I2C bus number'),
+            ArgumentInfo('addr', has_default=True, default='64',
+                         description='I2C address'),
+            ArgumentInfo('path', has_default=True, default='DEFAULT_PATH',
+                         type='str', description='device path'),
+            ArgumentInfo('ratio', has_default=True, default='(1, 2)'),
+            ArgumentInfo('flag', has_default=True, default='None'),
+        ])
+        assert res.varnames() == {
+            'bus': '(int) I2C bus number',
+            'addr=64': 'I2C address',
+            'path=DEFAULT_PATH': '(str) device path',
+            'ratio=(1, 2)': '',
+            'flag=None': '',
+        }
+
+    def test_inherited(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_CACHE_DIR': str(tmpdir.join('cache'))}):
+            res = static_class_info(self.ep('Inherits'), path=path)
+            res2 = static_class_info(self.ep('InheritsDotted'), path=path)
+        expected_args = [
+            ArgumentInfo('host', type='str', description='host to connect to'),
+            ArgumentInfo('port', has_default=True, default='8080',
+                         type='int', description='port to connect to'),
+        ]
+        assert res == ClassInfo('Inherits', description='base description',
+                                arguments=expected_args)
+        assert res2 == ClassInfo('InheritsDotted', description='dotted',
+                                 arguments=expected_args)
+
+    def test_nested_and_no_init(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_CACHE_DIR': str(tmpdir.join('cache'))}):
+            res = static_class_info(self.ep('MySensor.Inner'), path=path)
+            res2 = static_class_info(self.ep('NoInit'), path=path)
+        assert res == ClassInfo('Inner', arguments=[ArgumentInfo('a')])
+        assert res2 == ClassInfo('NoInit')
+
+    def test_matches_live(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        sys.path.insert(0, path[0])
+        try:
+            from myplugin.plugin import Inherits
+            live = class_info(Inherits)
+        finally:
+            sys.path.remove(path[0])
+            for k in list(sys.modules.keys()):
+                if k.startswith('myplugin'):
+                    del sys.modules[k]
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_CACHE_DIR': str(tmpdir.join('cache'))}):
+            res = static_class_info(self.ep('Inherits'), path=path)
+        assert res.varnames() == live.varnames()
+        assert res.description == live.description
+
+    def test_kwonly(self, tmpdir):
+        if sys.version_info[0] < 3:
+            pytest.skip('keyword-only arguments require Python 3')
+        tmpdir.join('kwmod.py').write(dedent('''
+            class Foo(object):
+                def __init__(self, a, *, b, c=3):
+                    pass
+        '''))
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_CACHE_DIR': str(tmpdir.join('cache'))}):
+            res = static_class_info(EntryPoint('foo', 'kwmod:Foo', 'grp'),
+                                    path=[str(tmpdir)])
+        assert res.varnames() == {'a': '', 'b': '', 'c=3': ''}
+
+    def test_cached(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        cache = str(tmpdir.join('cache'))
+        with patch.dict('os.environ', {'RPYMOSTAT_CACHE_DIR': cache}):
+            res = static_class_info(self.ep('Inherits'), path=path)
+            assert len(os.listdir(os.path.join(cache, 'static_help'))) == 1
+            with patch('%s._StaticInspector' % pbm) as mock_si:
+                # in memory
+                assert static_class_info(self.ep('Inherits'),
+                                         path=path) == res
+                clear_cache()
+                # on disk
+                assert static_class_info(self.ep('Inherits'),
+                                         path=path) == res
+            assert mock_si.mock_calls == []
+
+    def test_cache_dependency_changed(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        cache = str(tmpdir.join('cache'))
+        with patch.dict('os.environ', {'RPYMOSTAT_CACHE_DIR': cache}):
+            res = static_class_info(self.ep('Inherits'), path=path)
+            assert res.description == 'base description'
+            clear_cache()
+            tmpdir.join('site', 'myplugin', 'base.py').write(
+                BASE_SRC.replace('base description', 'new description'))
+            res = static_class_info(self.ep('Inherits'), path=path)
+        assert res.description == 'new description'
+
+    def test_cache_dependency_removed(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        cache = str(tmpdir.join('cache'))
+        with patch.dict('os.environ', {'RPYMOSTAT_CACHE_DIR': cache}):
+            static_class_info(self.ep('Inherits'), path=path)
+            clear_cache()
+            tmpdir.join('site', 'myplugin', 'base.py').remove()
+            res = static_class_info(self.ep('Inherits'), path=path)
+        assert res == ClassInfo('Inherits')
+
+    def test_cache_old_version(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        with patch('%s.read_json' % pbm) as mock_rj:
+            with patch('%s.write_json' % pbm):
+                mock_rj.return_value = {
+                    'version': CACHE_FORMAT_VERSION - 1,
+                    'dependencies': {},
+                    'info': {'name': 'Wrong', 'description': None,
+                             'arguments': []}
+                }
+                res = static_class_info(self.ep('NoInit'), path=path)
+        assert res == ClassInfo('NoInit')
+
+    def test_no_source(self, tmpdir):
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            res = static_class_info(EntryPoint('foo', 'nope.mod:Foo', 'g'),
+                                    path=[str(tmpdir)])
+        assert res is None
+        assert mock_logger.mock_calls == [
+            call.debug('Could not find source for entry point %s (module %s)',
+                       'foo', 'nope.mod')
+        ]
+
+    def test_syntax_error(self, tmpdir):
+        tmpdir.join('bad.py').write('class Foo(object:\n')
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_CACHE_DIR': str(tmpdir.join('cache'))}):
+            res = static_class_info(EntryPoint('foo', 'bad:Foo', 'g'),
+                                    path=[str(tmpdir)])
+        assert res is None
+
+    def test_no_class(self, tmpdir):
+        path = self.make_plugin(tmpdir)
+        with patch.dict('os.environ',
+                        {'RPYMOSTAT_CACHE_DIR': str(tmpdir.join('cache'))}):
+            res = static_class_info(self.ep('Missing'), path=path)
+            res2 = static_class_info(self.ep('MySensor.Missing.Foo'),
+                                     path=path)
+            res3 = static_class_info(
+                EntryPoint('foo', 'myplugin.plugin', 'g'), path=path)
+        assert res is None
+        assert res2 is None
+        assert res3 is None
+
+
+class TestHelpers(object):
+
+    def test_default_string_fallback(self):
+        import ast
+        node = ast.parse('foo(1)').body[0].value
+        with patch('%s.ast.unparse' % pbm, None, create=True):
+            assert static_help._default_string(node) == '...'
+            node = ast.parse('foo.bar').body[0].value
+            assert static_help._default_string(node) == 'foo.bar'
+
+    def test_string_value(self):
+        import ast
+        assert static_help._string_value(
+            ast.parse('"foo"').body[0].value) == 'foo'
+        assert static_help._string_value(
+            ast.parse('1').body[0].value) is None
+        assert static_help._string_value(
+            ast.parse('foo').body[0].value) is None
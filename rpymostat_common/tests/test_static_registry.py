@@ -0,0 +1,171 @@
+"""
+The latest version of this package is available at:
+<http://github.com/jantman/rpymostat-common>
+
+##################################################################################
+Copyright 2016 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rpymostat-common, also known as rpymostat-common.
+
+    rpymostat-common is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rpymostat-common is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rpymostat-common.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rpymostat-common> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##################################################################################
+"""
+
+import sys
+
+from rpymostat_common import entry_points
+from rpymostat_common.entry_points import EntryPoint, StaticEntryPointIndex
+from rpymostat_common.loader import load_classes
+from rpymostat_common.static_registry import generate, main, resolve
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT  # noqa
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT  # noqa
+
+pbm = 'rpymostat_common.static_registry'
+pbt = 'rpymostat_common.tests.test_static_registry'
+
+
+class BasePlugin(object):
+
+    class Nested(object):
+        pass
+
+
+class Plugin(BasePlugin):
+    pass
+
+
+class OtherPlugin(object):
+    pass
+
+
+class TestStaticRegistry(object):
+
+    def setup_method(self):
+        self.groups = {
+            'my.a': [
+                EntryPoint('p1', '%s:Plugin' % pbt, 'my.a', 'd1', '1.0'),
+                EntryPoint('p2', '%s:OtherPlugin' % pbt, 'my.a', 'd1', '1.0'),
+                EntryPoint('p3', 'nonexistent_mod:Foo', 'my.a', 'd2', '2.0'),
+            ],
+            'my.b': [
+                EntryPoint('n', '%s:BasePlugin.Nested' % pbt, 'my.b', 'd1',
+                           '1.0'),
+                EntryPoint('m', 'rpymostat_common.tests', 'my.b', 'd1', '1.0'),
+            ],
+        }
+        self.modules = ['rpymostat_test_registry']
+        entry_points._index = None
+
+    def teardown_method(self):
+        for mod in self.modules:
+            sys.modules.pop(mod, None)
+        entry_points._index = None
+
+    def test_resolve(self):
+        with patch('%s.EntryPointIndex' % pbm) as mock_idx:
+            mock_idx.return_value.select.return_value = self.groups
+            with patch('rpymostat_common.loader.logger'):
+                res = resolve(['my.*'],
+                              superclass={'my.a': BasePlugin})
+        assert mock_idx.mock_calls == [
+            call(persist=False), call().select(['my.*'])
+        ]
+        assert res['my.a'] == [(self.groups['my.a'][0], Plugin)]
+        assert [x[1] for x in res['my.b']] == [
+            BasePlugin.Nested, sys.modules['rpymostat_common.tests']
+        ]
+
+    def test_generate_and_use(self, tmpdir):
+        with patch('%s.EntryPointIndex' % pbm) as mock_idx:
+            mock_idx.return_value.select.return_value = self.groups
+            with patch('rpymostat_common.loader.logger'):
+                src = generate(['my.*'], command_args='my.*')
+        assert 'python -m rpymostat_common.static_registry my.*' in src
+        tmpdir.join('rpymostat_test_registry.py').write(src)
+        sys.path.insert(0, str(tmpdir))
+        try:
+            with patch.dict('os.environ', {
+                'RPYMOSTAT_STATIC_REGISTRY': 'rpymostat_test_registry'
+            }):
+                with patch('%s.fingerprint' % 'rpymostat_common.entry_points'
+                           ) as mock_fp:
+                    res = load_classes('my.a', superclass=BasePlugin)
+                    res_b = load_classes('my.b')
+                    res_c = load_classes('my.c')
+        finally:
+            sys.path.remove(str(tmpdir))
+        assert isinstance(entry_points._index, StaticEntryPointIndex)
+        assert entry_points._index.rebuild() == entry_points._index.groups()
+        assert mock_fp.mock_calls == []
+        assert entry_points._index.groups() == {
+            'my.a': self.groups['my.a'][:2],
+            'my.b': self.groups['my.b'],
+        }
+        mod = sys.modules['rpymostat_test_registry']
+        assert mod.ENTRY_POINTS['my.a'][0] == (
+            'p1', '%s:Plugin' % pbt, 'my.a', 'd1', '1.0'
+        )
+        assert mod.HIDDENIMPORTS == ['rpymostat_common.tests', pbt]
+        assert 'import' not in src.split('"""')[-1].replace(
+            'HIDDENIMPORTS', ''
+        )
+        assert res == [Plugin]
+        assert res_b == [
+            BasePlugin.Nested, sys.modules['rpymostat_common.tests']
+        ]
+        assert res_c == []
+
+    def test_main(self, tmpdir, capsys):
+        out = str(tmpdir.join('reg.py'))
+        with patch('%s.generate' % pbm) as mock_gen:
+            mock_gen.return_value = 'FOO = 1\n'
+            main(['-o', out, '-s', '%s:BasePlugin' % pbt, 'my.a', 'my.b'])
+        assert mock_gen.mock_calls == [
+            call(['my.a', 'my.b'], superclass=BasePlugin,
+                 command_args='-o %s -s %s:BasePlugin my.a my.b' % (out, pbt))
+        ]
+        assert tmpdir.join('reg.py').read() == 'FOO = 1\n'
+        assert 'Wrote static plugin registry' in capsys.readouterr()[0]
+
+    def test_main_defaults(self, tmpdir):
+        with patch('%s.generate' % pbm) as mock_gen:
+            with patch('%s.sys.argv' % pbm, ['prog', 'my.a']):
+                mock_gen.return_value = ''
+                with tmpdir.as_cwd():
+                    main()
+        assert mock_gen.mock_calls == [
+            call(['my.a'], superclass=None, command_args='my.a')
+        ]
+        assert tmpdir.join('rpymostat_static_registry.py').check()
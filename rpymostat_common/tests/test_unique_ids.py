@@ -35,9 +35,17 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ##################################################################################
 """
 
+import json
+import os
 import sys
+import threading
 from textwrap import dedent
-from rpymostat_common.unique_ids import SystemID
+
+import pytest
+
+from rpymostat_common.cache import write_json
+from rpymostat_common.cpuinfo import parse_cpuinfo
+from rpymostat_common.unique_ids import SystemID, STATE_VERSION
 
 # https://code.google.com/p/mock/issues/detail?id=249
 # py>=3.4 should use unittest.mock not the mock package on pypi
@@ -45,9 +53,11 @@ if (
         sys.version_info[0] < 3 or
         sys.version_info[0] == 3 and sys.version_info[1] < 4
 ):
-    from mock import patch, call, Mock, DEFAULT, mock_open  # noqa
+    from mock import patch, call, Mock, DEFAULT, mock_open, ANY  # noqa
 else:
-    from unittest.mock import patch, call, Mock, DEFAULT, mock_open  # noqa
+    from unittest.mock import (  # noqa
+        patch, call, Mock, DEFAULT, mock_open, ANY
+    )
 
 pbm = 'rpymostat_common.unique_ids'
 pb = '%s.SystemID' % pbm
@@ -55,10 +65,14 @@ pb = '%s.SystemID' % pbm
 
 class TestSystemID(object):
 
-    def setup(self):
-        self.cls = SystemID()
+    def setup_method(self):
+        SystemID.invalidate()
+        self.cls = SystemID(state_path=False)
         self.exc = RuntimeError()
 
+    def teardown_method(self):
+        SystemID.invalidate()
+
     def se_exc(self, _self):
         raise self.exc
 
@@ -115,7 +129,7 @@ class TestSystemID(object):
 
     def test_uuid_getnode(self):
         with patch('%s.uuid.getnode' % pbm, autospec=True) as mock_getnode:
-            mock_getnode.return_value = 163683361899416L
+            mock_getnode.return_value = 163683361899416
             res = self.cls.uuid_getnode()
         assert res == 'uuid.getnode_94de80a44398'
 
@@ -162,19 +176,14 @@ class TestSystemID(object):
         power management:
         """)
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
-            with patch('%s.open' % pbm, mock_open(read_data=content),
-                       create=True) as mock_opn:
+            with patch('%s.get_cpuinfo' % pbm, autospec=True) as mock_gci:
+                mock_gci.return_value = parse_cpuinfo(content.splitlines())
                 res = self.cls.raspberrypi_cpu()
         assert res is None
         assert mock_logger.mock_calls == [
             call.debug('Not RPi - hw_match is None')
         ]
-        assert mock_opn.mock_calls == [
-            call('/proc/cpuinfo', 'r'),
-            call().__enter__(),
-            call().read(),
-            call().__exit__(None, None, None)
-        ]
+        assert mock_gci.mock_calls == [call()]
 
     def test_raspberrypi_cpu_other_hw(self):
         content = dedent("""
@@ -193,19 +202,14 @@ class TestSystemID(object):
         Serial          : 00000000ae463475
         """)
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
-            with patch('%s.open' % pbm, mock_open(read_data=content),
-                       create=True) as mock_opn:
+            with patch('%s.get_cpuinfo' % pbm, autospec=True) as mock_gci:
+                mock_gci.return_value = parse_cpuinfo(content.splitlines())
                 res = self.cls.raspberrypi_cpu()
         assert res is None
         assert mock_logger.mock_calls == [
             call.debug('Not RPi (Hardware: %s)', 'BCM2701')
         ]
-        assert mock_opn.mock_calls == [
-            call('/proc/cpuinfo', 'r'),
-            call().__enter__(),
-            call().read(),
-            call().__exit__(None, None, None)
-        ]
+        assert mock_gci.mock_calls == [call()]
 
     def test_raspberrypi_cpu_B2(self):
         content = dedent("""
@@ -224,8 +228,8 @@ class TestSystemID(object):
         Serial          : 00000000ae463475
         """)
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
-            with patch('%s.open' % pbm, mock_open(read_data=content),
-                       create=True) as mock_opn:
+            with patch('%s.get_cpuinfo' % pbm, autospec=True) as mock_gci:
+                mock_gci.return_value = parse_cpuinfo(content.splitlines())
                 res = self.cls.raspberrypi_cpu()
         assert res == 'RaspberryPi/B 2.0 512MB (Q4 2012 Sony)/ae463475'
         assert mock_logger.mock_calls == [
@@ -233,12 +237,7 @@ class TestSystemID(object):
                 'Appears to be a Raspberry Pi (Hardware: %s)', 'BCM2708'
             )
         ]
-        assert mock_opn.mock_calls == [
-            call('/proc/cpuinfo', 'r'),
-            call().__enter__(),
-            call().read(),
-            call().__exit__(None, None, None)
-        ]
+        assert mock_gci.mock_calls == [call()]
 
     def test_raspberrypi_cpu_no_rev(self):
         content = dedent("""
@@ -256,8 +255,8 @@ class TestSystemID(object):
         Serial          : 00000000ae463475
         """)
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
-            with patch('%s.open' % pbm, mock_open(read_data=content),
-                       create=True) as mock_opn:
+            with patch('%s.get_cpuinfo' % pbm, autospec=True) as mock_gci:
+                mock_gci.return_value = parse_cpuinfo(content.splitlines())
                 res = self.cls.raspberrypi_cpu()
         assert res == 'RaspberryPi/unknown_model/ae463475'
         assert mock_logger.mock_calls == [
@@ -265,12 +264,7 @@ class TestSystemID(object):
                 'Appears to be a Raspberry Pi (Hardware: %s)', 'BCM2708'
             )
         ]
-        assert mock_opn.mock_calls == [
-            call('/proc/cpuinfo', 'r'),
-            call().__enter__(),
-            call().read(),
-            call().__exit__(None, None, None)
-        ]
+        assert mock_gci.mock_calls == [call()]
 
     def test_raspberrypi_cpu_unknown_rev(self):
         content = dedent("""
@@ -289,8 +283,8 @@ class TestSystemID(object):
         Serial          : 00000000ae463475
         """)
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
-            with patch('%s.open' % pbm, mock_open(read_data=content),
-                       create=True) as mock_opn:
+            with patch('%s.get_cpuinfo' % pbm, autospec=True) as mock_gci:
+                mock_gci.return_value = parse_cpuinfo(content.splitlines())
                 res = self.cls.raspberrypi_cpu()
         assert res == 'RaspberryPi/model_fefe/ae463475'
         assert mock_logger.mock_calls == [
@@ -298,9 +292,542 @@ class TestSystemID(object):
                 'Appears to be a Raspberry Pi (Hardware: %s)', 'BCM2708'
             )
         ]
-        assert mock_opn.mock_calls == [
-            call('/proc/cpuinfo', 'r'),
-            call().__enter__(),
-            call().read(),
-            call().__exit__(None, None, None)
+        assert mock_gci.mock_calls == [call()]
+
+
+class TestSystemIDState(object):
+
+    def setup_method(self):
+        SystemID.invalidate()
+
+    def teardown_method(self):
+        SystemID.invalidate()
+
+    def test_default_state_path(self):
+        with patch('%s.state_dir' % pbm, autospec=True) as mock_sd:
+            mock_sd.return_value = '/state'
+            cls = SystemID()
+        assert cls.state_path == '/state/system_id.json'
+        assert cls.fallback_path == '/state/system_id_fallback.json'
+        cls = SystemID(state_path='/foo/bar.json')
+        assert cls.fallback_path == '/foo/system_id_fallback.json'
+        cls = SystemID(state_path=False)
+        assert cls.fallback_path is False
+        cls = SystemID(state_path=False, fallback_path='/foo/fb.json')
+        assert cls.fallback_path == '/foo/fb.json'
+
+    def test_random_fallback_persisted(self, tmpdir):
+        path = str(tmpdir.join('fb.json'))
+        cls = SystemID(state_path=False, fallback_path=path)
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            with patch('%s.uuid.uuid4' % pbm, autospec=True) as mock_uuid4:
+                mock_uuid4.side_effect = [Mock(hex='abcd'), Mock(hex='ef01')]
+                res1 = cls.random_fallback()
+                res2 = cls.random_fallback()
+                res3 = SystemID(
+                    state_path=False, fallback_path=path
+                ).random_fallback()
+        assert res1 == res2 == res3 == 'abcd'
+        assert mock_uuid4.mock_calls == [call()]
+        with open(path) as fh:
+            state = json.load(fh)
+        assert state['id'] == 'abcd'
+        assert state['version'] == STATE_VERSION
+        reuse = call.warning(
+            'Could not determine system ID with any concrete method; reusing '
+            'random UUID %s persisted in %s', 'abcd', path
+        )
+        assert mock_logger.mock_calls == [
+            call.warning('Could not determine system ID with any concrete '
+                         'method; using a random UUID.'),
+            call.warning('Persisted random system ID %s to %s', 'abcd', path),
+            reuse,
+            reuse
+        ]
+
+    def test_random_fallback_write_failed(self):
+        cls = SystemID(state_path=False, fallback_path='/foo/fb.json')
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            with patch.multiple(
+                pbm,
+                autospec=True,
+                read_json=DEFAULT,
+                write_json=DEFAULT,
+            ) as mocks:
+                mocks['read_json'].return_value = None
+                mocks['write_json'].return_value = False
+                with patch('%s.uuid.uuid4' % pbm,
+                           autospec=True) as mock_uuid4:
+                    mock_uuid4.return_value = Mock(hex='abcd')
+                    res = cls.random_fallback()
+        assert res == 'abcd'
+        data = {'version': STATE_VERSION, 'id': 'abcd', 'created': ANY}
+        assert mocks['write_json'].mock_calls == [
+            call('/foo/fb.json', data, durable=True, exclusive=True),
+            call('/foo/fb.json', data, durable=True)
+        ]
+        assert mock_logger.mock_calls[-1] == call.warning(
+            'Unable to persist random system ID to %s; it will change when '
+            'this process restarts', '/foo/fb.json'
+        )
+
+    def test_random_fallback_race(self, tmpdir):
+        path = str(tmpdir.join('fb.json'))
+        cls = SystemID(state_path=False, fallback_path=path)
+
+        def se_write(p, data, **kwargs):
+            # another process creates the file first
+            write_json(p, {'version': STATE_VERSION, 'id': 'other'})
+            return write_json(p, data, **kwargs)
+
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            with patch('%s.write_json' % pbm, autospec=True) as mock_write:
+                mock_write.side_effect = se_write
+                res = cls.random_fallback()
+        assert res == 'other'
+        assert mock_write.mock_calls == [
+            call(path, {'version': STATE_VERSION, 'id': ANY, 'created': ANY},
+                 durable=True, exclusive=True)
         ]
+        assert mock_logger.mock_calls[-1] == call.warning(
+            'Using random system ID %s persisted concurrently in %s',
+            'other', path
+        )
+        assert cls.random_fallback() == 'other'
+
+    def test_random_fallback_invalid_file(self, tmpdir):
+        path = tmpdir.join('fb.json')
+        # i.e. left empty by a power failure
+        path.write('')
+        cls = SystemID(state_path=False, fallback_path=str(path))
+        with patch('%s.logger' % pbm, autospec=True):
+            res = cls.random_fallback()
+            assert cls.random_fallback() == res
+        assert json.loads(path.read())['id'] == res
+
+    def test_memoized(self):
+        with patch.multiple(
+            pb,
+            autospec=True,
+            uuid_getnode=DEFAULT,
+            raspberrypi_cpu=DEFAULT,
+        ) as mocks:
+            mocks['raspberrypi_cpu'].return_value = 'rpi'
+            assert SystemID(state_path=False).id_string == 'rpi'
+            assert SystemID(state_path=False).id_string == 'rpi'
+            other = SystemID(state_path=False)
+            other.id_methods = ['uuid_getnode']
+            mocks['uuid_getnode'].return_value = 'node'
+            assert other.id_string == 'node'
+            assert other.id_string == 'node'
+        assert len(mocks['raspberrypi_cpu'].mock_calls) == 1
+        assert len(mocks['uuid_getnode'].mock_calls) == 1
+
+    def test_persisted(self, tmpdir):
+        path = str(tmpdir.join('sub', 'id.json'))
+        methods = ['raspberrypi_cpu', 'uuid_getnode']
+        with patch.object(SystemID, 'id_methods', methods), patch.multiple(
+            pb,
+            autospec=True,
+            uuid_getnode=DEFAULT,
+            raspberrypi_cpu=DEFAULT,
+            _valid_uuid_getnode=DEFAULT,
+        ) as mocks:
+            mocks['raspberrypi_cpu'].return_value = None
+            mocks['uuid_getnode'].return_value = 'uuid.getnode_1234'
+            mocks['_valid_uuid_getnode'].return_value = True
+            assert SystemID(state_path=path).id_string == 'uuid.getnode_1234'
+            with open(path) as fh:
+                assert json.load(fh) == {
+                    'version': STATE_VERSION, 'method': 'uuid_getnode',
+                    'id': 'uuid.getnode_1234'
+                }
+            SystemID.invalidate()
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                assert SystemID(state_path=path).id_string == \
+                    'uuid.getnode_1234'
+        assert len(mocks['raspberrypi_cpu'].mock_calls) == 1
+        assert len(mocks['uuid_getnode'].mock_calls) == 1
+        assert mocks['_valid_uuid_getnode'].mock_calls == [
+            call(ANY, 'uuid.getnode_1234')
+        ]
+        assert mock_logger.mock_calls == [
+            call.debug('Read SystemID (method %s) from %s', 'uuid_getnode',
+                       path)
+        ]
+
+    def test_fallback_not_persisted(self, tmpdir):
+        path = str(tmpdir.join('id.json'))
+        cls = SystemID(state_path=path)
+        cls.id_methods = ['uuid_getnode']
+        with patch.multiple(
+            pb,
+            autospec=True,
+            uuid_getnode=DEFAULT,
+            random_fallback=DEFAULT,
+        ) as mocks:
+            mocks['uuid_getnode'].return_value = None
+            mocks['random_fallback'].return_value = 'random'
+            assert cls.id_string == 'random'
+            assert not os.path.exists(path)
+            SystemID.invalidate()
+            mocks['uuid_getnode'].return_value = 'uuid.getnode_1234'
+            assert cls.id_string == 'uuid.getnode_1234'
+            with open(path) as fh:
+                assert json.load(fh)['method'] == 'uuid_getnode'
+        assert len(mocks['uuid_getnode'].mock_calls) == 2
+        assert len(mocks['random_fallback'].mock_calls) == 1
+
+    def test_state_random_fallback_ignored(self, tmpdir):
+        path = self.write_state(tmpdir, {
+            'version': STATE_VERSION, 'method': 'random_fallback',
+            'id': 'random'
+        })
+        cls = SystemID(state_path=path)
+        cls.id_methods = ['uuid_getnode']
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            assert cls._read_state() is None
+        assert mock_logger.mock_calls == [
+            call.debug('Ignoring SystemID state file %s; written by '
+                       'random_fallback', path)
+        ]
+        with patch('%s.uuid_getnode' % pb, autospec=True) as mock_ug:
+            mock_ug.return_value = 'uuid.getnode_1234'
+            assert cls.id_string == 'uuid.getnode_1234'
+
+    def write_state(self, tmpdir, state):
+        path = str(tmpdir.join('id.json'))
+        with open(path, 'w') as fh:
+            json.dump(state, fh)
+        return path
+
+    def test_state_invalid(self, tmpdir):
+        for state in [
+            ['foo'],
+            {'version': 0, 'method': 'uuid_getnode', 'id': 'foo'},
+            {'version': STATE_VERSION, 'method': 'uuid_getnode', 'id': ''},
+        ]:
+            path = self.write_state(tmpdir, state)
+            assert SystemID(state_path=path)._read_state() is None
+
+    def test_state_method_removed(self, tmpdir):
+        path = self.write_state(tmpdir, {
+            'version': STATE_VERSION, 'method': 'foo', 'id': 'bar'
+        })
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            assert SystemID(state_path=path)._read_state() is None
+        assert mock_logger.mock_calls == [
+            call.debug('Ignoring SystemID state file %s; method %s is not in '
+                       'id_methods', path, 'foo')
+        ]
+
+    def test_state_no_validator(self, tmpdir):
+        path = self.write_state(tmpdir, {
+            'version': STATE_VERSION, 'method': 'foo', 'id': 'bar'
+        })
+        cls = SystemID(state_path=path)
+        cls.id_methods = ['foo']
+        assert cls._read_state() == 'bar'
+
+    def test_state_validation_failed(self, tmpdir):
+        path = self.write_state(tmpdir, {
+            'version': STATE_VERSION, 'method': 'raspberrypi_cpu',
+            'id': 'RaspberryPi/foo/1234'
+        })
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            with patch.multiple(
+                pb,
+                autospec=True,
+                uuid_getnode=DEFAULT,
+                raspberrypi_cpu=DEFAULT,
+                _valid_raspberrypi_cpu=DEFAULT,
+            ) as mocks:
+                mocks['_valid_raspberrypi_cpu'].return_value = False
+                mocks['raspberrypi_cpu'].return_value = 'RaspberryPi/foo/56'
+                res = SystemID(state_path=path).id_string
+        assert res == 'RaspberryPi/foo/56'
+        assert mock_logger.mock_calls[0] == call.info(
+            'SystemID %s from %s no longer matches this hardware; determining '
+            'it again', 'RaspberryPi/foo/1234', path
+        )
+        with open(path) as fh:
+            assert json.load(fh)['id'] == 'RaspberryPi/foo/56'
+
+    def test_state_validation_exception(self, tmpdir):
+        path = self.write_state(tmpdir, {
+            'version': STATE_VERSION, 'method': 'raspberrypi_cpu',
+            'id': 'RaspberryPi/foo/1234'
+        })
+        with patch('%s._valid_raspberrypi_cpu' % pb,
+                   autospec=True) as mock_valid:
+            mock_valid.side_effect = IOError()
+            assert SystemID(state_path=path)._read_state() is None
+
+    def test_valid_raspberrypi_cpu(self):
+        content = dedent("""
+        processor       : 0
+        Hardware        : BCM2708
+        Revision        : 000e
+        Serial          : 00000000ae463475
+        """)
+        cls = SystemID(state_path=False)
+        with patch('%s.get_cpuinfo' % pbm, autospec=True) as mock_gci:
+            mock_gci.return_value = parse_cpuinfo(content.splitlines())
+            assert cls._valid_raspberrypi_cpu('RaspberryPi/foo/ae463475')
+            assert not cls._valid_raspberrypi_cpu('RaspberryPi/foo/ae46')
+
+    def test_valid_uuid_getnode(self):
+        addrs = {
+            '/sys/class/net/lo/address': '00:00:00:00:00:00\n',
+            '/sys/class/net/eth0/address': '94:de:80:a4:43:98\n',
+        }
+
+        def se_open(path, mode):
+            if path not in addrs:
+                raise IOError()
+            return mock_open(read_data=addrs[path])()
+
+        cls = SystemID(state_path=False)
+        with patch('%s.os.listdir' % pbm, autospec=True) as mock_ld:
+            with patch('%s.open' % pbm, create=True) as mock_opn:
+                mock_ld.return_value = ['lo', 'wlan0', 'eth0']
+                mock_opn.side_effect = se_open
+                assert cls._valid_uuid_getnode('uuid.getnode_94de80a44398')
+                assert not cls._valid_uuid_getnode('uuid.getnode_94de80a4')
+                mock_ld.side_effect = OSError()
+                assert cls._valid_uuid_getnode('uuid.getnode_1') is None
+
+
+class TestFileIDMethods(object):
+
+    def setup_method(self):
+        self.cls = SystemID(state_path=False)
+        self.files = {}
+
+    def se_open(self, path, mode):
+        assert mode == 'r'
+        if path not in self.files:
+            raise IOError(2, 'No such file or directory')
+        return mock_open(read_data=self.files[path])()
+
+    def call(self, meth, *args):
+        with patch('%s.open' % pbm, create=True) as mock_opn:
+            mock_opn.side_effect = self.se_open
+            return getattr(self.cls, meth)(*args)
+
+    def test_id_methods_order(self):
+        assert SystemID.id_methods == [
+            'raspberrypi_cpu',
+            'uuid_getnode',
+            'device_tree_serial',
+            'dmi_product_uuid',
+            'machine_id',
+            'net_address'
+        ]
+
+    def probe(self, node):
+        SystemID._getnode_probe = None
+        with patch('%s.os.listdir' % pbm, autospec=True) as mock_ld:
+            with patch('%s.get_cpuinfo' % pbm, autospec=True) as mock_gci:
+                with patch('%s.uuid.getnode' % pbm) as mock_getnode:
+                    mock_ld.return_value = ['eth0']
+                    mock_gci.return_value = parse_cpuinfo([])
+                    mock_getnode.return_value = node
+                    return self.call('_probe')
+
+    def test_locally_administered_only_nic(self):
+        self.files = {
+            '/etc/machine-id': '67e3d13727e94486a0cd8c0d55eeb41b\n',
+            '/sys/class/net/eth0/address': '02:fc:00:00:00:01\n',
+        }
+        # the ID is unchanged from before the file-based methods were added
+        assert self.probe(0x02fc00000001) == 'uuid.getnode_2fc00000001'
+        with patch('%s.os.listdir' % pbm, autospec=True) as mock_ld:
+            mock_ld.return_value = ['eth0']
+            assert self.call('net_address') is None
+
+    def test_random_node(self):
+        self.files = {
+            '/etc/machine-id': '67e3d13727e94486a0cd8c0d55eeb41b\n',
+        }
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            res = self.probe(0x03fc00000001)
+        assert res == 'machine_id_67e3d13727e94486a0cd8c0d55eeb41b'
+        assert call.debug(
+            'uuid.getnode() returned random node %x; skipping method '
+            'uuid_getnode', 0x03fc00000001
+        ) in mock_logger.mock_calls
+
+    def test_read_id_file(self):
+        self.files = {'/a': 'foo\x00', '/b': ' \n'}
+        assert self.call('_read_id_file', '/a') == 'foo'
+        assert self.call('_read_id_file', '/b') is None
+        assert self.call('_read_id_file', '/c') is None
+
+    def test_device_tree_serial(self):
+        path = '/proc/device-tree/serial-number'
+        assert self.call('device_tree_serial') is None
+        self.files[path] = '00000000ae463475\x00'
+        assert self.call('device_tree_serial') == \
+            'device_tree_serial_00000000ae463475'
+        assert self.call('_valid_device_tree_serial',
+                         'device_tree_serial_00000000ae463475') is True
+        assert self.call('_valid_device_tree_serial',
+                         'device_tree_serial_1234') is False
+        self.files[path] = '0000000000000000\x00'
+        assert self.call('device_tree_serial') is None
+
+    def test_dmi_product_uuid(self):
+        path = '/sys/class/dmi/id/product_uuid'
+        assert self.call('dmi_product_uuid') is None
+        self.files[path] = '4C4C4544-0037-3010-8052-B7C04F4E4D32\n'
+        res = 'dmi_product_uuid_4c4c4544-0037-3010-8052-b7c04f4e4d32'
+        assert self.call('dmi_product_uuid') == res
+        assert self.call('_valid_dmi_product_uuid', res) is True
+        self.files[path] = '03000200-0400-0500-0006-000700080009\n'
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            assert self.call('dmi_product_uuid') is None
+        assert mock_logger.mock_calls == [
+            call.debug('Ignoring placeholder DMI product UUID %s',
+                       '03000200-0400-0500-0006-000700080009')
+        ]
+
+    def test_machine_id(self):
+        path = '/etc/machine-id'
+        assert self.call('machine_id') is None
+        self.files[path] = '67e3d13727e94486a0cd8c0d55eeb41b\n'
+        res = 'machine_id_67e3d13727e94486a0cd8c0d55eeb41b'
+        assert self.call('machine_id') == res
+        assert self.call('_valid_machine_id', res) is True
+        assert self.call('_valid_machine_id', 'machine_id_1') is False
+        self.files[path] = 'uninitialized\n'
+        assert self.call('machine_id') is None
+        self.files[path] = ''
+        assert self.call('machine_id') is None
+
+    def test_net_address(self):
+        self.files = {
+            '/sys/class/net/lo/address': '00:00:00:00:00:00\n',
+            '/sys/class/net/docker0/address': '02:42:ac:11:00:02\n',
+            '/sys/class/net/bond0/address': '01:00:5e:00:00:01\n',
+            '/sys/class/net/eth0/address': '94:de:80:a4:43:98\n',
+            '/sys/class/net/wlan0/address': 'b8:27:eb:00:00:01\n',
+        }
+        with patch('%s.os.listdir' % pbm, autospec=True) as mock_ld:
+            mock_ld.return_value = [
+                'wlan0', 'lo', 'docker0', 'eth0', 'bond0', 'gone'
+            ]
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                res = self.call('net_address')
+            assert res == 'net_address_94de80a44398'
+            assert mock_logger.mock_calls == [
+                call.debug('Using hardware address of interface %s', 'eth0')
+            ]
+            assert self.call('_valid_net_address', res) is True
+            assert self.call(
+                '_valid_net_address', 'net_address_94de80a44399'
+            ) is False
+            mock_ld.return_value = ['lo', 'docker0']
+            assert self.call('net_address') is None
+            mock_ld.side_effect = OSError()
+            assert self.call('net_address') is None
+            assert self.call('_valid_net_address', res) is None
+
+
+class TestUUIDGetnodeDeadline(object):
+
+    def setup_method(self):
+        SystemID.invalidate()
+        SystemID.uuid_getnode_timeouts = 0
+        SystemID._getnode_probe = None
+        self.release = threading.Event()
+
+    def teardown_method(self):
+        self.release.set()
+        SystemID.invalidate()
+        SystemID.uuid_getnode_timeouts = 0
+        SystemID._getnode_probe = None
+
+    def se_getnode(self):
+        self.release.wait(5)
+        return 163683361899416
+
+    def test_timeout_override(self):
+        assert SystemID(state_path=False).uuid_getnode_timeout == 2.0
+        cls = SystemID(state_path=False, uuid_getnode_timeout=0.5)
+        assert cls.uuid_getnode_timeout == 0.5
+        cls = SystemID(state_path=False, uuid_getnode_timeout=None)
+        assert cls.uuid_getnode_timeout is None
+
+    def test_timeout(self):
+        cls = SystemID(state_path=False, uuid_getnode_timeout=0.05)
+        with patch('%s.uuid.getnode' % pbm) as mock_getnode:
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                mock_getnode.side_effect = self.se_getnode
+                assert cls.uuid_getnode() is None
+                assert cls.uuid_getnode() is None
+                assert SystemID.uuid_getnode_timeouts == 2
+                self.release.set()
+                cls.uuid_getnode_timeout = 5
+                res = cls.uuid_getnode()
+        assert res == 'uuid.getnode_94de80a44398'
+        assert mock_getnode.mock_calls == [call()]
+        assert SystemID._getnode_probe is None
+        assert mock_logger.mock_calls == [
+            call.warning('uuid.getnode() did not return within %s seconds '
+                         '(%d time(s) in this process); skipping method '
+                         'uuid_getnode', 0.05, 1),
+            call.warning('uuid.getnode() did not return within %s seconds '
+                         '(%d time(s) in this process); skipping method '
+                         'uuid_getnode', 0.05, 2),
+        ]
+
+    def test_timeout_not_persisted(self, tmpdir):
+        path = str(tmpdir.join('id.json'))
+        cls = SystemID(state_path=path, uuid_getnode_timeout=0.05)
+        cls.id_methods = ['uuid_getnode', 'machine_id']
+        with patch('%s.uuid.getnode' % pbm) as mock_getnode:
+            with patch('%s.machine_id' % pb, autospec=True) as mock_mid:
+                with patch('%s.logger' % pbm):
+                    mock_getnode.side_effect = self.se_getnode
+                    mock_mid.return_value = 'machine_id_1'
+                    assert cls.id_string == 'machine_id_1'
+                    assert not os.path.exists(path)
+                    SystemID.invalidate()
+                    self.release.set()
+                    cls.uuid_getnode_timeout = 5
+                    assert cls.id_string == 'uuid.getnode_94de80a44398'
+        with open(path) as fh:
+            assert json.load(fh)['method'] == 'uuid_getnode'
+
+    def test_exception(self):
+        cls = SystemID(state_path=False)
+        with patch('%s.uuid.getnode' % pbm) as mock_getnode:
+            mock_getnode.side_effect = RuntimeError('foo')
+            with pytest.raises(RuntimeError):
+                cls.uuid_getnode()
+            assert SystemID._getnode_probe is None
+            mock_getnode.side_effect = None
+            mock_getnode.return_value = 1
+            assert cls.uuid_getnode() == 'uuid.getnode_1'
+        assert SystemID.uuid_getnode_timeouts == 0
+
+    def test_id_string_falls_through(self, tmpdir):
+        path = str(tmpdir.join('id.json'))
+        cls = SystemID(state_path=path, uuid_getnode_timeout=0.05)
+        cls.id_methods = ['uuid_getnode']
+        with patch('%s.uuid.getnode' % pbm) as mock_getnode:
+            with patch('%s.logger' % pbm):
+                mock_getnode.side_effect = self.se_getnode
+                res = cls.id_string
+                assert os.path.exists(cls.fallback_path)
+                assert not os.path.exists(path)
+                # a later process tries uuid.getnode() again
+                SystemID.invalidate()
+                self.release.set()
+                cls.uuid_getnode_timeout = 5
+                assert cls.id_string == 'uuid.getnode_94de80a44398'
+        assert len(res) == 32
+        assert SystemID.uuid_getnode_timeouts == 1
+        with open(path) as fh:
+            assert json.load(fh)['method'] == 'uuid_getnode'
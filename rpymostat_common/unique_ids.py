@@ -36,11 +36,20 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import logging
-import re
+import os
+import threading
+import time
 import uuid
 
+from rpymostat_common.cache import read_json, state_dir, write_json
+from rpymostat_common.cpuinfo import get_cpuinfo
+
 logger = logging.getLogger(__name__)
 
+#: Format version of the :py:class:`~.SystemID` state file; files with any
+#: other version are ignored.
+STATE_VERSION = 1
+
 
 class SystemID(object):
     """
@@ -49,23 +58,27 @@ class SystemID(object):
     """
 
     # List of method names in this class to call when determining an ID
-    # in :py:method:`.id_string`.
+    # in :py:method:`.id_string`. raspberrypi_cpu and uuid_getnode come
+    # first, as they did before the others were added, so that existing IDs
+    # don't change; the others are only reached when uuid.getnode() times
+    # out or finds no hardware address, and are ordered by probe cost
+    # (see rpymostat_common.benchmarks.id_method_times).
     id_methods = [
         'raspberrypi_cpu',
-        'uuid_getnode'
+        'uuid_getnode',
+        'device_tree_serial',
+        'dmi_product_uuid',
+        'machine_id',
+        'net_address'
     ]
 
-    # regex to match Hardware line from /proc/cpuinfo
-    proc_cpuinfo_hw_re = re.compile('^Hardware\s+:\s+(\w+)$',
-                                    flags=re.MULTILINE | re.IGNORECASE)
-
-    # regex to match Revision line from /proc/cpuinfo
-    proc_cpuinfo_rev_re = re.compile('^Revision\s+:\s+(\w+)$',
-                                     flags=re.MULTILINE | re.IGNORECASE)
-
-    # regex to match Serial line from /proc/cpuinfo
-    proc_cpuinfo_serial_re = re.compile('^Serial\s+:\s+(\w+)$',
-                                        flags=re.MULTILINE | re.IGNORECASE)
+    # DMI product UUIDs that firmware commonly leaves unset or fills with a
+    # placeholder, so are not unique
+    invalid_dmi_uuids = [
+        '00000000-0000-0000-0000-000000000000',
+        'ffffffff-ffff-ffff-ffff-ffffffffffff',
+        '03000200-0400-0500-0006-000700080009',
+    ]
 
     # /proc/cpuinfo Hardware values for RPi
     rpi_hardware = ['BCM2708', 'BCM2709']
@@ -100,26 +113,171 @@ class SystemID(object):
         'a22082': '3 Model B 1.2 1024MB (Q1 2016)',
     }
 
+    # IDs resolved in this process, keyed by (id_methods, state_path), so
+    # that repeated accesses (from any instance) don't re-probe hardware.
+    _memo = {}
+
+    # Seconds that :py:meth:`~.uuid_getnode` waits for uuid.getnode(), which
+    # may run external commands, before giving up; None to wait forever.
+    uuid_getnode_timeout = 2.0
+
+    # Number of times :py:meth:`~.uuid_getnode` has given up waiting in this
+    # process.
+    uuid_getnode_timeouts = 0
+
+    # (thread, result list) of the in-progress uuid.getnode() call, if any
+    _getnode_probe = None
+    _getnode_lock = threading.Lock()
+
+    def __init__(self, state_path=None, fallback_path=None,
+                 uuid_getnode_timeout=False):
+        """
+        :param state_path: path to the JSON state file the resolved ID is
+          persisted to; defaults to ``system_id.json`` in
+          :py:func:`rpymostat_common.cache.state_dir`. If False, the ID is
+          only memoized in-process.
+        :type state_path: str
+        :param fallback_path: path to the JSON file that the ID generated by
+          :py:meth:`~.random_fallback` is persisted to; defaults to
+          ``system_id_fallback.json`` in the same directory as
+          ``state_path`` (or, if that is False, a new random ID is generated
+          in each process).
+        :type fallback_path: str
+        :param uuid_getnode_timeout: if given, override
+          :py:attr:`~.uuid_getnode_timeout` for this instance
+        :type uuid_getnode_timeout: float
+        """
+        if uuid_getnode_timeout is not False:
+            self.uuid_getnode_timeout = uuid_getnode_timeout
+        if state_path is None:
+            state_path = os.path.join(state_dir(), 'system_id.json')
+        self.state_path = state_path
+        if fallback_path is None:
+            fallback_path = False
+            if state_path:
+                fallback_path = os.path.join(
+                    os.path.dirname(state_path), 'system_id_fallback.json'
+                )
+        self.fallback_path = fallback_path
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Forget the IDs memoized in this process, so that the next
+        :py:attr:`~.id_string` access reads the state file (or probes) again.
+        """
+        cls._memo.clear()
+
     @property
     def id_string(self):
         """
         Find/calculate and return the unique system ID string for the hardware
         this is running on.
 
-        Internally, this calls all method whose names are listed in
+        The ID is memoized for the life of the process. The first access reads
+        it from the state file (see :py:attr:`~.state_path`), if one exists
+        that was written by a method still listed in :py:attr:`.id_methods`
+        and the cheap validation for that method (a ``_valid_<method>``
+        method, if defined; i.e. the Raspberry Pi serial still matches)
+        passes. Otherwise, this calls all method whose names are listed in
         :py:attr:`.id_methods`, in order, and returns the value of the first
-        one that returned something other than None.
+        one that returned something other than None, writing it to the state
+        file.
 
         :return: unique, never-changing system ID
+        :rtype: str
+        """
+        key = (tuple(self.id_methods), self.state_path)
+        id_str = SystemID._memo.get(key)
+        if id_str is not None:
+            return id_str
+        id_str = self._read_state()
+        if id_str is None:
+            id_str = self._probe()
+        SystemID._memo[key] = id_str
+        return id_str
+
+    def _read_state(self):
+        """
+        Read and validate the ID from the state file.
+
+        :return: the persisted ID, or None if there is no valid one
+        :rtype: str
+        """
+        if not self.state_path:
+            return None
+        state = read_json(self.state_path)
+        if (
+            not isinstance(state, dict) or
+            state.get('version') != STATE_VERSION or
+            not state.get('id')
+        ):
+            return None
+        method = state.get('method')
+        if method == 'random_fallback':
+            # written by older versions; the concrete methods may succeed now
+            logger.debug('Ignoring SystemID state file %s; written by '
+                         'random_fallback', self.state_path)
+            return None
+        if method not in self.id_methods:
+            logger.debug('Ignoring SystemID state file %s; method %s is not '
+                         'in id_methods', self.state_path, method)
+            return None
+        validator = getattr(self, '_valid_%s' % method, None)
+        if validator is not None:
+            try:
+                valid = validator(state['id'])
+            except Exception:
+                logger.debug('Exception validating SystemID via method %s',
+                             method, exc_info=1)
+                valid = False
+            if valid is False:
+                logger.info('SystemID %s from %s no longer matches this '
+                            'hardware; determining it again', state['id'],
+                            self.state_path)
+                return None
+        logger.debug('Read SystemID (method %s) from %s', method,
+                     self.state_path)
+        return state['id']
+
+    def _write_state(self, id_str, method):
+        """
+        Atomically and durably write the ID, and the method that determined
+        it, to the state file (if enabled).
+        """
+        if not self.state_path:
+            return
+        write_json(
+            self.state_path,
+            {'version': STATE_VERSION, 'method': method, 'id': id_str},
+            durable=True
+        )
+
+    def _probe(self):
+        """
+        Determine the ID by calling each of :py:attr:`.id_methods` in turn,
+        falling back to :py:meth:`~.random_fallback`. Only IDs determined by
+        a concrete method are written to the state file, and not if
+        :py:meth:`~.uuid_getnode` timed out first; the random ID is persisted
+        separately. Later processes therefore try the concrete methods again
+        after a transient :py:meth:`~.uuid_getnode` timeout, but keep the
+        same random ID if they all still fail.
+
         :rtype: str
         """
         id_str = None
+        timeouts = SystemID.uuid_getnode_timeouts
         for meth_name in self.id_methods:
             try:
                 s = getattr(self, meth_name)()
                 if s is not None:
                     id_str = s
                     logger.debug('Determined SystemID via method %s', meth_name)
+                    if SystemID.uuid_getnode_timeouts == timeouts:
+                        self._write_state(id_str, meth_name)
+                    else:
+                        logger.debug('Not persisting SystemID; uuid_getnode '
+                                     'timed out')
                     break
             except Exception:
                 logger.debug('Exception encountered when trying to determine '
@@ -142,44 +300,291 @@ class SystemID(object):
         :return: RaspberryPi serial number
         :rtype: str
         """
-        with open('/proc/cpuinfo', 'r') as fh:
-            lines = fh.read()
-        hw_match = self.proc_cpuinfo_hw_re.search(lines)
-        rev_match = self.proc_cpuinfo_rev_re.search(lines)
-        serial_match = self.proc_cpuinfo_serial_re.search(lines)
-        serial = 'unknown'
-        if serial_match is not None:
-            serial = serial_match.group(1).strip('0 ')
+        info = get_cpuinfo()
+        serial = self._cpu_serial(info)
 
         # check Hardware from /proc/cpuinfo
-        if hw_match is None:
+        if info.hardware is None:
             logger.debug('Not RPi - hw_match is None')
             return None
-        if hw_match.group(1) not in self.rpi_hardware:
-            logger.debug('Not RPi (Hardware: %s)', hw_match.group(1))
+        if info.hardware not in self.rpi_hardware:
+            logger.debug('Not RPi (Hardware: %s)', info.hardware)
             return None
         logger.debug('Appears to be a Raspberry Pi (Hardware: %s)',
-                     hw_match.group(1))
+                     info.hardware)
 
         # check Revision to get model
-        if rev_match is None:
+        if info.revision is None:
             return 'RaspberryPi/unknown_model/%s' % serial
 
         # find model
-        if rev_match.group(1) not in self.rpi_revisions:
-            return 'RaspberryPi/model_%s/%s' % (rev_match.group(1), serial)
-        return 'RaspberryPi/%s/%s' % (self.rpi_revisions[rev_match.group(1)],
+        if info.revision not in self.rpi_revisions:
+            return 'RaspberryPi/model_%s/%s' % (info.revision, serial)
+        return 'RaspberryPi/%s/%s' % (self.rpi_revisions[info.revision],
                                       serial)
 
+    @staticmethod
+    def _cpu_serial(info):
+        """
+        Return the CPU serial number from ``info`` with leading zeroes
+        removed, or ``unknown``.
+
+        :param info: parsed ``/proc/cpuinfo``
+        :type info: rpymostat_common.cpuinfo.CpuInfo
+        :rtype: str
+        """
+        if info.serial is None:
+            return 'unknown'
+        return info.serial.strip('0 ')
+
+    def _valid_raspberrypi_cpu(self, id_str):
+        """
+        Check that a persisted :py:meth:`~.raspberrypi_cpu` ID still matches
+        the CPU serial number.
+
+        :param id_str: the persisted ID
+        :type id_str: str
+        :rtype: bool
+        """
+        return id_str.endswith('/%s' % self._cpu_serial(get_cpuinfo()))
+
+    @staticmethod
+    def _read_id_file(path):
+        """
+        Return the stripped contents of a small ID file (ignoring trailing
+        NUL bytes, as in device tree properties), or None if it can't be
+        read or is empty.
+
+        :param path: path to the file
+        :type path: str
+        :rtype: str
+        """
+        try:
+            with open(path, 'r') as fh:
+                content = fh.read().strip('\x00 \t\r\n')
+        except (IOError, OSError):
+            return None
+        if content == '':
+            return None
+        return content
+
+    def device_tree_serial(self):
+        """
+        Determine this system's ID from the board serial number in the
+        device tree (i.e. on ARM boards).
+
+        :return: device tree serial number based ID
+        :rtype: str
+        """
+        serial = self._read_id_file('/proc/device-tree/serial-number')
+        if serial is None or serial.strip('0') == '':
+            return None
+        return 'device_tree_serial_%s' % serial
+
+    def _valid_device_tree_serial(self, id_str):
+        """
+        Check that the device tree serial number is unchanged.
+        """
+        return self.device_tree_serial() == id_str
+
+    def dmi_product_uuid(self):
+        """
+        Determine this system's ID from the SMBIOS/DMI product UUID (i.e. on
+        x86 hardware). This file is usually only readable by root.
+
+        :return: DMI product UUID based ID
+        :rtype: str
+        """
+        product_uuid = self._read_id_file('/sys/class/dmi/id/product_uuid')
+        if product_uuid is None:
+            return None
+        product_uuid = product_uuid.lower()
+        if product_uuid in self.invalid_dmi_uuids:
+            logger.debug('Ignoring placeholder DMI product UUID %s',
+                         product_uuid)
+            return None
+        return 'dmi_product_uuid_%s' % product_uuid
+
+    def _valid_dmi_product_uuid(self, id_str):
+        """
+        Check that the DMI product UUID is unchanged.
+        """
+        return self.dmi_product_uuid() == id_str
+
+    def machine_id(self):
+        """
+        Determine this system's ID from the systemd/D-Bus machine ID in
+        ``/etc/machine-id``. Note that this identifies the OS installation
+        rather than the hardware.
+
+        :return: machine ID based ID
+        :rtype: str
+        """
+        mid = self._read_id_file('/etc/machine-id')
+        if mid is None or mid == 'uninitialized' or mid.strip('0') == '':
+            return None
+        return 'machine_id_%s' % mid
+
+    def _valid_machine_id(self, id_str):
+        """
+        Check that ``/etc/machine-id`` is unchanged.
+        """
+        return self.machine_id() == id_str
+
+    @staticmethod
+    def _net_addresses():
+        """
+        Read the hardware addresses of this system's network interfaces from
+        ``/sys/class/net/*/address``.
+
+        :return: list of (interface name, address as int) tuples, sorted by
+          name; or None if interfaces can't be listed on this system
+        :rtype: list
+        """
+        try:
+            names = sorted(os.listdir('/sys/class/net'))
+        except OSError:
+            return None
+        res = []
+        for name in names:
+            try:
+                with open(
+                    os.path.join('/sys/class/net', name, 'address'), 'r'
+                ) as fh:
+                    res.append(
+                        (name, int(fh.read().strip().replace(':', ''), 16))
+                    )
+            except (IOError, OSError, ValueError):
+                continue
+        return res
+
+    def net_address(self):
+        """
+        Determine this system's ID from the first (by interface name)
+        universally administered hardware address read from
+        ``/sys/class/net/*/address``, without running external commands.
+        This does not necessarily pick the same address as
+        :py:func:`uuid.getnode`, so it is tried after
+        :py:meth:`~.uuid_getnode`.
+
+        :return: network hardware address based ID
+        :rtype: str
+        """
+        for name, addr in self._net_addresses() or []:
+            # skip empty (i.e. loopback), multicast and locally administered
+            # (i.e. randomized or virtual) addresses
+            if addr == 0 or (addr >> 40) & 0x03:
+                continue
+            logger.debug('Using hardware address of interface %s', name)
+            return 'net_address_%012x' % addr
+        return None
+
+    def _valid_net_address(self, id_str):
+        """
+        Check that the hardware address in a persisted
+        :py:meth:`~.net_address` ID still belongs to one of this system's
+        network interfaces; see :py:meth:`~._valid_uuid_getnode`.
+        """
+        return self._valid_uuid_getnode(id_str)
+
     def uuid_getnode(self):
         """
         Determine this system's UUID via Python's :py:func:`uuid.getnode` (slow)
         method.
 
+        :py:func:`uuid.getnode` is called in a daemon thread, and if it does
+        not return within :py:attr:`~.uuid_getnode_timeout` seconds, this
+        gives up (incrementing :py:attr:`~.uuid_getnode_timeouts`) and returns
+        None so that the next method is tried. The call is left to finish in
+        the background; later calls wait on it rather than starting another.
+        If :py:func:`uuid.getnode` found no hardware address and returned a
+        random one (with the multicast bit set), this also returns None.
+
         :return: hardware system ID from Python's :py:func:`uuid.getnode`
         :rtype: str
         """
-        return 'uuid.getnode_%x' % uuid.getnode()
+        with SystemID._getnode_lock:
+            probe = SystemID._getnode_probe
+            if probe is None:
+                result = []
+                thread = threading.Thread(
+                    target=self._run_getnode, args=(result,),
+                    name='uuid_getnode'
+                )
+                thread.daemon = True
+                thread.start()
+                probe = SystemID._getnode_probe = (thread, result)
+        thread, result = probe
+        thread.join(self.uuid_getnode_timeout)
+        if thread.is_alive():
+            with SystemID._getnode_lock:
+                SystemID.uuid_getnode_timeouts += 1
+            logger.warning('uuid.getnode() did not return within %s seconds '
+                           '(%d time(s) in this process); skipping method '
+                           'uuid_getnode', self.uuid_getnode_timeout,
+                           SystemID.uuid_getnode_timeouts)
+            return None
+        with SystemID._getnode_lock:
+            if SystemID._getnode_probe is probe:
+                SystemID._getnode_probe = None
+        if isinstance(result[0], Exception):
+            raise result[0]
+        if (result[0] >> 40) & 0x01:
+            logger.debug('uuid.getnode() returned random node %x; skipping '
+                         'method uuid_getnode', result[0])
+            return None
+        return 'uuid.getnode_%x' % result[0]
+
+    @staticmethod
+    def _run_getnode(result):
+        """
+        Thread target for :py:meth:`~.uuid_getnode`; call
+        :py:func:`uuid.getnode` and append the return value (or exception)
+        to ``result``.
+
+        :param result: list to append to
+        :type result: list
+        """
+        try:
+            result.append(uuid.getnode())
+        except Exception as ex:
+            result.append(ex)
+
+    def _valid_uuid_getnode(self, id_str):
+        """
+        Check that the hardware address in a persisted
+        :py:meth:`~.uuid_getnode` ID still belongs to one of this system's
+        network interfaces, by reading ``/sys/class/net/*/address`` (far
+        cheaper than :py:func:`uuid.getnode`).
+
+        :param id_str: the persisted ID
+        :type id_str: str
+        :return: whether the address was found, or None if interfaces can't
+          be listed on this system
+        :rtype: bool
+        """
+        node = int(id_str.rpartition('_')[2], 16)
+        addrs = self._net_addresses()
+        if addrs is None:
+            return None
+        return any(addr == node for _, addr in addrs)
+
+    def _read_fallback(self):
+        """
+        Return the random ID persisted in :py:attr:`~.fallback_path`, or None
+        if there is no valid one.
+
+        :rtype: str
+        """
+        if not self.fallback_path:
+            return None
+        state = read_json(self.fallback_path)
+        if (
+            isinstance(state, dict) and
+            state.get('version') == STATE_VERSION and state.get('id')
+        ):
+            return state['id']
+        return None
 
     def random_fallback(self):
         """
@@ -187,9 +592,43 @@ class SystemID(object):
         :py:func:`uuid.uuid4`. Used as a fallback when the ID can't be
         determined using any other method.
 
+        The generated ID is durably written to :py:attr:`~.fallback_path`
+        and reused from there on later calls (and in later processes), so
+        that the host keeps the same identity. The file is only created if
+        it does not exist, so if several processes generate an ID at once,
+        they all use the one that was written first.
+
         :return: random UUID
         :rtype: str
         """
+        id_str = self._read_fallback()
+        if id_str is not None:
+            logger.warning('Could not determine system ID with any '
+                           'concrete method; reusing random UUID %s '
+                           'persisted in %s', id_str, self.fallback_path)
+            return id_str
+        id_str = uuid.uuid4().hex
         logger.warning('Could not determine system ID with any concrete method;'
                        ' using a random UUID.')
-        return uuid.uuid4().hex
+        if not self.fallback_path:
+            return id_str
+        data = {'version': STATE_VERSION, 'id': id_str, 'created': time.time()}
+        if write_json(self.fallback_path, data, durable=True, exclusive=True):
+            logger.warning('Persisted random system ID %s to %s', id_str,
+                           self.fallback_path)
+            return id_str
+        # another process may have created the file first
+        winner = self._read_fallback()
+        if winner is not None:
+            logger.warning('Using random system ID %s persisted concurrently '
+                           'in %s', winner, self.fallback_path)
+            return winner
+        # the file exists but is invalid, or can't be created
+        if write_json(self.fallback_path, data, durable=True):
+            logger.warning('Persisted random system ID %s to %s', id_str,
+                           self.fallback_path)
+        else:
+            logger.warning('Unable to persist random system ID to %s; it '
+                           'will change when this process restarts',
+                           self.fallback_path)
+        return id_str